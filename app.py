@@ -1,34 +1,33 @@
 import streamlit as st
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+import logging
+import os
 import re
+from functools import partial
+
+from sheets_client import fetch_spreadsheet, fetch_status, probe_spreadsheet_version, service_account_credentials
+from sheet_grid import load_grid
 
 # Import core timetable functions
 try:
-    import extract_timetable
-    extract_batch_colors = extract_timetable.extract_batch_colors
-    get_timetable = extract_timetable.get_timetable
-    
-    # Try to get get_custom_timetable function
-    if hasattr(extract_timetable, 'get_custom_timetable'):
-        get_custom_timetable = extract_timetable.get_custom_timetable
-    else:
-        # Fallback function if not available
-        def get_custom_timetable(spreadsheet, selected_courses):
-            return "⚠️ Custom timetable function not available. Please check the implementation."
-        st.warning("Custom timetable function not found. Using fallback function.")
-        
+    from timetable_index import (
+        get_index_timetable, get_index_custom_timetable, iter_index_timetable, iter_index_custom_timetable, course_id,
+        is_known_section
+    )
+    from timetable_jobs import JobQueueFull, submit_job, new_request, request_timed_out, abandon_request
+    from timetable_sources import normalize_sources, load_index, get_index_at
+    from timetable_diff import diff_batch, diff_custom, has_changes, format_changes
+    from timetable_calendar import batch_calendar, custom_calendar, calendar_bytes
+    from timetable_views import build_views
+    from timetable_free_time import BLOCK_MINUTES, MIN_FREE_MINUTES, common_free_time, format_free_time
 except ImportError as e:
     st.error(f"Failed to import timetable functions: {e}")
     st.stop()
 
-# Import course extraction functions
+# Import analytics for the admin view (optional: needs pandas)
 try:
-    # Use the fuller extractor which reliably extracts departments and batches
-    from course_extractor import extract_departments_and_batches, extract_all_courses, search_courses
-except ImportError as e:
-    st.error(f"Failed to import course extraction functions: {e}")
-    st.stop()
+    from timetable_analytics import utilisation_report
+except ImportError:
+    utilisation_report = None
 
 # Import user preferences functions
 try:
@@ -36,55 +35,90 @@ try:
         initialize_session_state, add_course_to_selection, remove_course_from_selection,
         clear_all_selections, get_selected_courses, update_search_filters, 
         get_search_filters, save_search_results, get_last_search_results,
-        is_course_selected, get_selection_summary
+        is_course_selected, get_selection_summary, get_last_visit_revision, mark_revision_seen
     )
 except ImportError as e:
     st.error(f"Failed to import user preferences functions: {e}")
     st.stop()
 
+logger = logging.getLogger(__name__)
+
 SHEET_URL = "https://docs.google.com/spreadsheets/d/1ZQJqdArlwCS965uw4sbJrB6j8rEPfZerMT7X8qkXSzY/edit?usp=drivesdk"
 
+# Optional data sources for load tests and local development:
+# TIMETABLE_SNAPSHOT - path to a saved spreadsheets.get response, used instead of the API
+# SHEETS_API_ENDPOINT - base URL of a Sheets API stand-in such as fake_sheets.py
+SNAPSHOT_PATH = os.environ.get("TIMETABLE_SNAPSHOT", "")
+SHEETS_API_ENDPOINT = os.environ.get("SHEETS_API_ENDPOINT", "")
+
+# Seconds between checks on a timetable being built in the background
+POLL_INTERVAL = 0.5
+
+
+def get_sheets_credentials():
+    """Service account credentials, or None for the local stand-in (which does not check them)"""
+    if SHEETS_API_ENDPOINT:
+        return None
+    # Built once per process; the access token is reused until it expires
+    return service_account_credentials(st.secrets["google_service_account"])
+
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
 def get_google_sheets_data(sheet_url):
-    """Fetch Google Sheets data with formatting using Sheets API v4"""
-    credentials_dict = st.secrets["google_service_account"]
-    creds = Credentials.from_service_account_info(
-        credentials_dict,
-        scopes=['https://www.googleapis.com/auth/spreadsheets.readonly']
-    )
+    """Fetch Google Sheets data with formatting using Sheets API v4 (cached per source by timetable_sources)"""
+    if SNAPSHOT_PATH:
+        return load_grid(SNAPSHOT_PATH)
 
-    service = build('sheets', 'v4', credentials=creds)
     spreadsheet_id = sheet_url.split('/d/')[1].split('/')[0]
 
-    # Get spreadsheet with cell formatting
-    spreadsheet = service.spreadsheets().get(
-        spreadsheetId=spreadsheet_id,
-        includeGridData=True
-    ).execute()
+    # Retries transient errors within the shared quota and falls back to the last good copy
+    return fetch_spreadsheet(spreadsheet_id, credentials=get_sheets_credentials(), endpoint=SHEETS_API_ENDPOINT)
+
+
+def get_sheet_version(sheet_url):
+    """Cheap marker that changes when a source is edited (None: unknown, fetch in full)"""
+    if SNAPSHOT_PATH:
+        return str(os.path.getmtime(SNAPSHOT_PATH))
 
-    return spreadsheet
+    spreadsheet_id = sheet_url.split('/d/')[1].split('/')[0]
+    return probe_spreadsheet_version(spreadsheet_id, credentials=get_sheets_credentials(),
+                                     endpoint=SHEETS_API_ENDPOINT)
 
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_cached_batch_colors(sheet_url):
-    """Get batch colors with caching to avoid repeated API calls"""
-    spreadsheet = get_google_sheets_data(sheet_url)
-    return extract_batch_colors(spreadsheet)
+def get_timetable_sources():
+    """Timetable spreadsheets to serve: 'timetable_sources' in secrets, or just SHEET_URL.
 
+    In secrets.toml each source is a table with a name and url:
+        [[timetable_sources]]
+        name = "Islamabad"
+        url = "https://docs.google.com/spreadsheets/d/..."
+    """
+    configured = []
+    # Only read secrets when a secrets file exists (offline and load-test runs have none)
+    if st.secrets.load_if_toml_exists():
+        configured = st.secrets.get("timetable_sources", [])
+    return normalize_sources(configured, SHEET_URL)
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes  
-def get_cached_all_courses(sheet_url):
-    """Get all courses with caching to avoid repeated extractions"""
-    spreadsheet = get_google_sheets_data(sheet_url)
-    return extract_all_courses(spreadsheet)
 
+def get_timetable_index():
+    """Session index merged over all sources.
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def get_cached_departments_and_years(sheet_url):
-    """Get departments and years lists with caching"""
-    all_courses = get_cached_all_courses(sheet_url)
-    
+    Sources are probed for edits (every 1 to 30 minutes depending on how recently they
+    changed) and only downloaded again when they were edited.
+    """
+    return load_index(get_timetable_sources(), get_google_sheets_data, ttl=300, probe=get_sheet_version)
+
+
+def is_showing_stale_data():
+    """True when a fetch failed and some timetable comes from the saved copy"""
+    for source in get_timetable_sources():
+        spreadsheet_id = source['url'].split('/d/')[1].split('/')[0]
+        if fetch_status.get(spreadsheet_id, {}).get('stale', False):
+            return True
+    return False
+
+
+def get_departments_and_years(all_courses):
+    """Get departments and years lists for the course filters"""
     # Extract departments
     department_list = sorted(set(c.get('department', '') for c in all_courses if c.get('department')))
     
@@ -99,6 +133,184 @@ def get_cached_departments_and_years(sheet_url):
     return department_list, sorted(year_list)
 
 
+def build_batch_schedule(batch, section):
+    """Produce the Markdown timetable shown by the Batch Timetable tab"""
+    return get_index_timetable(get_timetable_index(), batch, section)
+
+
+def build_custom_schedule(selected_courses):
+    """Produce the Markdown timetable shown by the Custom Course Selection tab"""
+    return get_index_custom_timetable(get_timetable_index(), selected_courses)
+
+
+def start_timetable_request(name, key, make_days, **details):
+    """Build a timetable on the shared worker pool; identical requests in flight share one job"""
+    try:
+        job = submit_job(key, make_days)
+    except JobQueueFull:
+        st.error("⚠️ Lots of timetables are being built right now. Please try again in a moment.")
+        return
+    st.session_state[name] = new_request(job, **details)
+
+
+def is_request_finished(request):
+    return request['job']['done'] or request.get('timed_out', False)
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def poll_timetable_request(name):
+    """Show a timetable's days as they are built; the page reruns once it is ready"""
+    request = st.session_state.get(name)
+    if request is None:
+        return
+    if request_timed_out(request):
+        abandon_request(request)
+        request['timed_out'] = True
+    if is_request_finished(request):
+        st.rerun()
+
+    st.info("⏳ Generating timetable...")
+    # Monday shows while later days are still being built
+    for day_table in list(request['job']['chunks']):
+        if not day_table.startswith("⚠️"):
+            st.markdown(day_table)
+
+
+def finished_timetable_days(name):
+    """Day tables of a finished request, or None once the reason there are none has been shown"""
+    request = st.session_state[name]
+    job = request['job']
+    # A request that timed out while others still wait for its job is given up on its own
+    if job['cancelled'] or (request.get('timed_out') and not job['done']):
+        del st.session_state[name]
+        st.error("⏱️ Building the timetable took too long. Please try again.")
+        return None
+    if job['error']:
+        del st.session_state[name]
+        st.error(f"❌ Could not build the timetable: {job['error']}")
+        return None
+    if job['chunks'][0].startswith("⚠️"):
+        st.error(job['chunks'][0])
+        return None
+    return job['chunks']
+
+
+def show_batch_result(request, index, last_visit_index):
+    """Finished batch timetable with recent changes and a calendar download"""
+    days = finished_timetable_days("batch_request")
+    if days is None:
+        return
+    batch, section = request['batch'], request['section']
+    st.markdown(f"## Timetable for **{batch}, Section {section}**")
+
+    # Only the rows that changed since the last visit are compared
+    if last_visit_index is not None:
+        changes = diff_batch(last_visit_index, index, batch, section)
+        if has_changes(changes):
+            with st.expander("🔔 Changes since your last visit", expanded=True):
+                st.markdown(format_changes(changes, batch, section))
+
+    for day_table in days:
+        st.markdown(day_table)
+
+    calendar = get_batch_calendar(index['revision'], batch, section, index)
+    if calendar:
+        st.download_button(
+            "📆 Add to calendar (.ics)", data=calendar, mime="text/calendar",
+            file_name=f"timetable-{re.sub(r'[^A-Za-z0-9]+', '-', f'{batch} {section}').strip('-')}.ics",
+            key="batch_calendar_download"
+        )
+
+
+def show_custom_result(request, index, last_visit_index):
+    """Finished custom timetable with recent changes and a calendar download"""
+    days = finished_timetable_days("custom_request")
+    if days is None:
+        return
+    selected_courses = request['selected_courses']
+    st.markdown("## Custom Timetable")
+
+    if last_visit_index is not None:
+        course_changes = diff_custom(last_visit_index, index, selected_courses)
+        if course_changes:
+            with st.expander("🔔 Changes since your last visit", expanded=True):
+                for course, changes in course_changes:
+                    st.markdown(f"**{format_course_display(course)}**")
+                    st.markdown(format_changes(changes))
+
+    for day_table in days:
+        st.markdown(day_table)
+
+    st.download_button(
+        "📆 Add to calendar (.ics)", mime="text/calendar", file_name="my-timetable.ics",
+        data=get_custom_calendar(index['revision'], selected_courses, index),
+        key="custom_calendar_download"
+    )
+
+
+def get_last_visit_index():
+    """Index the user saw on their previous visit, if it is still kept and differs from today's"""
+    revision = get_last_visit_revision()
+    if not revision:
+        return None
+    try:
+        index = get_index_at(revision)
+    except Exception as e:
+        # The change list is optional; a history problem must not break the page
+        logger.warning("Could not load revision %s from history: %s", revision, e)
+        return None
+    if index is None or index['revision'] == get_timetable_index()['revision']:
+        return None
+    return index
+
+
+def is_admin_view_requested():
+    """Admin views are opened with ?admin=1 in the URL, and only exist once access is configured"""
+    return "admin" in st.query_params and utilisation_report is not None and is_admin_view_configured()
+
+
+def get_admin_secret(name, default):
+    """Admin setting from secrets (default when there is no secrets file)"""
+    if not st.secrets.load_if_toml_exists():
+        return default
+    return st.secrets.get(name, default)
+
+
+def get_admin_password():
+    """Password for admin views from secrets ('' when none is configured)"""
+    return get_admin_secret("admin_password", "")
+
+
+def is_admin_view_configured():
+    """Admin views need admin_password, or admin_open = true to run them without one (e.g. local runs)"""
+    return bool(get_admin_password()) or get_admin_secret("admin_open", False) is True
+
+
+@st.cache_data(max_entries=4)
+def get_utilisation_report(revision, _index):
+    """Room utilisation report, computed once per timetable revision"""
+    return utilisation_report(_index)
+
+
+@st.cache_resource(max_entries=2)
+def get_timetable_views(revision, _index):
+    """Course and room views, built and rendered once per timetable revision (shared, not copied per run)"""
+    return build_views(_index)
+
+
+@st.cache_data(max_entries=512)
+def get_batch_calendar(revision, batch, section, _index):
+    """.ics file for a batch + section, built once per timetable revision"""
+    lines = batch_calendar(_index, batch, section)
+    return calendar_bytes(lines) if lines is not None else None
+
+
+@st.cache_data(max_entries=512)
+def get_custom_calendar(revision, selected_courses, _index):
+    """.ics file for a custom course selection, built once per timetable revision"""
+    return calendar_bytes(custom_calendar(_index, selected_courses))
+
+
 def format_course_display(course: dict) -> str:
     """Return a compact display string for a course: 'name dept section year-or-batch'
     Example: 'Data St CS A 2024' (falls back to full batch string if year not found)
@@ -107,10 +319,14 @@ def format_course_display(course: dict) -> str:
     dept = course.get('department', '').strip()
     section = course.get('section', '').strip()
     batch = str(course.get('batch', '')).strip()
+    # Campus/school name, only set when several spreadsheets are served
+    source = course.get('source', '').strip()
     # Prefer year (e.g., 2024) when available inside the batch string
     m = re.search(r"(20\d{2})", batch)
     year = m.group(1) if m else batch
     parts = [p for p in [name, dept, section, year] if p]
+    if source:
+        parts.append(f"[{source}]")
     return " ".join(parts)
 
 
@@ -126,23 +342,34 @@ def main():
     # Fetch cached data - this will only make API calls once every 5 minutes
     st.info("Welcome Everyone!")
     try:
-        # Use cached functions to reduce API calls
-        batch_colors = get_cached_batch_colors(SHEET_URL)
-        all_courses = get_cached_all_courses(SHEET_URL)
-        department_list, year_list = get_cached_departments_and_years(SHEET_URL)
+        # Use the cached session index to reduce API calls
+        index = get_timetable_index()
+        all_courses = index['courses']
+        department_list, year_list = get_departments_and_years(all_courses)
     except Exception as e:
         st.error(f"❌ Connection failed: {str(e)}")
         return
 
+    if is_showing_stale_data():
+        st.warning("⚠️ Google Sheets is not responding right now. Showing the last saved timetable.")
+
+    # Remember this revision for the next visit; changes are listed against the previous one
+    mark_revision_seen(index['revision'])
+    last_visit_index = get_last_visit_index()
+
+    # With several spreadsheets, batches are namespaced by campus/school
+    sources = [source for source in index['sources'] if source]
+
     # Extract batch-color mappings
-    if not batch_colors:
-        st.error("⚠️ No batches found. Please check the sheet format.")
-        return
+    if not index['batches']:
         st.error("⚠️ No batches found. Please check the sheet format.")
         return
 
-    # Create tabs
-    tab1, tab2 = st.tabs(["📚 Batch Timetable", "🔍 Custom Course Selection"])
+    # Create tabs (the admin tab only with ?admin=1 and admin access configured in secrets)
+    tab_names = ["📚 Batch Timetable", "🔍 Custom Course Selection", "🏫 Courses & Rooms", "🤝 Free Time"]
+    if is_admin_view_requested():
+        tab_names.append("📊 Room Utilisation")
+    tab1, tab2, tab3, tab4, *admin_tabs = st.tabs(tab_names)
 
     # Tab 1: Original Batch Timetable (existing functionality)
     with tab1:
@@ -150,7 +377,13 @@ def main():
         st.write("Select your batch and section to view your timetable.")
         
         # Prepare batch data for dropdown selection
-        batch_list = list(batch_colors.values())
+        batch_list = list(index['batches'])
+
+        # Pick the campus first so departments and batches stay unambiguous
+        if sources:
+            selected_source_tab1 = st.selectbox("🏫 Campus", [""] + sources, key="source_tab1")
+            if selected_source_tab1:
+                batch_list = [b for b in batch_list if index['batch_sources'][b] == selected_source_tab1]
         
         # Extract departments from batch names (e.g., "BS CS (2024)" -> "CS")
         dept_pattern = r"BS\s+([A-Z]+)"
@@ -201,24 +434,35 @@ def main():
             if selected_department_tab1 or selected_year_tab1:
                 st.warning("No batches found for the selected filters.")
 
-        # User input for section
-        section = st.text_input("🔠 Enter your section (e.g., 'A')").strip().upper()
-
-        # Submit button - only fetch timetable when clicked
+        # Sections come from the catalogue compiled with the index, with their weekly sessions
+        section_counts = index['sections'].get(batch, {}) if batch else {}
+        section = st.selectbox(
+            "🔠 Section", [""] + list(section_counts), key="section_tab1",
+            format_func=lambda s: s and (f"{s} ({section_counts[s]} sessions)" if section_counts.get(s)
+                                         else f"{s} (no classes)")
+        )
+        if batch and not section_counts:
+            st.warning("⚠️ No sections found for this batch in the sheet.")
+
+        # Submit button - the timetable is built on the shared worker pool
         if st.button("Show Timetable", key="batch_timetable_btn"):
             if not batch or not section:
-                st.warning("⚠️ Please enter both batch and section.")
+                st.warning("⚠️ Please select both batch and section.")
+            elif not is_known_section(index, batch, section):
+                # e.g. a section kept from another batch; no timetable work for it
+                st.warning(f"⚠️ {batch} has no section {section}.")
             else:
-                # Only fetch spreadsheet data when actually needed
-                with st.spinner("Generating timetable..."):
-                    spreadsheet = get_google_sheets_data(SHEET_URL)
-                    schedule = get_timetable(spreadsheet, batch, section)
-
-                    if schedule.startswith("⚠️"):
-                        st.error(schedule)
-                    else:
-                        st.markdown(f"## Timetable for **{batch}, Section {section}**")
-                        st.markdown(schedule)
+                start_timetable_request(
+                    "batch_request", ("batch", index['revision'], batch, section),
+                    partial(iter_index_timetable, index, batch, section), batch=batch, section=section
+                )
+
+        batch_request = st.session_state.get("batch_request")
+        if batch_request is not None:
+            if is_request_finished(batch_request):
+                show_batch_result(batch_request, index, last_visit_index)
+            else:
+                poll_timetable_request("batch_request")
 
     # Tab 2: Custom Course Selection (new functionality)
     with tab2:
@@ -226,8 +470,11 @@ def main():
         st.write("Search and select individual courses to create your custom timetable.")
 
         # Use cached data instead of recomputing
-        unique_batches = sorted(set(batch_colors.values())) if batch_colors else []
-        batch_list = unique_batches
+        batch_list = sorted(index['batches'])
+
+        selected_source = ""
+        if sources:
+            selected_source = st.selectbox("🏫 Campus", [""] + sources, key="source_tab2")
 
         # Filter section - moved above search for better mobile layout
         col1, col2 = st.columns(2)
@@ -264,6 +511,10 @@ def main():
         # Get filtered courses based on current department and batch selections
         # This allows the course dropdown to update dynamically
         current_courses = all_courses  # Use cached data
+
+        # Apply campus filter if selected
+        if selected_source:
+            current_courses = [c for c in current_courses if c.get('source') == selected_source]
         
         # Apply department filter if selected
         if selected_department:
@@ -343,19 +594,132 @@ def main():
             center_col1, center_col2, center_col3 = st.columns([1, 2, 1])
             with center_col2:
                 if st.button("📅 Show Custom Timetable", key="custom_timetable_btn"):
-                    # Only fetch fresh spreadsheet data when generating custom timetable
-                    with st.spinner("Generating custom timetable..."):
-                        spreadsheet = get_google_sheets_data(SHEET_URL)
-                        schedule = get_custom_timetable(spreadsheet, selected_courses)
-                        
-                        if schedule.startswith("⚠️"):
-                            st.error(schedule)
-                        else:
-                            st.markdown("## Custom Timetable")
-                            st.markdown(schedule)
+                    start_timetable_request(
+                        "custom_request", ("custom", index['revision'], tuple(course_id(c) for c in selected_courses)),
+                        partial(iter_index_custom_timetable, index, list(selected_courses)),
+                        selected_courses=list(selected_courses)
+                    )
+
+                custom_request = st.session_state.get("custom_request")
+                if custom_request is not None:
+                    if is_request_finished(custom_request):
+                        show_custom_result(custom_request, index, last_visit_index)
+                    else:
+                        poll_timetable_request("custom_request")
         else:
             st.info("No courses selected. Search and add courses to create your custom timetable.")
 
+    # Tab 3: Where a course meets across all sections, and what happens in a room
+    with tab3:
+        show_course_room_views(index)
+
+    # Tab 4: When several sections (and the user's own courses) are all free
+    with tab4:
+        show_free_time_finder(index)
+
+    # Room utilisation for the timetabling office
+    if admin_tabs:
+        with admin_tabs[0]:
+            show_utilisation_view(index)
+
+
+def show_course_room_views(index):
+    """Weekly timetable of a course (all sections) or of a room, from the per-revision views"""
+    st.header("🏫 Courses & Rooms")
+    st.write("See where a course meets across all its sections, or everything booked in a room.")
+
+    views = get_timetable_views(index['revision'], index)
+    view_by = st.radio("View by", ["📘 Course", "🚪 Room"], horizontal=True, key="view_by")
+    if view_by == "📘 Course":
+        options = views['courses']
+        selected = st.selectbox("📘 Course", [""] + list(options), key="view_course")
+    else:
+        options = views['rooms']
+        selected = st.selectbox("🚪 Room", [""] + list(options), key="view_room")
+
+    if selected:
+        view = options[selected]
+        st.markdown(f"## {selected}")
+        st.caption(f"{view['sessions']} session(s) a week")
+        st.markdown(view['markdown'])
+
+
+def show_free_time_finder(index):
+    """Common free windows per weekday for any mix of sections and the user's selected courses"""
+    st.header("🤝 Common Free Time")
+    st.write("Find when several sections are all free, e.g. for a society meeting or a makeup class.")
+
+    options = [(batch, section) for batch, sections in index['sections'].items() for section in sections]
+    chosen = st.multiselect("👥 Sections", options, format_func=lambda pair: f"{pair[0]} - Section {pair[1]}",
+                            key="free_time_sections")
+    selected_courses = get_selected_courses()
+    include_mine = st.checkbox(f"Include my selected courses ({len(selected_courses)})", key="free_time_mine",
+                               disabled=not selected_courses)
+    min_minutes = st.number_input("⏱️ Shortest window (minutes)", min_value=BLOCK_MINUTES, max_value=600,
+                                  value=MIN_FREE_MINUTES, step=BLOCK_MINUTES, key="free_time_minutes")
+
+    selections = [list(selected_courses)] if include_mine and selected_courses else []
+    if not chosen and not selections:
+        st.info("Pick some sections (or include your selected courses) to see when they are all free.")
+        return
+    # Bitmaps are built once per revision, and answers are cached per set of inputs
+    st.markdown(format_free_time(common_free_time(index, chosen, selections, int(min_minutes))))
+
+
+def show_utilisation_view(index):
+    """Admin view: room occupancy, peak hours, overloaded slots and underused rooms"""
+    st.header("📊 Room Utilisation")
+
+    password = get_admin_password()
+    if password and st.text_input("🔑 Admin password", type="password", key="admin_password") != password:
+        st.info("Enter the admin password to see room utilisation.")
+        return
+
+    report = get_utilisation_report(index['revision'], index)
+    utilisation = report['room_utilisation']
+    if utilisation.empty:
+        st.warning("⚠️ No sessions with a room and time found.")
+        return
+
+    st.subheader("🚨 Timetable problems")
+    conflicts = index.get('conflicts', [])
+    if not conflicts:
+        st.success("✅ No double-booked rooms or section clashes found.")
+    else:
+        st.error(f"⚠️ {len(conflicts)} problem(s) found in the sheet.")
+        for conflict in conflicts:
+            cells = ", ".join(f"`{session['cell']}` {session['text']}" for session in conflict['sessions'])
+            st.markdown(f"- **{conflict['message']}**: {cells}" if cells else f"- **{conflict['message']}**")
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Sessions", report['sessions'])
+    col2.metric("Rooms", len(utilisation))
+    col3.metric("Average utilisation", f"{utilisation['utilisation'].mean():.0%}")
+
+    st.subheader("🗓️ Occupancy by room and slot")
+    days = list(dict.fromkeys(report['occupancy'].columns.get_level_values('day')))
+    selected_day = st.selectbox("Day", days, key="utilisation_day")
+    st.caption("Sessions booked per room and slot (2 or more means the room is double-booked).")
+    st.dataframe(report['occupancy'][selected_day], use_container_width=True)
+
+    st.subheader("🔥 Peak hours")
+    st.dataframe(report['peak_hours'], use_container_width=True, hide_index=True)
+
+    st.subheader("⚠️ Overloaded slots")
+    if report['overloaded_slots'].empty:
+        st.success("✅ No slot uses almost every room.")
+    else:
+        st.dataframe(report['overloaded_slots'], use_container_width=True, hide_index=True)
+
+    st.subheader("💤 Underused rooms")
+    if report['underused_rooms'].empty:
+        st.success("✅ Every room is used for at least a quarter of its slots.")
+    else:
+        st.dataframe(report['underused_rooms'], use_container_width=True, hide_index=True)
+
+    st.subheader("🏢 All rooms")
+    st.dataframe(utilisation, use_container_width=True, hide_index=True)
+
 
 if __name__ == "__main__":
     main()
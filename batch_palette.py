@@ -0,0 +1,81 @@
+"""Tolerant matching of cell colours to batch colours.
+
+A class belongs to the batch whose header label has the same background colour. When a
+cell is repainted in an almost identical shade, exact comparison drops the class. Instead
+a palette is built once per snapshot: every distinct cell colour in the grid is mapped to
+the nearest batch colour within COLOR_TOLERANCE (distance in 0-1 RGB), so matching a cell
+is one dict lookup. Colours close to two batches are left unmatched rather than guessed,
+and they are reported together with batch labels that share a header colour.
+
+Settings (environment):
+TIMETABLE_COLOR_TOLERANCE - largest RGB distance still matched to a batch (default 0.03, 0 = exact only)
+"""
+import math
+import os
+
+from sheet_grid import DEFAULT_COLOR
+
+COLOR_TOLERANCE = float(os.environ.get("TIMETABLE_COLOR_TOLERANCE", "0.03"))
+
+
+def color_rgb(key):
+    """(red, green, blue) floats of a colour key ('0.800.901.00' -> (0.8, 0.9, 1.0))"""
+    return float(key[0:4]), float(key[4:8]), float(key[8:12])
+
+
+def header_color_labels(grid):
+    """{colour: [distinct batch labels]} of the header rows, as read by extract_batch_colors"""
+    labels = {}
+    for grid_data in grid['sheets'].values():
+        for row in grid_data[:4]:
+            for text, color in row:
+                if 'BS' in text:
+                    labels.setdefault(color or DEFAULT_COLOR, {})[text.strip()] = None
+    return {color: list(names) for color, names in labels.items()}
+
+
+def build_palette(grid, batch_colors, tolerance=None):
+    """Colour lookup table of a snapshot.
+
+    Returns {'lookup': {cell colour: batch colour}, 'near': the inexact part of lookup,
+    'ambiguous': {cell colour: [batch colours]}, 'collisions': {batch colour: [labels]}}.
+    """
+    tolerance = COLOR_TOLERANCE if tolerance is None else tolerance
+    batch_rgb = {color: color_rgb(color) for color in batch_colors}
+    lookup = {color: color for color in batch_colors}
+    near = {}
+    ambiguous = {}
+
+    cell_colors = {color for grid_data in grid['sheets'].values() for row in grid_data for _, color in row}
+    if tolerance > 0:
+        for color in cell_colors:
+            if color is None or color in lookup:
+                continue
+            rgb = color_rgb(color)
+            matches = sorted((math.dist(rgb, target), batch) for batch, target in batch_rgb.items()
+                             if math.dist(rgb, target) <= tolerance)
+            if len(matches) == 1:
+                lookup[color] = near[color] = matches[0][1]
+            elif matches:
+                ambiguous[color] = [batch for _, batch in matches]
+
+    collisions = {color: labels for color, labels in header_color_labels(grid).items() if len(labels) > 1}
+    return {'lookup': lookup, 'near': near, 'ambiguous': ambiguous, 'collisions': collisions}
+
+
+def palette_problems(palette, batch_colors, source=""):
+    """Integrity problems of a palette, in the shape of timetable_integrity conflicts (without cells)"""
+    problems = []
+    for color, labels in palette['collisions'].items():
+        problems.append({
+            'kind': "colour", 'source': source, 'color': color,
+            'message': f"Batches {', '.join(labels)} share one header colour; "
+                       f"all of their classes are listed under {batch_colors[color]}",
+        })
+    for color, batches in palette['ambiguous'].items():
+        names = ", ".join(batch_colors[batch] for batch in batches)
+        problems.append({
+            'kind': "colour", 'source': source, 'color': color,
+            'message': f"Cells painted {color} are close to the colours of {names} and belong to no batch",
+        })
+    return problems
@@ -1,29 +1,21 @@
 from typing import List, Dict, Set, Tuple
 import re
 
+from batch_palette import build_palette
+from sheet_grid import DEFAULT_COLOR, as_grid
+
 
 def extract_departments_and_batches(spreadsheet) -> Tuple[Set[str], Set[str]]:
     """Extract unique departments and batches from the first 4 rows of all sheets"""
     departments = set()
     batches = set()
-    timetable_sheets = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
     
-    for sheet in spreadsheet.get('sheets', []):
-        sheet_name = sheet['properties']['title']
-        if sheet_name not in timetable_sheets:
-            continue
-            
-        grid_data = sheet.get('data', [{}])[0].get('rowData', [])
-        
+    for sheet_name, grid_data in as_grid(spreadsheet)['sheets'].items():
         # Check first 4 rows (0-indexed)
-        for row_idx in range(4):
-            if row_idx >= len(grid_data):
-                continue
-                
-            row_data = grid_data[row_idx].get('values', [])
-            for cell in row_data:
-                if 'formattedValue' in cell:
-                    value = cell['formattedValue'].strip()
+        for row in grid_data[:4]:
+            for text, _ in row:
+                if text:
+                    value = text.strip()
                     
                     # Extract departments (look for patterns like "CS", "EE", etc.)
                     if re.match(r'^[A-Z]{2,4}$', value) and len(value) <= 4:
@@ -38,52 +30,32 @@ def extract_departments_and_batches(spreadsheet) -> Tuple[Set[str], Set[str]]:
 def extract_all_courses(spreadsheet) -> List[Dict]:
     """Extract all courses from the spreadsheet with their metadata"""
     courses = []
-    timetable_sheets = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+    grid = as_grid(spreadsheet)
     
     # First, get batch colors mapping
     batch_colors = {}
-    for sheet in spreadsheet.get('sheets', []):
-        sheet_name = sheet['properties']['title']
-        if sheet_name not in timetable_sheets:
-            continue
-            
-        grid_data = sheet.get('data', [{}])[0].get('rowData', [])
-        
+    for sheet_name, grid_data in grid['sheets'].items():
         # Extract batch colors from first 4 rows
-        for row_idx in range(4):
-            if row_idx >= len(grid_data):
-                continue
-                
-            row_data = grid_data[row_idx].get('values', [])
-            for cell in row_data:
-                if 'formattedValue' in cell and 'BS' in cell['formattedValue']:
-                    color = cell.get('effectiveFormat', {}).get('backgroundColor', {})
-                    color_hex = f"{color.get('red', 0):.2f}{color.get('green', 0):.2f}{color.get('blue', 0):.2f}"
-                    batch_colors[color_hex] = cell['formattedValue'].strip()
+        for row in grid_data[:4]:
+            for text, color in row:
+                if 'BS' in text:
+                    batch_colors[color or DEFAULT_COLOR] = text.strip()
+    # Near shades of a batch colour count as the batch colour
+    palette = build_palette(grid, batch_colors)['lookup']
     
     # Now extract courses from all sheets
-    for sheet in spreadsheet.get('sheets', []):
-        sheet_name = sheet['properties']['title']
-        if sheet_name not in timetable_sheets:
-            continue
-            
-        grid_data = sheet.get('data', [{}])[0].get('rowData', [])
-        
+    for sheet_name, grid_data in grid['sheets'].items():
         # Process timetable rows (skip header rows). Start from row index 5 (0-indexed)
         for row_idx, row in enumerate(grid_data[5:], start=6):
-            row_values = row.get('values', []) if isinstance(row, dict) else []
-            
-            for col_idx, cell in enumerate(row_values):
-                if not isinstance(cell, dict) or 'effectiveFormat' not in cell:
+            for col_idx, (text, cell_color) in enumerate(row):
+                # Cells without a format have no colour
+                if cell_color is None:
                     continue
+                cell_color = palette.get(cell_color, cell_color)
                 
-                # Get cell color
-                color = cell.get('effectiveFormat', {}).get('backgroundColor', {})
-                cell_color = f"{color.get('red', 0):.2f}{color.get('green', 0):.2f}{color.get('blue', 0):.2f}"
-                
-                # Check if this cell has a course (has color and formatted value)
-                if cell_color in batch_colors and 'formattedValue' in cell:
-                    course_entry = cell.get('formattedValue', '').strip()
+                # Check if this cell has a course (has color and text)
+                if cell_color in batch_colors and text:
+                    course_entry = text.strip()
                     
                     if course_entry:
                         # Extract course information
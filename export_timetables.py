@@ -0,0 +1,221 @@
+"""Write every batch/section timetable as static Markdown, JSON and CSV files.
+
+Used to publish timetables on the department site without sending everyone to the
+live app. The spreadsheet comes from a saved snapshot or straight from the Sheets API,
+is compiled once, and batches are rendered in parallel worker processes:
+
+    python export_timetables.py --snapshot saved.json --out site/timetables
+    python export_timetables.py --spreadsheet-id <id> --credentials service-account.json --out site/timetables
+
+With --selections, custom timetables are also written for every student in a JSON file of
+{"student id": ["course id", ...]} (course ids as served by timetable_api.py /courses),
+all computed in one pass over the index.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sheet_grid import load_grid
+from timetable_index import (
+    batch_sections_entries, batch_sections, compile_index, course_id, custom_timetables_entries, timetable_rows
+)
+from extract_timetable import format_custom_timetable, format_timetable
+
+FORMATS = ("md", "json", "csv")
+CSV_COLUMNS = ['day', 'time', 'room', 'type', 'course']
+CUSTOM_CSV_COLUMNS = CSV_COLUMNS + ['section', 'batch']
+
+# Set in each worker process by init_worker
+_worker_index = None
+
+
+def slugify(name):
+    """File-system friendly name: 'BS CS (2024)' -> 'bs-cs-2024'"""
+    return re.sub(r"[^a-z0-9]+", "-", str(name).lower()).strip("-") or "timetable"
+
+
+def load_spreadsheet(snapshot=None, spreadsheet_id=None, credentials=None):
+    """Compact spreadsheet grid from a saved snapshot or from the Sheets API"""
+    if snapshot:
+        return load_grid(snapshot)
+
+    from sheets_client import fetch_spreadsheet, service_account_credentials
+
+    creds = service_account_credentials(path=credentials) if credentials else None
+    return fetch_spreadsheet(spreadsheet_id, credentials=creds)
+
+
+def add_source_arguments(parser):
+    """--snapshot / --spreadsheet-id / --credentials, shared by the bulk exporters"""
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--snapshot", help="saved spreadsheets.get response (.json or .json.gz)")
+    source.add_argument("--spreadsheet-id", help="fetch this spreadsheet from the Sheets API")
+    parser.add_argument("--credentials", help="service account JSON file for --spreadsheet-id")
+
+
+def write_section_files(directory, batch, section, timetable, formats, revision):
+    """Write one section's timetable in the requested formats; returns the file names"""
+    stem = slugify(section)
+    files = []
+    if "md" in formats:
+        with open(os.path.join(directory, f"{stem}.md"), 'w', encoding='utf-8') as f:
+            f.write(f"# Timetable for {batch}, Section {section}\n\n")
+            f.write(format_timetable(timetable))
+            f.write("\n")
+        files.append(f"{stem}.md")
+
+    rows = timetable_rows(timetable) if ("json" in formats or "csv" in formats) else []
+    if "json" in formats:
+        with open(os.path.join(directory, f"{stem}.json"), 'w', encoding='utf-8') as f:
+            json.dump({'batch': batch, 'section': section, 'revision': revision, 'sessions': rows},
+                      f, ensure_ascii=False, indent=1)
+        files.append(f"{stem}.json")
+    if "csv" in formats:
+        with open(os.path.join(directory, f"{stem}.csv"), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        files.append(f"{stem}.csv")
+    return files
+
+
+def init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def export_batch(batch, sections, out_dir, formats):
+    """Render and write every section of one batch (runs in a worker process)"""
+    index = _worker_index
+    directory = os.path.join(out_dir, slugify(batch))
+    os.makedirs(directory, exist_ok=True)
+
+    written = []
+    # One pass over the sessions for every section of the batch
+    for section, timetable in (batch_sections_entries(index, batch, sections) or {}).items():
+        if not timetable:
+            continue
+        files = write_section_files(directory, batch, section, timetable, formats, index['revision'])
+        written.append({'batch': batch, 'section': section,
+                        'files': [f"{slugify(batch)}/{name}" for name in files]})
+    return written
+
+
+def write_listing(out_dir, written, revision):
+    """index.json and index.md listing every exported timetable"""
+    with open(os.path.join(out_dir, "index.json"), 'w', encoding='utf-8') as f:
+        json.dump({'revision': revision, 'generated_at': int(time.time()), 'timetables': written},
+                  f, ensure_ascii=False, indent=1)
+
+    with open(os.path.join(out_dir, "index.md"), 'w', encoding='utf-8') as f:
+        f.write("# Timetables\n")
+        current_batch = None
+        for item in written:
+            if item['batch'] != current_batch:
+                current_batch = item['batch']
+                f.write(f"\n## {current_batch}\n\n")
+            links = " · ".join(f"[{name.rsplit('.', 1)[1]}]({name})" for name in item['files'])
+            f.write(f"- Section {item['section']}: {links}\n")
+
+
+def export_all(index, out_dir, formats=FORMATS, jobs=None, progress=True):
+    """Export every batch/section timetable of an index; returns the written entries"""
+    os.makedirs(out_dir, exist_ok=True)
+    sections = batch_sections(index)
+    batches = [batch for batch in index['batches'] if sections.get(batch)]
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(index,)) as pool:
+        futures = {pool.submit(export_batch, batch, sections[batch], out_dir, formats): batch for batch in batches}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if progress:
+                print(f"\r[{done:>{len(str(len(batches)))}}/{len(batches)}] {futures[future]:<40}",
+                      end="", file=sys.stderr, flush=True)
+    if progress and batches:
+        print(file=sys.stderr)
+
+    # Listing in the sheet's batch order, whatever order the workers finished in
+    written = [item for batch in batches for item in results[batch]]
+    write_listing(out_dir, written, index['revision'])
+    return written
+
+
+def load_selections(path, index):
+    """{student: [catalogue courses]} from a JSON file of course ids; unknown ids are skipped with a warning"""
+    with open(path, 'r', encoding='utf-8') as f:
+        enrolments = json.load(f)
+    courses = {course_id(course): course for course in index['courses']}
+
+    selections = {}
+    unknown = set()
+    for student, ids in enrolments.items():
+        selections[student] = [courses[course] for course in ids if course in courses]
+        unknown.update(course for course in ids if course not in courses)
+    if unknown:
+        print(f"⚠️ {len(unknown)} course id(s) not in this timetable were skipped", file=sys.stderr)
+    return selections
+
+
+def export_selections(index, selections, out_dir, formats=FORMATS):
+    """Write a custom timetable per student ({student: selected courses}) under out_dir/students"""
+    directory = os.path.join(out_dir, "students")
+    os.makedirs(directory, exist_ok=True)
+
+    # One pass over the index for all distinct courses, then fanned out per student
+    timetables = custom_timetables_entries(index, selections)
+    for student, timetable in timetables.items():
+        stem = os.path.join(directory, slugify(student))
+        if "md" in formats:
+            with open(f"{stem}.md", 'w', encoding='utf-8') as f:
+                f.write(f"# Custom timetable for {student}\n\n")
+                f.write(format_custom_timetable(timetable))
+                f.write("\n")
+        rows = timetable_rows(timetable)
+        if "json" in formats:
+            with open(f"{stem}.json", 'w', encoding='utf-8') as f:
+                json.dump({'student': student, 'revision': index['revision'],
+                           'courses': [course_id(course) for course in selections[student]], 'sessions': rows},
+                          f, ensure_ascii=False, indent=1)
+        if "csv" in formats:
+            with open(f"{stem}.csv", 'w', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=CUSTOM_CSV_COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+    return len(timetables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export every batch/section timetable as Markdown, JSON and CSV")
+    add_source_arguments(parser)
+    parser.add_argument("--out", default="timetables", help="output directory")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma separated: md,json,csv")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--quiet", action="store_true", help="no progress output")
+    parser.add_argument("--selections", help="JSON file of {student: [course ids]} to export custom timetables for")
+    args = parser.parse_args()
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+
+    start = time.perf_counter()
+    index = compile_index(load_spreadsheet(args.snapshot, args.spreadsheet_id, args.credentials))
+    written = export_all(index, args.out, formats, args.jobs, progress=not args.quiet)
+    print(f"✅ Wrote {len(written)} timetables to {args.out} in {time.perf_counter() - start:.1f}s")
+
+    if args.selections:
+        start = time.perf_counter()
+        count = export_selections(index, load_selections(args.selections, index), args.out, formats)
+        print(f"✅ Wrote {count} custom timetables to {os.path.join(args.out, 'students')} "
+              f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,29 @@
 from datetime import datetime
+import functools
 import re
 
+from batch_palette import build_palette
+from sheet_grid import DEFAULT_COLOR, as_grid, cell_text
+
+# Group courses such as "Gen AI (CS-A,G-1)" (normalized format)
+GROUP_PATTERN = re.compile(r'\([A-Z]{2,4}(?:-[A-Z])?,\s*G-\d+\)')
+# Department tokens a class entry can name explicitly: 'DS-B' or '(DS-B)'
+DEPT_TOKEN_PATTERN = re.compile(r"\b([A-Z]{2,4})-[A-Z]\b")
+DEPT_PAREN_PATTERN = re.compile(r"\(\s*([A-Z]{2,4})\s*-\s*[A-Z]\s*\)")
+DEPT_WORD_PATTERN = re.compile(r"\b[A-Z]{2,4}\b")
+YEAR_PATTERN = re.compile(r"(20\d{2})")
+
 def extract_batch_colors(spreadsheet):
     """Extract batch-color mappings from spreadsheet"""
     batch_colors = {}
-    timetable_sheets = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
-
-    for sheet in spreadsheet.get('sheets', []):
-        sheet_name = sheet['properties']['title']
-        if sheet_name not in timetable_sheets:
-            continue
-
-        grid_data = sheet.get('data', [{}])[0].get('rowData', [])
 
+    for sheet_name, grid_data in as_grid(spreadsheet)['sheets'].items():
         # Check first 4 rows (0-indexed)
-        for row_idx in range(4):
-            if row_idx >= len(grid_data):
-                continue
-
-            row_data = grid_data[row_idx].get('values', [])
-            for cell in row_data:
-                if 'formattedValue' in cell and 'BS' in cell['formattedValue']:
-                    # Get background color
-                    color = cell.get('effectiveFormat', {}).get('backgroundColor', {})
-                    # Convert color to hex string
-                    color_hex = f"{color.get('red', 0):.2f}{color.get('green', 0):.2f}{color.get('blue', 0):.2f}"
-                    batch_colors[color_hex] = cell['formattedValue'].strip()
+        for row in grid_data[:4]:
+            for text, color in row:
+                if 'BS' in text:
+                    # A batch label without a format reads as black
+                    batch_colors[color or DEFAULT_COLOR] = text.strip()
 
     return batch_colors
 
@@ -36,11 +34,10 @@ def analyze_sheet_structure(grid_data, sheet_name):
     
     # Analyze first 10 rows to understand the layout
     for row_idx in range(min(10, len(grid_data))):
-        row_values = grid_data[row_idx].get('values', [])
         print(f"Row {row_idx}: ", end="")
-        for col_idx, cell in enumerate(row_values):
-            if 'formattedValue' in cell and cell['formattedValue'].strip():
-                print(f"[{col_idx}:'{cell['formattedValue']}'] ", end="")
+        for col_idx, (text, _) in enumerate(grid_data[row_idx]):
+            if text.strip():
+                print(f"[{col_idx}:'{text}'] ", end="")
         print()
     
     print("=" * 50)
@@ -140,26 +137,22 @@ def find_room_column(grid_data):
     
     # Search through the first few rows to find room headers
     for row_idx in range(min(10, len(grid_data))):
-        row_values = grid_data[row_idx].get('values', [])
-        for col_idx, cell in enumerate(row_values):
-            if 'formattedValue' in cell:
-                cell_value = cell['formattedValue'].strip().lower()
-                if any(keyword in cell_value for keyword in room_keywords):
-                    return col_idx
+        for col_idx, (text, _) in enumerate(grid_data[row_idx]):
+            cell_value = text.strip().lower()
+            if cell_value and any(keyword in cell_value for keyword in room_keywords):
+                return col_idx
     
     # If no room header found, try to find by pattern (looking for room-like values)
     for row_idx in range(min(10, len(grid_data))):
-        row_values = grid_data[row_idx].get('values', [])
-        for col_idx, cell in enumerate(row_values):
-            if 'formattedValue' in cell:
-                cell_value = cell['formattedValue'].strip()
-                # Look for patterns like "Room 101", "101", "Lab 1", etc.
-                if (cell_value and 
-                    (cell_value.isdigit() or 
-                     'room' in cell_value.lower() or 
-                     'lab' in cell_value.lower() or
-                     any(char.isdigit() for char in cell_value))):
-                    return col_idx
+        for col_idx, (text, _) in enumerate(grid_data[row_idx]):
+            cell_value = text.strip()
+            # Look for patterns like "Room 101", "101", "Lab 1", etc.
+            if (cell_value and 
+                (cell_value.isdigit() or 
+                 'room' in cell_value.lower() or 
+                 'lab' in cell_value.lower() or
+                 any(char.isdigit() for char in cell_value))):
+                return col_idx
     
     # Default to first column if no room column found
     # Default to first column if no room column found
@@ -173,19 +166,16 @@ def build_time_col_rank(grid_data):
     - Search the first few rows for a row where the first column contains 'room' (case-insensitive).
       If found, that row holds the room header in col0 and time headers to its right (col_idx >= 1).
     - Otherwise, fallback to row index 4 (if exists) as the time header row and consider times starting at col 0.
-    - Build a mapping col_idx -> rank (0-based) for columns that contain a non-empty formattedValue in the time row.
+    - Build a mapping col_idx -> rank (0-based) for columns that contain non-empty text in the time row.
     """
     time_row = None
     start_col = 0
     for i in range(min(10, len(grid_data))):
-        row_values = grid_data[i].get('values', [])
-        if row_values and isinstance(row_values, list) and len(row_values) > 0:
-            first_cell = row_values[0]
-            if isinstance(first_cell, dict) and 'formattedValue' in first_cell:
-                if 'room' in first_cell['formattedValue'].strip().lower():
-                    time_row = grid_data[i]
-                    start_col = 1
-                    break
+        row = grid_data[i]
+        if row and 'room' in row[0][0].strip().lower():
+            time_row = row
+            start_col = 1
+            break
 
     if time_row is None:
         time_row = grid_data[4] if len(grid_data) > 4 else None
@@ -194,10 +184,10 @@ def build_time_col_rank(grid_data):
     col_rank = {}
     if time_row:
         rank = 0
-        for col_idx, cell in enumerate(time_row.get('values', [])):
+        for col_idx, (text, _) in enumerate(time_row):
             if col_idx < start_col:
                 continue
-            if isinstance(cell, dict) and 'formattedValue' in cell and cell['formattedValue'].strip():
+            if text.strip():
                 col_rank[col_idx] = rank
                 rank += 1
 
@@ -239,6 +229,33 @@ def parse_time_slot(time_slot):
         return datetime.max
 
 
+def slot_minutes(time_slot):
+    """(start, end) minutes after midnight for a slot like '08:30-09:50', or (None, None).
+
+    Times are written on a 12-hour clock without AM/PM, so hours before 8 are afternoon.
+    """
+    times = re.findall(r"(\d{1,2}):(\d{2})", str(time_slot))
+    if not times:
+        return None, None
+    ampm_match = re.search(r"\b(am|pm|AM|PM)\b", str(time_slot))
+
+    minutes = []
+    for hour, minute in times[:2]:
+        hour, minute = int(hour), int(minute)
+        if ampm_match:
+            hour = hour % 12 + (12 if ampm_match.group(1).upper() == "PM" else 0)
+        elif hour < 8:
+            hour += 12
+        minutes.append(hour * 60 + minute)
+
+    start = minutes[0]
+    end = minutes[1] if len(minutes) > 1 else None
+    if end is not None and end <= start and end + 12 * 60 < 24 * 60:
+        # e.g. '11:30-02:15' crosses noon
+        end += 12 * 60
+    return start, end
+
+
 def parse_embedded_time_info(course_entry):
     """
     Parse embedded time information from course entries like:
@@ -270,25 +287,202 @@ def parse_embedded_time_info(course_entry):
     return course_entry, "Unknown", False
 
 
+def find_lab_time_row(grid_data):
+    """Return (index, row) of the lab timing row, i.e. the first row with 'Lab' in its first column"""
+    for i, row in enumerate(grid_data):
+        if row and 'Lab' in row[0][0].strip():
+            return i, row
+    return None, None
+
+
+def find_row_room(row_values, room_column, search_other_columns=True):
+    """Extract the room for a timetable row from the room column.
+
+    With search_other_columns, fall back to room-like values elsewhere in the row
+    and then to the first non-empty cell that doesn't look like a course or a time.
+    """
+    room = "Unknown"
+
+    # First try the detected room column
+    if row_values and len(row_values) > room_column:
+        room_text = row_values[room_column][0]
+        if room_text:
+            room = room_text.strip()
+
+    if search_other_columns:
+        # If room is still unknown or empty, search for room info in other columns
+        if not room or room == "Unknown":
+            for col_idx, (text, _) in enumerate(row_values):
+                if col_idx != room_column and text:
+                    cell_value = text.strip()
+                    # Look for room-like patterns
+                    if (cell_value and
+                        (cell_value.isdigit() or
+                         'room' in cell_value.lower() or
+                         'lab' in cell_value.lower() or
+                         'class' in cell_value.lower() or
+                         any(char.isdigit() for char in cell_value))):
+                        room = cell_value
+                        break
+
+        # If still no room found, try to extract from the first non-empty cell
+        if not room or room == "Unknown":
+            for text, _ in row_values:
+                if text.strip():
+                    potential_room = text.strip()
+                    # Skip if it looks like a course name or time
+                    if (not any(keyword in potential_room.lower() for keyword in ['am', 'pm', ':', '-']) and
+                        not any(keyword in potential_room.lower() for keyword in ['cs-', 'bs-', 'semester', 'batch'])):
+                        room = potential_room
+                        break
+
+    # Clean the room data
+    return clean_room_data(room)
+
+
+def header_time_slot(time_row, col_idx):
+    """Time slot printed in a header row above the given column"""
+    time_slot = "Unknown"
+    if time_row:
+        time_slot = cell_text(time_row, col_idx, "Unknown")
+    return time_slot
+
+
+def section_patterns_for(user_batch, user_section):
+    """Substrings that mark a class entry as belonging to the given section"""
+    # Extract department from batch for pattern matching
+    dept_from_batch = ""
+    if user_batch:
+        if '-' in user_batch:
+            parts = user_batch.split('-')
+            if len(parts) >= 2:
+                dept_from_batch = parts[1]
+
+    return [
+        f"({dept_from_batch}-{user_section})" if dept_from_batch else f"({user_section})",  # Pattern like "(DEPT-E)"
+        f"-{user_section}",      # Pattern like "-E"
+        f"({user_section})",     # Pattern like "(E)"
+        f" {user_section} "      # Pattern like " E " (with spaces)
+    ]
+
+
+def section_tokens(section):
+    """What section matching looks for: '-E', '(E)' or ' E '.
+
+    The '(DEPT-E)' pattern of section_patterns_for always contains '-E', so it never
+    changes whether an entry matches; it only matters when cleaning entries.
+    """
+    return [f"-{section}", f"({section})", f" {section} "]
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_section_tokens(sections):
+    owners = {}
+    for section in sections:
+        for token in section_tokens(section):
+            owners.setdefault(token, set()).add(section)
+    # Longest first, so at every position the regex reports the longest token found there
+    tokens = sorted(owners, key=lambda token: (-len(token), token))
+    # Every shorter token starting at the same position is a prefix of the longest one
+    implied = {token: frozenset(section for other in tokens if token.startswith(other) for section in owners[other])
+               for token in tokens}
+    return re.compile("|".join(map(re.escape, tokens))), tokens, implied
+
+
+def section_pattern(sections):
+    """One compiled regex that finds a class entry of any of the sections (a single search per entry)"""
+    return _compile_section_tokens(tuple(sorted(set(sections))))[0]
+
+
+def compile_section_matcher(sections):
+    """Function giving the set of ``sections`` a class entry belongs to, in one scan of the entry.
+
+    Tokens of different sections can overlap ('-A' inside '-AB'), so the combined regex is
+    run in a lookahead at every position and each longest token found implies its prefixes.
+    """
+    _, tokens, implied = _compile_section_tokens(tuple(sorted(set(sections))))
+    if not tokens:
+        return lambda entry: set()
+    scanner = re.compile("(?=(" + "|".join(map(re.escape, tokens)) + "))")
+
+    def match(entry):
+        found = set()
+        for token in scanner.findall(entry):
+            found |= implied[token]
+        return found
+
+    return match
+
+
+def clean_class_entry(entry, section_patterns):
+    """Remove section patterns and leftover punctuation from a course entry"""
+    clean_entry = entry
+    for pattern in section_patterns:
+        clean_entry = clean_entry.replace(pattern, '').strip()
+    # Also remove any remaining parentheses and clean up
+    clean_entry = clean_entry.replace('()', '').strip()
+    if clean_entry.endswith('-'):
+        clean_entry = clean_entry[:-1].strip()
+    return clean_entry
+
+
+def format_timetable_day(day, sessions):
+    """Render one day of {day: [(rank, parsed_time, time_slot, room, type, course), ...]} as a Markdown table"""
+    output = [f"### 📌 {day}\n", "| Time | Room | Type | Course |", "|------|------|------|--------|"]
+
+    # Sort sessions by column rank then extracted start time before displaying
+    for _, _, time_slot, room, session_type, course in sorted(sessions, key=lambda x: (x[0], x[1])):
+        output.append(f"| {time_slot} | {room} | {session_type} | {course} |")
+    output.append("\n")
+    return "\n".join(output)
+
+
+def format_custom_timetable_day(day, sessions):
+    """Render one day of custom timetable entries (with section and batch columns) as a Markdown table"""
+    output = [f"### 📌 {day}\n", "| Time | Room | Type | Course | Section | Batch |",
+              "|------|------|------|--------|---------|-------|"]
+
+    # Sort sessions by column rank then extracted start time before displaying
+    for _, _, time_slot, room, session_type, course, section, batch in sorted(sessions, key=lambda x: (x[0], x[1])):
+        # Extract year from batch for compact display
+        m = re.search(r"(20\d{2})", str(batch))
+        display_batch = m.group(1) if m else str(batch)
+        output.append(f"| {time_slot} | {room} | {session_type} | {course} | {section} | {display_batch} |")
+    output.append("\n")
+    return "\n".join(output)
+
+
+def format_timetable(timetable):
+    """Render {day: [(rank, parsed_time, time_slot, room, type, course), ...]} as Markdown tables"""
+    output = [format_timetable_day(day, sessions) for day, sessions in timetable.items()]
+    return "\n".join(output) if output else "⚠️ No classes found for selected criteria"
+
+
+def format_custom_timetable(timetable):
+    """Render custom timetable entries (with section and batch columns) as Markdown tables"""
+    output = [format_custom_timetable_day(day, sessions) for day, sessions in timetable.items()]
+    return "\n".join(output) if output else "⚠️ No classes found for selected courses"
+
+
 def get_timetable(spreadsheet, user_batch, user_section):
     """Generate timetable using color-based matching and return formatted output"""
-    batch_colors = extract_batch_colors(spreadsheet)
+    grid = as_grid(spreadsheet)
+    batch_colors = extract_batch_colors(grid)
 
     # Find target color for user's batch
     target_color = next((color for color, batch in batch_colors.items() if batch == user_batch), None)
 
     if not target_color:
         return f"⚠️ Batch '{user_batch}' not found!"
+    palette = build_palette(grid, batch_colors)['lookup']
 
     timetable = {}
-    timetable_sheets = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
 
-    for sheet in spreadsheet.get('sheets', []):
-        sheet_name = sheet['properties']['title']
-        if sheet_name not in timetable_sheets:
-            continue
+    # Patterns like "(DEPT-E)", "-E", "(E)" that mark a class as belonging to the section
+    section_patterns = section_patterns_for(user_batch, user_section)
+    section_regex = section_pattern([user_section])
 
-        grid_data = sheet.get('data', [{}])[0].get('rowData', [])
+    for sheet_name, grid_data in grid['sheets'].items():
         if len(grid_data) < 6:
             continue
 
@@ -302,18 +496,7 @@ def get_timetable(spreadsheet, user_batch, user_section):
         class_time_row, col_rank = build_time_col_rank(grid_data)
 
         # Detect the correct lab row dynamically by searching for 'Lab' in first column
-        lab_time_row_index = None
-        lab_time_row = None
-
-        # Search through all rows to find the one containing 'Lab' in the first column
-        for i in range(len(grid_data)):
-            row_values = grid_data[i].get('values', [])
-            if row_values:
-                first_cell_value = row_values[0].get('formattedValue', '').strip()
-                if 'Lab' in first_cell_value:
-                    lab_time_row_index = i
-                    lab_time_row = grid_data[i]
-                    break
+        lab_time_row_index, lab_time_row = find_lab_time_row(grid_data)
 
         # Process timetable rows (skip headers)
         for row_idx, row in enumerate(grid_data[5:], start=6):
@@ -322,74 +505,16 @@ def get_timetable(spreadsheet, user_batch, user_section):
             is_lab = lab_time_row_index is not None and row_idx >= lab_time_row_index + 1
 
             # Extract room number from the correct column
-            row_values = row.get('values', []) if isinstance(row, dict) else []
-            room = "Unknown"
-
-            # First try the detected room column
-            if row_values and len(row_values) > room_column:
-                room_cell = row_values[room_column]
-                if 'formattedValue' in room_cell:
-                    room = room_cell['formattedValue'].strip()
-
-            # If room is still unknown or empty, search for room info in other columns
-            if not room or room == "Unknown":
-                for col_idx, cell in enumerate(row_values):
-                    if col_idx != room_column and 'formattedValue' in cell:
-                        cell_value = cell['formattedValue'].strip()
-                        # Look for room-like patterns
-                        if (cell_value and
-                            (cell_value.isdigit() or
-                             'room' in cell_value.lower() or
-                             'lab' in cell_value.lower() or
-                             'class' in cell_value.lower() or
-                             any(char.isdigit() for char in cell_value))):
-                            room = cell_value
-                            break
-
-            # If still no room found, try to extract from the first non-empty cell
-            if not room or room == "Unknown":
-                for cell in row_values:
-                    if 'formattedValue' in cell and cell['formattedValue'].strip():
-                        potential_room = cell['formattedValue'].strip()
-                        # Skip if it looks like a course name or time
-                        if (not any(keyword in potential_room.lower() for keyword in ['am', 'pm', ':', '-']) and
-                            not any(keyword in potential_room.lower() for keyword in ['cs-', 'bs-', 'semester', 'batch'])):
-                            room = potential_room
-                            break
-
-            # Clean the room data
-            room = clean_room_data(room)
-
-            # Check all cells in row
-            for col_idx, cell in enumerate(row_values):
-                if not isinstance(cell, dict) or 'effectiveFormat' not in cell:
-                    continue
+            room = find_row_room(row, room_column)
 
-                # Get cell color
-                color = cell.get('effectiveFormat', {}).get('backgroundColor', {})
-                cell_color = f"{color.get('red', 0):.2f}{color.get('green', 0):.2f}{color.get('blue', 0):.2f}"
+            # Check all cells in row (cells without a format have no colour)
+            for col_idx, (class_entry, cell_color) in enumerate(row):
+                if cell_color is None:
+                    continue
 
-                if cell_color == target_color:
-                    class_entry = cell.get('formattedValue', '')
+                if palette.get(cell_color) == target_color:
                     # More strict section filtering - check for exact section matches
-                    section_match = False
-                    if class_entry:
-                        # Check for patterns like "(DEPT-E)", "-E", "(E)", etc.
-                        # Extract department from batch for pattern matching
-                        dept_from_batch = ""
-                        if user_batch:
-                            if '-' in user_batch:
-                                parts = user_batch.split('-')
-                                if len(parts) >= 2:
-                                    dept_from_batch = parts[1]
-                        
-                        section_patterns = [
-                            f"({dept_from_batch}-{user_section})" if dept_from_batch else f"({user_section})",  # Pattern like "(DEPT-E)"
-                            f"-{user_section}",      # Pattern like "-E"
-                            f"({user_section})",     # Pattern like "(E)"
-                            f" {user_section} "      # Pattern like " E " (with spaces)
-                        ]
-                        section_match = any(pattern in class_entry for pattern in section_patterns)
+                    section_match = bool(class_entry) and section_regex.search(class_entry) is not None
 
                     if class_entry and section_match:
                         # First, try to parse embedded time information from the course entry itself
@@ -399,30 +524,14 @@ def get_timetable(spreadsheet, user_batch, user_section):
                             # Use the embedded time from the course entry
                             time_slot = embedded_time
                             # Clean the course name further by removing section patterns
-                            clean_entry = cleaned_entry
-                            for pattern in section_patterns:
-                                clean_entry = clean_entry.replace(pattern, '').strip()
-                            clean_entry = clean_entry.replace('()', '').strip()
-                            if clean_entry.endswith('-'):
-                                clean_entry = clean_entry[:-1].strip()
+                            clean_entry = clean_class_entry(cleaned_entry, section_patterns)
                         else:
                             # Fall back to the original logic for non-embedded time entries
-                            clean_entry = class_entry
-                            # Remove section patterns from the course name
-                            for pattern in section_patterns:
-                                clean_entry = clean_entry.replace(pattern, '').strip()
-                            # Also remove any remaining parentheses and clean up
-                            clean_entry = clean_entry.replace('()', '').strip()
-                            if clean_entry.endswith('-'):
-                                clean_entry = clean_entry[:-1].strip()
+                            clean_entry = clean_class_entry(class_entry, section_patterns)
 
                             # Extract time slot from header row
                             time_row_for_slot = lab_time_row if (is_lab and lab_time_row is not None) else class_time_row
-                            time_slot = "Unknown"
-                            if time_row_for_slot:
-                                time_values = time_row_for_slot.get('values', [])
-                                if len(time_values) > col_idx:
-                                    time_slot = time_values[col_idx].get('formattedValue', 'Unknown')
+                            time_slot = header_time_slot(time_row_for_slot, col_idx)
                         
                         rank = col_rank.get(col_idx, 999)
 
@@ -434,18 +543,7 @@ def get_timetable(spreadsheet, user_batch, user_section):
                         timetable[sheet_name].append((rank, parse_time_slot(time_slot), time_slot, room, "Lab" if is_lab else "Class", clean_entry))
 
     # Format output as a Markdown table
-    output = []
-    for day, sessions in timetable.items():
-        output.append(f"### 📌 {day}\n")
-        output.append("| Time | Room | Type | Course |")
-        output.append("|------|------|------|--------|")
-
-        # Sort sessions by column rank then extracted start time before displaying
-        for _, _, time_slot, room, session_type, course in sorted(sessions, key=lambda x: (x[0], x[1])):
-            output.append(f"| {time_slot} | {room} | {session_type} | {course} |")
-        output.append("\n")
-
-    return "\n".join(output) if output else "⚠️ No classes found for selected criteria"
+    return format_timetable(timetable)
 
 
 def get_custom_timetable(spreadsheet, selected_courses):
@@ -454,7 +552,6 @@ def get_custom_timetable(spreadsheet, selected_courses):
         return "⚠️ No courses selected. Please select courses first."
     
     timetable = {}
-    timetable_sheets = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
     
     # Create a set of course identifiers for faster lookup
     selected_course_ids = set()
@@ -463,14 +560,13 @@ def get_custom_timetable(spreadsheet, selected_courses):
         selected_course_ids.add(course_id)
     
     # Precompute batch color mapping so we can validate the batch for each cell
-    batch_colors = extract_batch_colors(spreadsheet)
-
-    for sheet in spreadsheet.get('sheets', []):
-        sheet_name = sheet['properties']['title']
-        if sheet_name not in timetable_sheets:
-            continue
+    grid = as_grid(spreadsheet)
+    batch_colors = extract_batch_colors(grid)
+    palette = build_palette(grid, batch_colors)['lookup']
+    # Each selected course's matcher is compiled once for the whole scan
+    matchers = [(selected_course, selected_course_matcher(selected_course)) for selected_course in selected_courses]
 
-        grid_data = sheet.get('data', [{}])[0].get('rowData', [])
+    for sheet_name, grid_data in grid['sheets'].items():
         if len(grid_data) < 6:
             continue
 
@@ -481,256 +577,173 @@ def get_custom_timetable(spreadsheet, selected_courses):
         class_time_row, col_rank = build_time_col_rank(grid_data)
 
         # Detect the correct lab row dynamically
-        lab_time_row_index = None
-        lab_time_row = None
-        
-        for i in range(len(grid_data)):
-            row_values = grid_data[i].get('values', [])
-            if row_values:
-                first_cell_value = row_values[0].get('formattedValue', '').strip()
-                if 'Lab' in first_cell_value:
-                    lab_time_row_index = i
-                    lab_time_row = grid_data[i]
-                    break
+        lab_time_row_index, lab_time_row = find_lab_time_row(grid_data)
 
         # Process timetable rows (skip headers)
         for row_idx, row in enumerate(grid_data[5:], start=6):
             is_lab = lab_time_row_index is not None and row_idx >= lab_time_row_index + 1
 
             # Extract room number
-            row_values = row.get('values', []) if isinstance(row, dict) else []
-            room = "Unknown"
-            
-            if row_values and len(row_values) > room_column:
-                room_cell = row_values[room_column]
-                if 'formattedValue' in room_cell:
-                    room = room_cell['formattedValue'].strip()
-            
-            # Clean the room data
-            room = clean_room_data(room)
-
-            # Check all cells in row
-            for col_idx, cell in enumerate(row_values):
-                if not isinstance(cell, dict) or 'effectiveFormat' not in cell:
-                    continue
+            room = find_row_room(row, room_column, search_other_columns=False)
 
-                # Get cell color
-                color = cell.get('effectiveFormat', {}).get('backgroundColor', {})
-                cell_color = f"{color.get('red', 0):.2f}{color.get('green', 0):.2f}{color.get('blue', 0):.2f}"
+            # Check all cells in row (cells without a format have no colour)
+            for col_idx, (class_entry, cell_color) in enumerate(row):
+                if cell_color is None:
+                    continue
 
-                class_entry = cell.get('formattedValue', '')
                 if class_entry:
                     # Try to match this course with selected courses
-                    for selected_course in selected_courses:
+                    batch_from_color = batch_colors.get(palette.get(cell_color, cell_color), "")
+                    for selected_course, matches in matchers:
                         # Check if this cell matches the selected course (including batch validation)
-                        if matches_selected_course(class_entry, selected_course, cell_color, batch_colors):
-                            # First, try to parse embedded time information from the course entry itself
-                            cleaned_entry, embedded_time, has_embedded_time = parse_embedded_time_info(class_entry)
-                            
-                            if has_embedded_time:
-                                # Use the embedded time from the course entry
-                                time_slot = embedded_time
-                                course_name = cleaned_entry
-                            else:
-                                # Fall back to extracting time from header row
-                                time_row = lab_time_row if (is_lab and lab_time_row is not None) else class_time_row
-                                time_slot = "Unknown"
-                                if time_row:
-                                    time_values = time_row.get('values', [])
-                                    if len(time_values) > col_idx:
-                                        time_slot = time_values[col_idx].get('formattedValue', 'Unknown')
-                                course_name = selected_course['name']
-
-                            # Store in dictionary (group by day)
-                            if sheet_name not in timetable:
-                                timetable[sheet_name] = []
-
-                            rank = col_rank.get(col_idx, 999)
-                            entry = (
-                                rank,
-                                parse_time_slot(time_slot),
-                                time_slot,
-                                room,
-                                "Lab" if is_lab else "Class",
-                                course_name,  # Use the cleaned course name (either from embedded parsing or selected course)
-                                selected_course['section'],
-                                selected_course['batch']
-                            )
-
-                            # Avoid adding exact or near-duplicate entries (same time, room, type, section, batch
-                            # and similar course name like "Comp Net" vs "Comp Net Lab")
-                            already = False
-                            for existing in timetable[sheet_name]:
-                                if is_similar_entry(existing, entry):
-                                    already = True
-                                    break
-                            if not already:
-                                timetable[sheet_name].append(entry)
+                        if matches(class_entry, batch_from_color):
+                            time_row = lab_time_row if (is_lab and lab_time_row is not None) else class_time_row
+                            entry = build_custom_entry(class_entry, selected_course, col_rank.get(col_idx, 999),
+                                                       header_time_slot(time_row, col_idx), room,
+                                                       "Lab" if is_lab else "Class")
+                            add_custom_entry(timetable, sheet_name, entry)
 
     # Format output as a Markdown table
-    output = []
-    for day, sessions in timetable.items():
-        output.append(f"### 📌 {day}\n")
-        output.append("| Time | Room | Type | Course | Section | Batch |")
-        output.append("|------|------|------|--------|---------|-------|")
-
-        # Sort sessions by column rank then extracted start time before displaying
-        for _, _, time_slot, room, session_type, course, section, batch in sorted(sessions, key=lambda x: (x[0], x[1])):
-            # Extract year from batch for compact display
-            import re
-            m = re.search(r"(20\d{2})", str(batch))
-            display_batch = m.group(1) if m else str(batch)
-            output.append(f"| {time_slot} | {room} | {session_type} | {course} | {section} | {display_batch} |")
-        output.append("\n")
+    return format_custom_timetable(timetable)
 
-    return "\n".join(output) if output else "⚠️ No classes found for selected courses"
 
-def matches_selected_course(class_entry, selected_course, cell_color, batch_colors):
-    """Check if a class entry matches a selected course"""
-    # Parse embedded time info if present to get clean course name for matching
-    cleaned_entry, _, has_embedded_time = parse_embedded_time_info(class_entry)
-    
-    # Use cleaned entry for matching if it has embedded time, otherwise use original
-    entry_to_match = cleaned_entry if has_embedded_time else class_entry
-    
-    # Extract base course name for matching (handle group patterns like "(CS, G-1)")
-    selected_course_name = selected_course['name']
-    
-    # Check if this is a group course (contains patterns like "(CS,G-1)" - normalized format)
-    import re
-    group_pattern = r'\([A-Z]{2,4}(?:-[A-Z])?,\s*G-\d+\)'
-    entry_has_group = re.search(group_pattern, entry_to_match)
-    selected_has_group = re.search(group_pattern, selected_course_name)
-    
-    # For group courses, we need special matching logic
-    if entry_has_group or selected_has_group:
-        # Both should have group patterns for a match
-        if entry_has_group and selected_has_group:
-            # Extract base course names (everything before the parentheses)
-            selected_base = selected_course_name.split('(')[0].strip()
-            entry_base = entry_to_match.split('(')[0].strip()
-            
-            # Check if base course names match
-            if selected_base.lower() != entry_base.lower():
-                return False
-        else:
-            # If only one has group pattern, no match
-            return False
+def build_custom_entry(class_entry, selected_course, rank, header_slot, room, session_type):
+    """Build a custom timetable entry tuple for a cell that matched a selected course"""
+    # First, try to parse embedded time information from the course entry itself
+    cleaned_entry, embedded_time, has_embedded_time = parse_embedded_time_info(class_entry)
+
+    if has_embedded_time:
+        # Use the embedded time from the course entry
+        time_slot = embedded_time
+        course_name = cleaned_entry
     else:
-        # For non-group courses, check if the course name is in the entry
-        if selected_course_name.lower() not in entry_to_match.lower():
+        # Fall back to the time printed in the header row
+        time_slot = header_slot
+        course_name = selected_course['name']
+
+    return (
+        rank,
+        parse_time_slot(time_slot),
+        time_slot,
+        room,
+        session_type,
+        course_name,  # Use the cleaned course name (either from embedded parsing or selected course)
+        selected_course['section'],
+        selected_course['batch']
+    )
+
+
+def add_custom_entry(timetable, day, entry):
+    """Append entry to the day unless an equivalent entry is already there"""
+    if day not in timetable:
+        timetable[day] = []
+
+    # Avoid adding exact or near-duplicate entries (same time, room, type, section, batch
+    # and similar course name like "Comp Net" vs "Comp Net Lab")
+    for existing in timetable[day]:
+        if is_similar_entry(existing, entry):
             return False
-    
-    # If the selected course doesn't contain "Lab" but the class entry does, reject it
-    # This prevents fetching lab sessions when only the main course is selected
-    if 'lab' not in selected_course_name.lower() and 'lab' in entry_to_match.lower():
-        return False
-    
-    # Check if the section matches
-    department = selected_course.get('department', '')
-    section = selected_course.get('section', '')
-    
-    # Build section patterns
-    section_patterns = [
-        f"({department}-{section})" if department else f"({section})",
-        f"-{section}",
-        f"({section})",
-        f" {section} "
-    ]
-    
-    # For group courses, we need precise section matching since the format is standardized
-    if entry_has_group or selected_has_group:
-        # For group courses, check for the specific format in the original cell entry
-        # The actual timetable format is like "Gen AI (CS-A,G-1)"
-        if department and section:
-            # Extract the group number from the selected course
-            group_match = re.search(r'G-(\d+)', selected_course_name)
-            if group_match:
-                group_number = group_match.group(1)
-                group_section_pattern = rf"\({department}-{section},\s*G-{group_number}\)"
-                section_match = re.search(group_section_pattern, class_entry) is not None
-            else:
-                section_match = False
-        else:
-            section_match = False
-    else:
-        # Use the original class_entry for section matching since patterns might include time info
-        section_match = any(pattern in class_entry for pattern in section_patterns)
-    
-    if not section_match:
-        return False
+    timetable[day].append(entry)
+    return True
 
-    # If the class entry explicitly mentions a department token like 'DS-B' or '(DS-B)',
-    # extract that department and reject if it doesn't match the selected department.
-    dept_in_entry = None
-    m_dept = re.search(r"\b([A-Z]{2,4})-[A-Z]\b", class_entry)
-    if m_dept:
-        dept_in_entry = m_dept.group(1)
+def matches_selected_course(class_entry, selected_course, cell_color, batch_colors):
+    """Check if a class entry matches a selected course"""
+    batch_from_color = batch_colors.get(cell_color, "") if batch_colors else ""
+    return entry_matches_course(class_entry, selected_course, batch_from_color)
+
+
+def dept_from_batch(batch_str):
+    """Department token of batch strings like 'BS-CS-1' or 'BS CS (2023)'"""
+    if not batch_str:
+        return ""
+    # Handle dash-separated e.g., BS-CS-1
+    if '-' in batch_str:
+        parts = batch_str.split('-')
+        if len(parts) >= 2:
+            return parts[1]
+    # Otherwise look for 2-4 uppercase tokens
+    for token in DEPT_WORD_PATTERN.findall(batch_str):
+        if token != 'BS':
+            return token
+    return ""
+
+
+@functools.lru_cache(maxsize=4096)
+def course_matcher(name, department="", section="", batch=""):
+    """Compiled entry_matches_course for one selected course: match(class_entry, batch_from_color, entry).
+
+    Everything derived from the selected course (lowered name, group number, the section
+    regex) is prepared once, so matching a cell is a few scans of its text. ``entry`` is
+    the class entry without its embedded time, when the caller already has it.
+    """
+    name_lower = name.lower()
+    selected_has_group = GROUP_PATTERN.search(name) is not None
+    selected_base = name.split('(')[0].strip().lower()
+    selected_lab = 'lab' in name_lower
+    batch_year = YEAR_PATTERN.search(batch)
+
+    if selected_has_group:
+        # The actual timetable format is like "Gen AI (CS-A,G-1)"
+        group_match = re.search(r'G-(\d+)', name)
+        section_regex = re.compile(rf"\({re.escape(department)}-{re.escape(section)},\s*G-{group_match.group(1)}\)") \
+            if department and section and group_match else None
     else:
-        m_paren = re.search(r"\(\s*([A-Z]{2,4})\s*-\s*[A-Z]\s*\)", class_entry)
-        if m_paren:
-            dept_in_entry = m_paren.group(1)
+        section_regex = section_pattern([section])
+
+    def match(class_entry, batch_from_color="", entry=None):
+        if entry is None:
+            # Use the entry without its embedded time for name matching
+            cleaned_entry, _, has_embedded_time = parse_embedded_time_info(class_entry)
+            entry = cleaned_entry if has_embedded_time else class_entry
+        entry_lower = entry.lower()
+
+        # Group courses only match group entries of the same base course name
+        entry_has_group = GROUP_PATTERN.search(entry) is not None
+        if entry_has_group or selected_has_group:
+            if not (entry_has_group and selected_has_group) or entry.split('(')[0].strip().lower() != selected_base:
+                return False
+        elif name_lower not in entry_lower:
+            return False
 
-    if dept_in_entry and selected_course.get('department'):
-        if dept_in_entry != selected_course.get('department'):
+        # Lab sessions only match when the lab itself was selected
+        if not selected_lab and 'lab' in entry_lower:
             return False
 
-    # Validate batch and department: map cell_color to a batch string (if available)
-    # and ensure it corresponds to the selected course's batch (exact match).
-    # If exact batch doesn't match, allow same-year only if department also matches.
-    batch_from_color = batch_colors.get(cell_color, "") if batch_colors else ""
-    selected_batch = selected_course.get('batch', '')
-    selected_dept = selected_course.get('department', '')
-
-    def extract_dept_from_batch(batch_str: str) -> str:
-        """Extract department token from batch strings like 'BS-CS-1' or 'BS CS (2023)'."""
-        if not batch_str:
-            return ""
-        # Handle dash-separated e.g., BS-CS-1
-        if '-' in batch_str:
-            parts = batch_str.split('-')
-            if len(parts) >= 2:
-                return parts[1]
-        # Otherwise look for 2-4 uppercase tokens
-        tokens = re.findall(r"\b[A-Z]{2,4}\b", batch_str)
-        for t in tokens:
-            if t != 'BS':
-                return t
-        return ""
+        # Sections are matched on the original cell entry, which may include time info
+        if section_regex is None or not section_regex.search(class_entry):
+            return False
 
-    # If we have a batch/color mapping, use it to validate department and batch
-    if batch_from_color:
-        dept_from_color = extract_dept_from_batch(batch_from_color)
-        # If department is known from color and doesn't match selected, reject
-        if dept_from_color and selected_dept and dept_from_color != selected_dept:
+        # An explicit department token like 'DS-B' or '(DS-B)' must be the selected department
+        m_dept = DEPT_TOKEN_PATTERN.search(class_entry) or DEPT_PAREN_PATTERN.search(class_entry)
+        if m_dept and department and m_dept.group(1) != department:
             return False
 
-        # If exact batch matches, accept
-        if selected_batch and batch_from_color == selected_batch:
-            return True
-
-        # Fallback: allow same-year matching only if department matches (or not provided)
-        y1 = re.search(r"(20\d{2})", batch_from_color)
-        y2 = re.search(r"(20\d{2})", selected_batch)
-        if y1 and y2 and y1.group(1) == y2.group(1):
-            # ensure department alignment if we can
-            if dept_from_color:
-                if selected_dept and dept_from_color != selected_dept:
-                    return False
-                return True
-            else:
-                # No dept info from color; require department token to be present in class entry
-                if selected_dept and selected_dept.lower() not in class_entry.lower():
-                    return False
+        # The cell colour maps to a batch, which must be the selected batch, or the same
+        # year when the department also matches
+        if batch_from_color:
+            dept_from_color = dept_from_batch(batch_from_color)
+            if dept_from_color and department and dept_from_color != department:
+                return False
+            if batch and batch_from_color == batch:
                 return True
+            color_year = YEAR_PATTERN.search(batch_from_color)
+            if color_year and batch_year and color_year.group(1) == batch_year.group(1):
+                # No department from the colour: the entry itself must name the department
+                return bool(dept_from_color) or not department or department.lower() in class_entry.lower()
+            return False
 
-        return False
+        # Without a batch for the cell, require the department in the entry to avoid cross-batch matches
+        return not department or department.lower() in class_entry.lower()
 
-    # If no batch/color info is available for the cell, require department to appear in the cell entry
-    # to avoid cross-batch matches. This is a conservative fallback.
-    if selected_dept:
-        if selected_dept.lower() not in class_entry.lower():
-            return False
+    return match
 
-    # If department can't be validated, fall back to name+section match (already checked)
-    return True
+
+def selected_course_matcher(selected_course):
+    """course_matcher of a selected course dict"""
+    return course_matcher(selected_course['name'], selected_course.get('department', ''),
+                          selected_course.get('section', ''), selected_course.get('batch', ''))
+
+
+def entry_matches_course(class_entry, selected_course, batch_from_color=""):
+    """Check if a class entry matches a selected course, given the batch its cell color maps to"""
+    return selected_course_matcher(selected_course)(class_entry, batch_from_color)
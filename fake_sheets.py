@@ -0,0 +1,264 @@
+"""Local stand-in for the Google Sheets API used by load tests and offline runs.
+
+Run ``python fake_sheets.py --synthetic`` (or ``--snapshot saved.json``) and point the
+app at it with ``SHEETS_API_ENDPOINT=http://127.0.0.1:8765``. Drive's files.get is served
+too (version and modifiedTime only), for the revision probe.
+"""
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from snapshot_io import load_snapshot, save_snapshot
+
+TIMETABLE_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+DEFAULT_DEPARTMENTS = ["CS", "SE", "AI", "DS", "CY"]
+DEFAULT_YEARS = ["2022", "2023", "2024", "2025"]
+CLASS_SLOTS = ["08:30-09:50", "10:00-11:20", "11:30-12:50", "01:00-02:20", "02:30-03:50", "04:00-05:20"]
+LAB_SLOTS = ["08:30-11:15", "11:30-02:15", "02:30-05:15"]
+COURSE_NAMES = [
+    "Programming Fundamentals", "Object Oriented Programming", "Data Structures", "Algorithms",
+    "Database Systems", "Operating Systems", "Computer Networks", "Software Engineering",
+    "Artificial Intelligence", "Machine Learning", "Linear Algebra", "Probability and Statistics",
+    "Digital Logic Design", "Computer Architecture", "Theory of Automata", "Compiler Construction",
+    "Information Security", "Web Programming", "Numerical Computing", "Technical Writing",
+]
+SPREADSHEET_PATH = re.compile(r"^/v4/spreadsheets/([^/?]+)")
+DRIVE_FILE_PATH = re.compile(r"^/drive/v3/files/([^/?]+)")
+
+
+def _color(rgb):
+    """Sheets API color dict; zero channels are omitted exactly like the real API does"""
+    return {channel: value / 255 for channel, value in zip(('red', 'green', 'blue'), rgb) if value}
+
+
+def _cell(text="", rgb=(255, 255, 255)):
+    """Build a cell in the (verbose) shape returned by spreadsheets.get with includeGridData"""
+    color = _color(rgb)
+    cell_format = {
+        'backgroundColor': color,
+        'backgroundColorStyle': {'rgbColor': color},
+        'padding': {'top': 2, 'right': 3, 'bottom': 2, 'left': 3},
+        'horizontalAlignment': 'CENTER',
+        'verticalAlignment': 'MIDDLE',
+        'wrapStrategy': 'WRAP',
+        'textFormat': {
+            'foregroundColor': {},
+            'fontFamily': 'Calibri',
+            'fontSize': 10,
+            'bold': False,
+            'italic': False,
+            'strikethrough': False,
+            'underline': False,
+            'foregroundColorStyle': {'rgbColor': {}},
+        },
+        'hyperlinkDisplayType': 'PLAIN_TEXT',
+    }
+    cell = {'userEnteredFormat': dict(cell_format), 'effectiveFormat': cell_format}
+    if text:
+        cell['userEnteredValue'] = {'stringValue': text}
+        cell['effectiveValue'] = {'stringValue': text}
+        cell['formattedValue'] = text
+    return cell
+
+
+def make_spreadsheet(departments=None, years=None, sections="ABCDEF", class_rooms=40, lab_rooms=12,
+                     fill=0.6, seed=0):
+    """Generate a synthetic timetable spreadsheet with the same layout as the real sheet.
+
+    Rows 0-3 hold the batch colour legend, row 4 the class time header (first cell 'Room'),
+    followed by one row per classroom, a 'Lab' time header and one row per lab.
+    """
+    rng = random.Random(seed)
+    departments = departments or DEFAULT_DEPARTMENTS
+    years = years or DEFAULT_YEARS
+
+    batches = []
+    for dept in departments:
+        for year in years:
+            # Distinct pastel colour per batch so colour matching stays unambiguous
+            rgb = (rng.randrange(120, 250), rng.randrange(120, 250), rng.randrange(120, 250))
+            while any(rgb == b['rgb'] for b in batches):
+                rgb = (rng.randrange(120, 250), rng.randrange(120, 250), rng.randrange(120, 250))
+            batches.append({'name': f"BS {dept} ({year})", 'dept': dept, 'rgb': rgb})
+
+    sheets = []
+    for sheet_id, day in enumerate(TIMETABLE_DAYS):
+        rows = [{'values': [_cell(f"Timetable Fall Semester - {day}")]}]
+
+        # Batch legend spread over rows 1-3
+        legend = [[], [], []]
+        for i, batch in enumerate(batches):
+            legend[i % 3].append(_cell(batch['name'], batch['rgb']))
+        rows.extend({'values': cells} for cells in legend)
+
+        rows.append({'values': [_cell("Room")] + [_cell(slot) for slot in CLASS_SLOTS]})
+        for room in range(class_rooms):
+            values = [_cell(f"C-{100 + room}")]
+            for _ in CLASS_SLOTS:
+                if rng.random() < fill:
+                    batch = rng.choice(batches)
+                    course = rng.choice(COURSE_NAMES)
+                    values.append(_cell(f"{course} ({batch['dept']}-{rng.choice(sections)})", batch['rgb']))
+                else:
+                    values.append(_cell())
+            rows.append({'values': values})
+
+        rows.append({'values': [_cell("Lab")] + [_cell(slot) for slot in LAB_SLOTS]})
+        for lab in range(lab_rooms):
+            values = [_cell(f"Lab {lab + 1}")]
+            for _ in LAB_SLOTS:
+                if rng.random() < fill:
+                    batch = rng.choice(batches)
+                    course = rng.choice(COURSE_NAMES)
+                    values.append(_cell(f"{course} Lab ({batch['dept']}-{rng.choice(sections)})", batch['rgb']))
+                else:
+                    values.append(_cell())
+            rows.append({'values': values})
+
+        sheets.append({
+            'properties': {'sheetId': sheet_id, 'title': day, 'index': sheet_id,
+                           'gridProperties': {'rowCount': len(rows), 'columnCount': len(CLASS_SLOTS) + 1}},
+            'data': [{'startRow': 0, 'startColumn': 0, 'rowData': rows}],
+        })
+
+    return {
+        'spreadsheetId': 'synthetic',
+        'properties': {'title': 'Synthetic Timetable', 'locale': 'en_US', 'timeZone': 'Asia/Karachi'},
+        'sheets': sheets,
+        'spreadsheetUrl': 'https://docs.google.com/spreadsheets/d/synthetic/edit',
+    }
+
+
+class _SheetsHandler(BaseHTTPRequestHandler):
+    """Serves spreadsheets.get for whatever spreadsheet the server was started with"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if DRIVE_FILE_PATH.match(self.path):
+            with server.stats_lock:
+                server.stats['probes'] += 1
+            modified = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(server.modified_at))
+            self._send(200, json.dumps({'version': str(server.version), 'modifiedTime': modified}).encode('utf-8'))
+            return
+
+        with server.stats_lock:
+            server.stats['requests'] += 1
+            request_number = server.stats['requests']
+
+        delay = server.latency + (random.uniform(0, server.jitter) if server.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        # Fault injection: fail the first N requests and/or a random share of them
+        if request_number <= server.fail_first or random.random() < server.fail_rate:
+            with server.stats_lock:
+                server.stats['failures'] += 1
+            status = server.error_status
+            headers = {'Retry-After': server.retry_after} if server.retry_after else None
+            self._send(status, json.dumps({'error': {'code': status, 'message': 'Injected failure',
+                                                     'status': 'RESOURCE_EXHAUSTED' if status == 429
+                                                     else 'UNAVAILABLE'}}).encode('utf-8'), headers)
+            return
+
+        if not SPREADSHEET_PATH.match(self.path):
+            self._send(404, b'{"error": {"code": 404, "message": "Not found"}}')
+            return
+
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            self._send(200, server.body_gzip, {'Content-Encoding': 'gzip'})
+        else:
+            self._send(200, server.body)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep load-test output readable
+        pass
+
+
+def set_spreadsheet(server, spreadsheet):
+    """Serve a different spreadsheet from now on, as if someone had edited the sheet"""
+    body = json.dumps(spreadsheet, separators=(',', ':')).encode('utf-8')
+    server.body, server.body_gzip = body, gzip.compress(body)
+    server.version += 1
+    server.modified_at = time.time()
+
+
+def serve(spreadsheet, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+          fail_first=0, fail_rate=0.0, error_status=429, retry_after=None):
+    """Start the fake Sheets API in a background thread and return the server.
+
+    ``server.endpoint`` is the base URL to use as SHEETS_API_ENDPOINT and
+    ``server.stats`` counts the fetches that reached it and how many were failed on
+    purpose (the first ``fail_first`` requests plus a random ``fail_rate`` share, answered
+    with ``error_status`` and an optional Retry-After header).
+    """
+    server = ThreadingHTTPServer((host, port), _SheetsHandler)
+    server.daemon_threads = True
+    server.version = 0
+    set_spreadsheet(server, spreadsheet)
+    server.latency = latency
+    server.jitter = jitter
+    server.fail_first = fail_first
+    server.fail_rate = fail_rate
+    server.error_status = error_status
+    server.retry_after = str(retry_after) if retry_after is not None else None
+    server.stats = {'requests': 0, 'failures': 0, 'probes': 0}
+    server.stats_lock = threading.Lock()
+    server.endpoint = f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+    thread = threading.Thread(target=server.serve_forever, name="fake-sheets", daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a timetable spreadsheet over a fake Sheets API")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--snapshot", help="saved spreadsheets.get response (.json or .json.gz)")
+    source.add_argument("--synthetic", action="store_true", help="serve a generated timetable")
+    parser.add_argument("--rooms", type=int, default=40, help="classrooms per day for --synthetic")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="also write the served spreadsheet to this path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency up to this many seconds")
+    parser.add_argument("--fail-first", type=int, default=0, help="answer the first N requests with an error")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=429, help="status code for injected errors")
+    parser.add_argument("--retry-after", help="Retry-After header sent with injected errors")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        spreadsheet = load_snapshot(args.snapshot)
+    else:
+        spreadsheet = make_spreadsheet(class_rooms=args.rooms, seed=args.seed)
+    if args.save:
+        save_snapshot(spreadsheet, args.save)
+
+    server = serve(spreadsheet, args.host, args.port, args.latency, args.jitter,
+                   args.fail_first, args.fail_rate, args.error_status, args.retry_after)
+    print(f"Fake Sheets API listening on {server.endpoint} ({len(server.body) / 1e6:.1f} MB payload)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
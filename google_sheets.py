@@ -3,13 +3,17 @@ import gspread
 from google.oauth2.service_account import Credentials
 
 
-def get_google_sheets_data(sheet_url):
-    """Fetch Google Sheets file as a gspread object."""
+@st.cache_resource
+def get_gspread_client():
+    """gspread client shared by every session; its credentials refresh the token when it expires"""
     credentials_dict = st.secrets["google_service_account"]
     creds = Credentials.from_service_account_info(credentials_dict, scopes=["https://spreadsheets.google.com/feeds",
                                                                             "https://www.googleapis.com/auth/drive"])
+    return gspread.authorize(creds)
+
 
-    client = gspread.authorize(creds)
-    sheet = client.open_by_url(sheet_url)
+def get_google_sheets_data(sheet_url):
+    """Fetch Google Sheets file as a gspread object."""
+    sheet = get_gspread_client().open_by_url(sheet_url)
 
     return sheet
@@ -0,0 +1,231 @@
+"""Load-test harness that drives simulated sessions through both tabs of app.py.
+
+Every simulated session repeats what a student does in the UI: a page load (the cached
+index lookup at the top of ``app.main``) followed by either the Batch Timetable
+or the Custom Course Selection action, separated by think time. All sessions share one
+process, so they share the timetable cache exactly like sessions on one Streamlit replica.
+
+Examples:
+    python load_test.py --sessions 50 --duration 60 --think-time 2 --latency 0.3
+    python load_test.py --sessions 20 --snapshot saved.json --offline
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import streamlit.logger
+
+import fake_sheets
+from snapshot_io import load_snapshot, save_snapshot
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (q in 0-100)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def current_rss_bytes():
+    """Resident set size of this process, read from /proc when available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def sample_rss(stop_event, result, interval=0.05):
+    """Track peak RSS until stop_event is set"""
+    while not stop_event.is_set():
+        result['peak_rss'] = max(result['peak_rss'], current_rss_bytes())
+        stop_event.wait(interval)
+
+
+def run_session(app, session_id, args, deadline, results):
+    """One simulated user alternating page loads with timetable requests"""
+    rng = random.Random(args.seed + session_id)
+    timings = []
+    errors = 0
+    iteration = 0
+
+    def timed(action, func, *func_args):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            value = func(*func_args)
+        except Exception:
+            errors += 1
+            value = None
+        timings.append((action, time.perf_counter() - start))
+        return value
+
+    def think():
+        if args.think_time > 0:
+            time.sleep(rng.expovariate(1 / args.think_time))
+
+    while time.monotonic() < deadline and (not args.iterations or iteration < args.iterations):
+        iteration += 1
+
+        # Top of app.main(): runs on every script rerun of every session
+        index = timed('page_load', app.get_timetable_index)
+        if not index or not index['batches']:
+            think()
+            continue
+        all_courses = index['courses']
+        app.get_departments_and_years(all_courses)
+        think()
+
+        if rng.random() < args.custom_share and all_courses:
+            # Tab 2: pick a handful of courses and build the custom timetable
+            picks = rng.sample(all_courses, min(args.custom_courses, len(all_courses)))
+            timed('custom_timetable', app.build_custom_schedule, picks)
+        else:
+            # Tab 1: pick a batch and one of its sections
+            batch = rng.choice(index['batches'])
+            sections = sorted({c['section'] for c in all_courses if c['batch'] == batch and c['section']})
+            section = rng.choice(sections) if sections else 'A'
+            timed('batch_timetable', app.build_batch_schedule, batch, section)
+        think()
+
+    results[session_id] = {'timings': timings, 'errors': errors}
+
+
+def summarize(results, elapsed, peak_rss, fetches):
+    """Aggregate per-session timings into throughput and latency percentiles"""
+    by_action = {}
+    errors = 0
+    for session in results.values():
+        errors += session['errors']
+        for action, seconds in session['timings']:
+            by_action.setdefault(action, []).append(seconds)
+
+    all_timings = sorted(t for timings in by_action.values() for t in timings)
+    report = {
+        'elapsed_s': round(elapsed, 3),
+        'requests': len(all_timings),
+        'errors': errors,
+        'throughput_rps': round(len(all_timings) / elapsed, 2) if elapsed else 0.0,
+        'peak_rss_mb': round(peak_rss / 2 ** 20, 1),
+        'sheet_fetches': fetches,
+        'actions': {},
+    }
+    for action, timings in sorted(by_action.items()):
+        timings.sort()
+        report['actions'][action] = {
+            'count': len(timings),
+            'p50_ms': round(percentile(timings, 50) * 1000, 1),
+            'p95_ms': round(percentile(timings, 95) * 1000, 1),
+            'p99_ms': round(percentile(timings, 99) * 1000, 1),
+            'max_ms': round(timings[-1] * 1000, 1),
+        }
+    report['actions']['all'] = {
+        'count': len(all_timings),
+        'p50_ms': round(percentile(all_timings, 50) * 1000, 1),
+        'p95_ms': round(percentile(all_timings, 95) * 1000, 1),
+        'p99_ms': round(percentile(all_timings, 99) * 1000, 1),
+        'max_ms': round(all_timings[-1] * 1000, 1) if all_timings else 0.0,
+    }
+    return report
+
+
+def print_report(report, sessions):
+    print(f"\n=== Load test: {sessions} sessions, {report['elapsed_s']:.1f}s ===")
+    print(f"Requests: {report['requests']}  Errors: {report['errors']}  "
+          f"Throughput: {report['throughput_rps']:.1f} req/s")
+    if report['sheet_fetches'] is not None:
+        print(f"Sheet fetches: {report['sheet_fetches']['requests']} "
+              f"({report['sheet_fetches']['failures']} injected failures)")
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB\n")
+    print(f"{'action':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, stats in report['actions'].items():
+        print(f"{action:<18}{stats['count']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive simulated sessions through app.py")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent simulated sessions")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--iterations", type=int, default=0, help="stop each session after this many loops")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean think time between actions (s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="latency injected by the fake Sheets API (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency up to this many seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="share of fake Sheets API requests answered with 429")
+    parser.add_argument("--retry-after", help="Retry-After header sent with injected 429s")
+    parser.add_argument("--snapshot", help="spreadsheet snapshot to serve (default: synthetic timetable)")
+    parser.add_argument("--rooms", type=int, default=40, help="classrooms per day in the synthetic timetable")
+    parser.add_argument("--offline", action="store_true",
+                        help="read the snapshot file directly instead of serving it over HTTP")
+    parser.add_argument("--custom-share", type=float, default=0.5, help="fraction of actions on the custom tab")
+    parser.add_argument("--custom-courses", type=int, default=6, help="courses per custom selection")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-dir", help="shared cache directory (default: a fresh one, i.e. a cold start)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    spreadsheet = load_snapshot(args.snapshot) if args.snapshot else \
+        fake_sheets.make_spreadsheet(class_rooms=args.rooms, seed=args.seed)
+
+    server = None
+    if args.offline:
+        path = args.snapshot or save_snapshot(spreadsheet, os.path.join('.load_test', 'synthetic.json'))
+        os.environ["TIMETABLE_SNAPSHOT"] = path
+    else:
+        server = fake_sheets.serve(spreadsheet, latency=args.latency, jitter=args.jitter,
+                                   fail_rate=args.fail_rate, retry_after=args.retry_after)
+        os.environ["SHEETS_API_ENDPOINT"] = server.endpoint
+    del spreadsheet
+
+    # Session files and history from earlier runs would let workers skip the fetch entirely
+    os.environ["TIMETABLE_CACHE_DIR"] = args.cache_dir or tempfile.mkdtemp(prefix="timetable-load-test-")
+
+    # app reads its data source settings at import time, so import after configuring them
+    import app
+
+    # Streamlit warns about the missing script context on every cached call in bare mode
+    streamlit.logger.set_log_level(logging.ERROR)
+
+    stop_sampling = threading.Event()
+    memory = {'peak_rss': current_rss_bytes()}
+    sampler = threading.Thread(target=sample_rss, args=(stop_sampling, memory), daemon=True)
+    sampler.start()
+
+    results = {}
+    start = time.monotonic()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=run_session, args=(app, i, args, deadline, results), daemon=True)
+               for i in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    stop_sampling.set()
+    sampler.join()
+    memory['peak_rss'] = max(memory['peak_rss'], current_rss_bytes())
+
+    report = summarize(results, elapsed, memory['peak_rss'], server.stats if server else None)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.sessions)
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Compact projection of a Sheets API spreadsheets.get response.
+
+The timetable code only ever reads each cell's text and background colour, so right
+after a fetch every weekday sheet is projected to rows of (text, colour key) tuples and
+the nested API response is dropped:
+
+    {'sheets': {'Monday': [row, ...], ...}}    row = ((text, colour), (text, colour), ...)
+
+Colour keys are the strings the code has always compared colours on ('0.800.901.00':
+red, green and blue to two decimals); cells without any format have
+colour None. Identical cells share one tuple and texts are interned, so repeated values
+(empty cells, rooms, time headers, a course running all week) are stored once.
+
+stream_grid builds the same grid while the JSON is still being read (with ijson), so a
+refresh never holds the decoded response tree in memory; without ijson the response
+is decoded in one piece and projected.
+"""
+import gzip
+import json
+import sys
+
+try:
+    import ijson
+except ImportError:  # optional: responses are then decoded in one piece
+    ijson = None
+
+# Raised by stream_grid for malformed or truncated JSON
+GRID_DECODE_ERRORS = (ValueError, ijson.JSONError) if ijson else (ValueError,)
+
+TIMETABLE_SHEETS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+EMPTY_CELL = ("", None)
+# Colour of a formatted cell without a background colour, and what unformatted cells read as
+DEFAULT_COLOR = "0.000.000.00"
+# Distinct (red, green, blue) values keep their formatted key; a sheet uses a few dozen colours
+COLOR_KEY_CACHE_SIZE = 4096
+
+_color_keys = {}
+
+
+def color_key(color):
+    """Colour key of an API backgroundColor dict"""
+    rgb = (color.get('red', 0), color.get('green', 0), color.get('blue', 0))
+    key = _color_keys.get(rgb)
+    if key is None:
+        if len(_color_keys) >= COLOR_KEY_CACHE_SIZE:
+            _color_keys.clear()
+        key = _color_keys[rgb] = sys.intern(f"{rgb[0]:.2f}{rgb[1]:.2f}{rgb[2]:.2f}")
+    return key
+
+
+def shared_cell(cells, text, color):
+    """The one (text, colour) tuple kept for these values; ``cells`` maps values to shared tuples"""
+    key = (text, color)
+    shared = cells.get(key)
+    if shared is None:
+        shared = cells[key] = (sys.intern(text), sys.intern(color) if color is not None else None)
+    return shared
+
+
+def project_row(row, cells):
+    """Tuple of (text, colour key or None) cells for an API row; ``cells`` de-duplicates cell tuples"""
+    projected = []
+    for cell in row.get('values', []) if isinstance(row, dict) else []:
+        if not isinstance(cell, dict):
+            projected.append(EMPTY_CELL)
+            continue
+        text = cell.get('formattedValue', '')
+        color = color_key(cell['effectiveFormat'].get('backgroundColor', {})) if 'effectiveFormat' in cell else None
+        projected.append(shared_cell(cells, text, color))
+    return tuple(projected)
+
+
+def project_spreadsheet(spreadsheet):
+    """Compact grid of the weekday sheets of an API response"""
+    cells = {EMPTY_CELL: EMPTY_CELL}
+    sheets = {}
+    for sheet in spreadsheet.get('sheets', []):
+        sheet_name = sheet['properties']['title']
+        if sheet_name not in TIMETABLE_SHEETS:
+            continue
+        grid_data = sheet.get('data', [{}])[0].get('rowData', [])
+        sheets[sheet_name] = [project_row(row, cells) for row in grid_data]
+    return {'sheets': sheets}
+
+
+def as_grid(spreadsheet):
+    """Compact grid of a spreadsheet; API responses are projected, grids returned as they are"""
+    sheets = spreadsheet.get('sheets')
+    if not isinstance(sheets, dict):
+        return project_spreadsheet(spreadsheet)
+    if all(isinstance(row, tuple) for rows in sheets.values() for row in rows):
+        return spreadsheet
+    # A grid read back from JSON has lists for rows and cells
+    cells = {EMPTY_CELL: EMPTY_CELL}
+    return {'sheets': {day: [tuple(shared_cell(cells, text, color) for text, color in row) for row in rows]
+                       for day, rows in sheets.items()}}
+
+
+def _stream_response_grid(events, cells):
+    """Weekday sheets of a spreadsheets.get response from ijson parse events"""
+    cell_prefix = 'sheets.item.data.item.rowData.item.values.item'
+    rgb_prefix = cell_prefix + '.effectiveFormat.backgroundColor.'
+    sheets = {}
+    title = rows = row = None
+    data_items = 0
+    text, formatted, rgb = "", False, {}
+
+    for prefix, event, value in events:
+        if prefix.startswith(cell_prefix):
+            if row is None:
+                continue  # a sheet that is not kept
+            if prefix == cell_prefix:
+                if event == 'start_map':
+                    text, formatted, rgb = "", False, {}
+                elif event == 'end_map':
+                    row.append(shared_cell(cells, text, color_key(rgb) if formatted else None))
+                elif event != 'map_key':
+                    row.append(EMPTY_CELL)
+            elif prefix == cell_prefix + '.formattedValue' and event == 'string':
+                text = value
+            elif prefix == cell_prefix + '.effectiveFormat' and event == 'start_map':
+                formatted = True
+            elif prefix.startswith(rgb_prefix) and event == 'number':
+                # Floats, as in json.load: Decimals can round differently at two places
+                rgb[prefix[len(rgb_prefix):]] = float(value)
+        elif prefix == 'sheets.item.data.item.rowData.item':
+            if rows is None:
+                continue
+            if event == 'start_map':
+                row = []
+            elif event == 'end_map':
+                rows.append(tuple(row))
+                row = None
+            elif event != 'map_key':
+                rows.append(())
+        elif prefix == 'sheets.item.data.item' and event == 'start_map':
+            # Only the first range of a sheet is the timetable (as in project_spreadsheet)
+            data_items += 1
+            if data_items == 1 and (title is None or title in TIMETABLE_SHEETS):
+                rows = []
+        elif prefix == 'sheets.item.data.item' and event == 'end_map':
+            if rows is not None:
+                sheet_rows, rows = rows, None
+        elif prefix == 'sheets.item.properties.title':
+            title = value
+        elif prefix == 'sheets.item':
+            if event == 'start_map':
+                title, sheet_rows, data_items = None, [], 0
+            elif event == 'end_map' and title in TIMETABLE_SHEETS:
+                sheets[title] = sheet_rows
+        elif prefix == 'sheets' and event == 'end_array':
+            break
+    return sheets
+
+
+def _stream_saved_grid(events, cells):
+    """Sheets of a grid saved as JSON ({'sheets': {day: [[[text, colour], ...], ...]}})"""
+    sheets = {}
+    depth = 0
+    day = rows = row = cell = None
+    for prefix, event, value in events:
+        if prefix == 'sheets' and event == 'map_key':
+            day = value
+        elif prefix == 'sheets' and event == 'end_map':
+            break
+        elif event == 'start_array':
+            depth += 1
+            if depth == 1:
+                rows = []
+            elif depth == 2:
+                row = []
+            elif depth == 3:
+                cell = []
+        elif event == 'end_array':
+            if depth == 1:
+                sheets[day] = rows
+            elif depth == 2:
+                rows.append(tuple(row))
+            elif depth == 3:
+                row.append(shared_cell(cells, *cell))
+            depth -= 1
+        elif depth == 3:
+            cell.append(value)
+    return sheets
+
+
+def stream_grid(stream):
+    """Compact grid read straight from a binary stream of JSON (an API response or a saved grid)"""
+    if ijson is None:
+        return as_grid(json.load(stream))
+
+    events = ijson.parse(stream)
+    cells = {EMPTY_CELL: EMPTY_CELL}
+    for prefix, event, value in events:
+        if prefix == 'sheets' and event in ('start_array', 'start_map'):
+            if event == 'start_array':
+                return {'sheets': _stream_response_grid(events, cells)}
+            return {'sheets': _stream_saved_grid(events, cells)}
+    return {'sheets': {}}
+
+
+def load_grid(path):
+    """Compact grid of a saved spreadsheet response or grid (plain or gzipped JSON)"""
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return stream_grid(f)
+
+
+def cell_text(row, col_idx, default=""):
+    """Text of a cell, or default when the cell is empty or missing"""
+    if col_idx < len(row) and row[col_idx][0]:
+        return row[col_idx][0]
+    return default
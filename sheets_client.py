@@ -0,0 +1,399 @@
+"""Quota-aware Google Sheets fetch client.
+
+All processes on a host share one token bucket (a small state file guarded by a file
+lock), transient API errors are retried with jittered exponential backoff that honours
+Retry-After, and the last good response is kept on disk so a failing API degrades to
+slightly stale data instead of an error page.
+
+Responses are requested with a field mask (titles, cell texts and background colours
+only) and decoded while they download into the compact grid of sheet_grid.py, so the
+full response tree never exists in memory.
+
+Clients are process-wide: credentials are built once and keep their access token
+(refreshed when it expires), and each set of credentials has one keep-alive, gzip
+enabled HTTP session, so a fetch after the first one is just the download.
+
+probe_spreadsheet_version asks for a change marker only (the file's Drive version, or
+the values of a small sentinel range when TIMETABLE_SENTINEL_RANGE is set), so callers
+can skip the full download while nobody has edited the sheet.
+"""
+import contextlib
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import quote, urlencode
+
+import google.auth
+import httplib2
+import requests
+import urllib3
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2.service_account import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from sheet_grid import GRID_DECODE_ERRORS, as_grid, stream_grid
+from snapshot_io import load_snapshot, save_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Shared state (token bucket, last good snapshots) lives here so every process on the host sees it
+CACHE_DIR = os.environ.get("TIMETABLE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "timetable-cache"))
+
+# Sheets API allows 60 read requests per minute per user; stay a little below it
+REQUESTS_PER_MINUTE = float(os.environ.get("SHEETS_REQUESTS_PER_MINUTE", 50))
+BURST = 5
+TOKEN_TIMEOUT = 30.0
+
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.5
+MAX_DELAY = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SHEETS_API_ROOT = "https://sheets.googleapis.com/"
+DRIVE_API_ROOT = "https://www.googleapis.com/"
+READONLY_SCOPE = "https://www.googleapis.com/auth/spreadsheets.readonly"
+DRIVE_METADATA_SCOPE = "https://www.googleapis.com/auth/drive.metadata.readonly"
+# A small range (e.g. "Monday!A1:Z4") whose values change whenever the timetable does; unset uses Drive
+SENTINEL_RANGE = os.environ.get("TIMETABLE_SENTINEL_RANGE", "")
+PROBE_TIMEOUT = (5, 10)
+# Seconds to connect / between bytes of a download
+FETCH_TIMEOUT = (10, 60)
+
+# Everything the timetable reads from a spreadsheet
+GRID_FIELDS = "sheets(properties(title),data(rowData(values(formattedValue,effectiveFormat/backgroundColor))))"
+
+# Keep-alive connections per host kept by each session (sources are fetched in parallel)
+POOL_SIZE = 8
+# Google APIs only gzip responses for user agents that mention gzip
+USER_AGENT = "fcs-timetable (gzip)"
+
+# spreadsheet_id -> {'stale': bool, 'error': str, 'fetched_at': float}
+fetch_status = {}
+
+_clients_lock = threading.Lock()
+_credentials = {}  # (key, scopes) -> credentials
+_sessions = {}  # id(credentials) -> (credentials, session)
+_services = threading.local()  # discovery clients are not thread-safe, so one set per thread
+_probe_failed = set()  # spreadsheet ids whose probe was refused; they are always fetched in full
+
+
+class FetchError(Exception):
+    """Raised when the API keeps failing and no saved snapshot is available"""
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock on path shared by every process (and thread) on the host"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def try_file_lock(path):
+    """Like file_lock, but yields False at once instead of waiting when someone else holds it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a+') as f:
+        try:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            locked = True
+        except OSError:
+            locked = False
+        try:
+            yield locked
+        finally:
+            if locked and fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            elif locked:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def take_token(rate_per_minute=REQUESTS_PER_MINUTE, burst=BURST, timeout=TOKEN_TIMEOUT, bucket="sheets"):
+    """Take one request token from the host-wide bucket, waiting up to timeout seconds.
+
+    Returns False if no token became available in time.
+    """
+    state_path = os.path.join(CACHE_DIR, f"{bucket}.bucket")
+    refill_per_second = rate_per_minute / 60
+    deadline = time.monotonic() + timeout
+
+    while True:
+        with file_lock(state_path + ".lock"):
+            now = time.time()
+            try:
+                with open(state_path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {'tokens': burst, 'updated': now}
+
+            tokens = min(burst, state['tokens'] + max(0.0, now - state['updated']) * refill_per_second)
+            if tokens >= 1:
+                with open(state_path, 'w') as f:
+                    json.dump({'tokens': tokens - 1, 'updated': now}, f)
+                return True
+            wait = (1 - tokens) / refill_per_second
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(wait, remaining))
+
+
+def retry_after_seconds(error):
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None"""
+    value = error.resp.get('retry-after') if getattr(error, 'resp', None) is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+# Network failures worth retrying. Other errors (a missing credentials file, an
+# unwritable cache, 403/404) are permanent: fetch_spreadsheet stops retrying and
+# serves the last good copy, if there is one.
+NETWORK_ERRORS = (
+    ConnectionError, TimeoutError, socket.timeout, socket.gaierror,
+    requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+    urllib3.exceptions.ProtocolError, urllib3.exceptions.TimeoutError, httplib2.HttpLib2Error,
+)
+
+
+def is_transient(error):
+    """True for errors worth retrying: quota, server errors and network failures"""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status in RETRY_STATUSES:
+            return True
+        # Older quota errors come back as 403 rateLimitExceeded
+        return status == 403 and b'ateLimitExceeded' in (error.content or b'')
+    return isinstance(error, NETWORK_ERRORS)
+
+
+def backoff_delay(attempt, error=None, base=BASE_DELAY, cap=MAX_DELAY):
+    """Full-jitter exponential backoff, never shorter than what Retry-After asks for"""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    requested = retry_after_seconds(error) if isinstance(error, HttpError) else None
+    if requested is not None:
+        delay = max(delay, min(requested, cap))
+    return delay
+
+
+def last_good_path(spreadsheet_id):
+    return os.path.join(CACHE_DIR, f"{spreadsheet_id}.last-good.json.gz")
+
+
+def service_account_credentials(info=None, path=None, scopes=(READONLY_SCOPE, DRIVE_METADATA_SCOPE)):
+    """Service account credentials from key info (a dict) or a key file, built once per process"""
+    source = json.dumps(dict(info), sort_keys=True) if info is not None else os.path.abspath(path)
+    key = (hashlib.sha256(source.encode('utf-8')).hexdigest(), tuple(scopes))
+    with _clients_lock:
+        credentials = _credentials.get(key)
+        if credentials is None:
+            if info is not None:
+                credentials = Credentials.from_service_account_info(dict(info), scopes=list(scopes))
+            else:
+                credentials = Credentials.from_service_account_file(path, scopes=list(scopes))
+            _credentials[key] = credentials
+    return credentials
+
+
+def default_credentials(endpoint=""):
+    """Credentials when none are given: anonymous for a local stand-in, else application defaults"""
+    key = ('default', endpoint)
+    with _clients_lock:
+        credentials = _credentials.get(key)
+        if credentials is None:
+            credentials = AnonymousCredentials() if endpoint else google.auth.default(scopes=[READONLY_SCOPE, DRIVE_METADATA_SCOPE])[0]
+            _credentials[key] = credentials
+    return credentials
+
+
+def authorized_session(credentials):
+    """The keep-alive HTTP session for some credentials, shared by every thread.
+
+    The session refreshes the access token itself when it expires.
+    """
+    with _clients_lock:
+        entry = _sessions.get(id(credentials))
+        if entry is None or entry[0] is not credentials:
+            session = AuthorizedSession(credentials)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({'Accept-Encoding': 'gzip', 'User-Agent': USER_AGENT})
+            entry = _sessions[id(credentials)] = (credentials, session)
+    return entry[1]
+
+
+def build_service(credentials=None, endpoint=""):
+    """Sheets v4 client, built once per thread from the discovery document bundled with the library.
+
+    endpoint points it at a local stand-in such as fake_sheets.py.
+    """
+    credentials = credentials or default_credentials(endpoint)
+    services = _services.__dict__.setdefault('services', {})
+    key = (id(credentials), endpoint)
+    entry = services.get(key)
+    if entry is None or entry[0] is not credentials:
+        options = {'api_endpoint': endpoint} if endpoint else None
+        service = build('sheets', 'v4', credentials=credentials, client_options=options,
+                        static_discovery=True, cache_discovery=False)
+        entry = services[key] = (credentials, service)
+    return entry[1]
+
+
+def spreadsheet_grid_url(spreadsheet_id, endpoint=""):
+    """spreadsheets.get URL for the grid fields the timetable reads"""
+    query = urlencode({'includeGridData': 'true', 'fields': GRID_FIELDS, 'alt': 'json'})
+    return f"{(endpoint or SHEETS_API_ROOT).rstrip('/')}/v4/spreadsheets/{quote(spreadsheet_id, safe='')}?{query}"
+
+
+def stream_spreadsheet_grid(spreadsheet_id, credentials=None, endpoint=""):
+    """Download a spreadsheet's grid data, decoding it into a compact grid as it arrives.
+
+    The request is made directly rather than through the discovery client, whose method
+    docs alone take tens of megabytes to build.
+    """
+    session = authorized_session(credentials or default_credentials(endpoint))
+    url = spreadsheet_grid_url(spreadsheet_id, endpoint)
+
+    with session.get(url, stream=True, timeout=FETCH_TIMEOUT) as response:
+        if response.status_code >= 400:
+            # Same error as the client library raises, so retries and Retry-After work unchanged
+            headers = dict(response.headers, status=str(response.status_code))
+            raise HttpError(httplib2.Response(headers), response.content, uri=url)
+        response.raw.decode_content = True  # gunzip while reading
+        try:
+            grid = stream_grid(response.raw)
+        except (urllib3.exceptions.HTTPError,) + GRID_DECODE_ERRORS as e:
+            # A download cut short is retried like any other network failure
+            raise ConnectionError(f"Spreadsheet download failed: {e}") from e
+        # Read to the end so the connection goes back to the pool for the next fetch
+        response.raw.drain_conn()
+        response.raw.release_conn()
+        return grid
+
+
+def probe_spreadsheet_version(spreadsheet_id, credentials=None, endpoint=""):
+    """Cheap marker that changes whenever the spreadsheet is edited, or None if it cannot be read.
+
+    None means "unknown" and callers should fetch in full. A refused probe (e.g. the Drive
+    API is not enabled for the service account) is not retried for that spreadsheet.
+    """
+    if spreadsheet_id in _probe_failed:
+        return None
+    session = authorized_session(credentials or default_credentials(endpoint))
+    if SENTINEL_RANGE:
+        url = (f"{(endpoint or SHEETS_API_ROOT).rstrip('/')}/v4/spreadsheets/{quote(spreadsheet_id, safe='')}"
+               f"/values/{quote(SENTINEL_RANGE, safe='')}?fields=values")
+    else:
+        url = (f"{(endpoint or DRIVE_API_ROOT).rstrip('/')}/drive/v3/files/{quote(spreadsheet_id, safe='')}"
+               f"?fields=version,modifiedTime&supportsAllDrives=true")
+
+    try:
+        response = session.get(url, timeout=PROBE_TIMEOUT)
+    except requests.RequestException as e:
+        logger.info("Revision probe for %s failed: %s", spreadsheet_id, e)
+        return None
+    if response.status_code in (400, 401, 403, 404):
+        logger.warning("Revision probe for %s refused (%d); fetching in full from now on",
+                       spreadsheet_id, response.status_code)
+        _probe_failed.add(spreadsheet_id)
+        return None
+    if response.status_code != 200:
+        return None
+    if SENTINEL_RANGE:
+        return hashlib.sha256(response.content).hexdigest()[:16]
+    metadata = response.json()
+    return metadata.get('version') or metadata.get('modifiedTime')
+
+
+def fetch_spreadsheet(spreadsheet_id, credentials=None, endpoint="", max_attempts=MAX_ATTEMPTS):
+    """Fetch a spreadsheet's compact grid, retrying transient errors within the shared quota.
+
+    Falls back to the last good snapshot on disk when every attempt fails, or at once on
+    a permanent error; in that case fetch_status[spreadsheet_id]['stale'] is set so
+    callers can tell the user.
+    """
+    last_error = None
+    for attempt in range(max_attempts):
+        try:
+            got_token = take_token()
+        except OSError as e:  # the quota state in the cache cannot be written
+            last_error = e
+            break
+        if not got_token:
+            last_error = FetchError("Sheets API quota exhausted on this host")
+            break
+
+        try:
+            spreadsheet = stream_spreadsheet_grid(spreadsheet_id, credentials, endpoint)
+        except Exception as e:
+            last_error = e
+            if not is_transient(e):
+                break
+            if attempt + 1 < max_attempts:
+                delay = backoff_delay(attempt, e)
+                logger.warning("Sheets fetch attempt %d failed (%s); retrying in %.1fs", attempt + 1, e, delay)
+                time.sleep(delay)
+            continue
+
+        try:
+            save_snapshot(spreadsheet, last_good_path(spreadsheet_id))
+        except OSError as e:
+            logger.warning("Could not save last good snapshot: %s", e)
+        fetch_status[spreadsheet_id] = {'stale': False, 'error': '', 'fetched_at': time.time()}
+        return spreadsheet
+
+    path = last_good_path(spreadsheet_id)
+    if os.path.exists(path):
+        logger.warning("Sheets fetch failed (%s); serving last good snapshot", last_error)
+        fetch_status[spreadsheet_id] = {'stale': True, 'error': str(last_error),
+                                        'fetched_at': os.path.getmtime(path)}
+        # Copies saved before grids were kept are full API responses
+        return as_grid(load_snapshot(path))
+
+    raise FetchError(f"Could not fetch spreadsheet: {last_error}") from last_error
@@ -0,0 +1,23 @@
+import gzip
+import json
+import os
+
+
+def load_snapshot(path):
+    """Load a saved spreadsheet response (plain or gzipped JSON) from disk"""
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_snapshot(spreadsheet, path):
+    """Write a spreadsheet response to disk atomically so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(spreadsheet, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return path
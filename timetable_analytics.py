@@ -0,0 +1,129 @@
+"""Room utilisation and load analytics over the compiled session index.
+
+Everything is computed with vectorized pandas groupby/pivot operations on one
+DataFrame of sessions, so a full report takes a few milliseconds and can be rebuilt
+for every snapshot.
+
+    python timetable_analytics.py --snapshot saved.json
+"""
+import argparse
+
+import pandas as pd
+
+from snapshot_io import load_snapshot
+from timetable_index import TIMETABLE_SHEETS, compile_index
+
+# Rooms used for less than this share of their slots are reported as underused
+UNDERUSED_SHARE = 0.25
+# Slots using at least this share of the rooms of their type are reported as overloaded
+OVERLOADED_SHARE = 0.9
+
+FRAME_COLUMNS = ['source', 'day', 'room', 'type', 'time_slot', 'header_slot', 'start', 'end',
+                 'course', 'department', 'section', 'batch']
+
+
+def sessions_frame(index):
+    """DataFrame of the classes that have a known room and time.
+
+    Only sessions painted in a batch colour are classes; header and label cells
+    (the 'Lab' time-header row, room names) would otherwise count as bookings.
+    """
+    frame = pd.DataFrame.from_records(index['sessions'], columns=FRAME_COLUMNS)
+    frame = frame[frame['batch'].astype(bool)]
+    frame = frame[frame['room'].notna() & (frame['room'] != "Unknown") & frame['start'].notna()]
+    frame = frame.astype({'start': 'int32', 'end': 'float64'})
+    for column in ('source', 'room', 'type', 'time_slot', 'department', 'section', 'batch'):
+        frame[column] = frame[column].astype('category')
+    frame['day'] = pd.Categorical(frame['day'], categories=TIMETABLE_SHEETS, ordered=True)
+    # One label per teaching slot: '08:30-09:50' (embedded times still sort by start)
+    frame['slot'] = frame['time_slot'].astype(str)
+    return frame
+
+
+def occupancy_matrix(frame):
+    """Room x (day, slot) table of how many sessions are booked (0 free, 1 used, 2+ double-booked)"""
+    if frame.empty:
+        return pd.DataFrame()
+    slot_order = frame.groupby('slot', observed=True)['start'].min().sort_values().index
+    matrix = frame.groupby(['source', 'room', 'day', 'slot'], observed=True).size() \
+        .unstack(['day', 'slot'], fill_value=0)
+    # Weekday order, then slots by start time; (day, slot) pairs that never occur are left out
+    columns = [(day, slot) for day in TIMETABLE_SHEETS for slot in slot_order if (day, slot) in matrix.columns]
+    return matrix.reindex(columns=pd.MultiIndex.from_tuples(columns, names=['day', 'slot']))
+
+
+def available_slots(frame):
+    """Distinct (day, slot) pairs per source and session type: the slots a room of that type can hold"""
+    return frame.drop_duplicates(['source', 'type', 'day', 'slot']) \
+        .groupby(['source', 'type'], observed=True).size().rename('available_slots')
+
+
+def room_utilisation(frame):
+    """Per room: booked slots, available slots and utilisation share, busiest first"""
+    if frame.empty:
+        return pd.DataFrame(columns=['source', 'room', 'type', 'booked_slots', 'available_slots', 'utilisation'])
+    booked = frame.drop_duplicates(['source', 'room', 'day', 'slot']) \
+        .groupby(['source', 'room', 'type'], observed=True).size().rename('booked_slots').reset_index()
+    # A room listed under both classes and labs counts against its most common type
+    booked = booked.sort_values('booked_slots', ascending=False).drop_duplicates(['source', 'room'])
+    booked = booked.merge(available_slots(frame).reset_index(), on=['source', 'type'], how='left')
+    booked['utilisation'] = (booked['booked_slots'] / booked['available_slots']).round(3)
+    return booked.sort_values(['utilisation', 'room'], ascending=[False, True]).reset_index(drop=True)
+
+
+def slot_load(frame):
+    """Per (day, slot, type): rooms in use, rooms of that type and the share in use"""
+    if frame.empty:
+        return pd.DataFrame(columns=['source', 'day', 'slot', 'type', 'rooms_in_use', 'rooms', 'load'])
+    rooms_per_type = frame.groupby(['source', 'type'], observed=True)['room'].nunique().rename('rooms')
+    load = frame.groupby(['source', 'day', 'slot', 'type'], observed=True).agg(
+        rooms_in_use=('room', 'nunique'), sessions=('room', 'size'), start=('start', 'min')
+    ).reset_index()
+    load = load.merge(rooms_per_type.reset_index(), on=['source', 'type'], how='left')
+    load['load'] = (load['rooms_in_use'] / load['rooms']).round(3)
+    return load.sort_values(['source', 'day', 'start', 'type']).drop(columns='start').reset_index(drop=True)
+
+
+def peak_hours(frame):
+    """Busiest slots of the week, by sessions running at once"""
+    load = slot_load(frame)
+    if load.empty:
+        return load
+    return load.sort_values(['sessions', 'load'], ascending=False).reset_index(drop=True)
+
+
+def utilisation_report(index, underused_share=UNDERUSED_SHARE, overloaded_share=OVERLOADED_SHARE):
+    """All analytics for one index, as DataFrames"""
+    frame = sessions_frame(index)
+    utilisation = room_utilisation(frame)
+    load = slot_load(frame)
+    return {
+        'revision': index.get('revision'),
+        'sessions': len(frame),
+        'occupancy': occupancy_matrix(frame),
+        'room_utilisation': utilisation,
+        'slot_load': load,
+        'peak_hours': peak_hours(frame).head(10),
+        'overloaded_slots': load[load['load'] >= overloaded_share].reset_index(drop=True),
+        'underused_rooms': utilisation[utilisation['utilisation'] < underused_share].reset_index(drop=True),
+        'busiest_days': frame.groupby('day', observed=True).size().rename('sessions').reset_index(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Room utilisation report for a saved timetable")
+    parser.add_argument("--snapshot", required=True, help="saved spreadsheets.get response (.json or .json.gz)")
+    parser.add_argument("--underused", type=float, default=UNDERUSED_SHARE, help="underused room threshold (0-1)")
+    parser.add_argument("--overloaded", type=float, default=OVERLOADED_SHARE, help="overloaded slot threshold (0-1)")
+    args = parser.parse_args()
+
+    report = utilisation_report(compile_index(load_snapshot(args.snapshot)), args.underused, args.overloaded)
+    pd.set_option('display.width', 160)
+    print(f"{report['sessions']} sessions with a room and time\n")
+    print("Peak hours:\n", report['peak_hours'].to_string(index=False), "\n")
+    print("Overloaded slots:\n", report['overloaded_slots'].to_string(index=False), "\n")
+    print("Underused rooms:\n", report['underused_rooms'].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""Read-only JSON HTTP API over the compiled timetable, for other campus tools.
+
+Every response that does not depend on a user's selection (batches, course catalogue,
+batch/section timetables, free rooms) is serialised once per snapshot revision, so a
+request is a dictionary lookup plus a write. Responses carry an ETag (the revision) and
+Last-Modified (when the revision was first served) and conditional requests get a 304.
+
+    GET /batches
+    GET /courses
+    GET /timetable?batch=BS CS (2024)&section=A
+    GET /custom?course=<id>&course=<id>           (ids from /courses)
+    GET /free-rooms?day=Monday[&time=08:30-09:50]
+    GET /free-time?batch=BS CS (2024)&section=A&batch=BS SE (2023)&section=B[&course=<id>...]
+    GET /health
+
+    python timetable_api.py --snapshot saved.json --port 8080
+    python timetable_api.py --spreadsheet-id <id> --credentials service-account.json --refresh 300
+"""
+import argparse
+import gzip
+import json
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from timetable_index import (
+    TIMETABLE_SHEETS, batch_sections, batch_sections_entries, course_id, custom_timetable_entries, timetable_rows
+)
+from timetable_integrity import session_interval
+from timetable_free_time import common_free_time, format_minutes
+
+# Custom selections are built on demand; this many are kept per revision
+CUSTOM_CACHE_SIZE = 1024
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+
+
+def free_rooms(index):
+    """{day: [{'time', 'type', 'start', 'free': [rooms]}]} for every teaching slot of the week.
+
+    Slots are the header times of the sheet (class and lab slots separately); a room is free
+    in a slot when none of its sessions overlap it.
+    """
+    rooms = {}  # (source, type) -> rooms of that type
+    busy = {}  # (source, day, room) -> [(start, end)]
+    slots = {}  # day -> {(source, type, header slot): (start, end)}
+    for session in index['sessions']:
+        room = session['room']
+        if not room or room == "Unknown":
+            continue
+        rooms.setdefault((session['source'], session['type']), set()).add(room)
+        interval = session_interval(session)
+        if interval is None:
+            continue
+        busy.setdefault((session['source'], session['day'], room), []).append(interval)
+        if not session['embedded']:
+            slots.setdefault(session['day'], {})[(session['source'], session['type'], session['header_slot'])] = interval
+
+    result = {}
+    for day in TIMETABLE_SHEETS:
+        day_slots = []
+        for (source, session_type, header_slot), (start, end) in sorted(slots.get(day, {}).items(),
+                                                                         key=lambda item: (item[1][0], item[0])):
+            free = sorted(room for room in rooms[(source, session_type)]
+                          if not any(s < end and start < e for s, e in busy.get((source, day, room), ())))
+            slot = {'time': header_slot, 'type': session_type, 'start': start, 'free': free}
+            if source:
+                slot['source'] = source
+            day_slots.append(slot)
+        result[day] = day_slots
+    return result
+
+
+def encode(payload):
+    """(body, gzipped body or None) for a JSON payload"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, gzip.compress(body, 5) if len(body) >= GZIP_MIN_SIZE else None
+
+
+def build_responses(index, loaded_at=None):
+    """Everything the API serves for one index, serialised once"""
+    revision = index['revision']
+    sections = batch_sections(index)
+    courses = [dict(course, id=course_id(course)) for course in index['courses']]
+
+    batches = [{'name': batch, 'source': index['batch_sources'].get(batch, ''), 'sections': sections.get(batch, [])}
+               for batch in index['batches']]
+
+    timetables = {}
+    for batch, batch_section_list in sections.items():
+        for section, timetable in (batch_sections_entries(index, batch, batch_section_list) or {}).items():
+            timetables[(batch, section)] = encode({'revision': revision, 'batch': batch, 'section': section,
+                                                   'sessions': timetable_rows(timetable)})
+
+    rooms_by_day = free_rooms(index)
+    free = {}
+    for day, day_slots in rooms_by_day.items():
+        free[(day, None)] = encode({'revision': revision, 'day': day, 'slots': day_slots})
+        for slot in day_slots:
+            # Class and lab slots can share a time; both are returned
+            free.setdefault((day, slot['time']), []).append(slot)
+    for key, value in list(free.items()):
+        if key[1] is not None:
+            free[key] = encode({'revision': revision, 'day': key[0], 'slots': value})
+
+    return {
+        'index': index,
+        'revision': revision,
+        'etag': f'"{revision}"',
+        'last_modified': loaded_at or time.time(),
+        'courses_by_id': {course['id']: course for course in courses},
+        'static': {
+            '/batches': encode({'revision': revision, 'batches': batches}),
+            '/courses': encode({'revision': revision, 'courses': courses}),
+            '/health': encode({'revision': revision, 'sessions': len(index['sessions'])}),
+        },
+        'timetables': timetables,
+        'free_rooms': free,
+        'custom': OrderedDict(),
+        'custom_lock': threading.Lock(),
+    }
+
+
+def custom_response(state, ids):
+    """Custom timetable for some course ids, cached per revision; None if an id is unknown"""
+    key = tuple(sorted(set(ids)))
+    with state['custom_lock']:
+        if key in state['custom']:
+            state['custom'].move_to_end(key)
+            return state['custom'][key]
+
+    selected = [state['courses_by_id'].get(course) for course in key]
+    if not selected or None in selected:
+        return None
+    rows = timetable_rows(custom_timetable_entries(state['index'], selected))
+    response = encode({'revision': state['revision'], 'courses': list(key), 'sessions': rows})
+    with state['custom_lock']:
+        state['custom'][key] = response
+        while len(state['custom']) > CUSTOM_CACHE_SIZE:
+            state['custom'].popitem(last=False)
+    return response
+
+
+def free_time_response(state, query):
+    """Common free windows of some batch/section pairs and course ids; None if any is unknown"""
+    pairs = list(zip(query.get('batch', []), [section.strip().upper() for section in query.get('section', [])]))
+    courses = [state['courses_by_id'].get(course) for course in query.get('course', [])]
+    if not pairs and not courses or None in courses:
+        return None
+    try:
+        # Cached per revision and set of inputs by timetable_free_time
+        free_time = common_free_time(state['index'], pairs, [courses])
+    except ValueError:
+        return None
+    return encode({'revision': state['revision'],
+                   'sections': [{'batch': batch, 'section': section} for batch, section in pairs],
+                   'courses': query.get('course', []),
+                   'days': {day: [{'start': format_minutes(start), 'end': format_minutes(end)}
+                                  for start, end in windows]
+                            for day, windows in free_time.items()}})
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    """Serves the precomputed responses of server.state"""
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in one write (flushed after each request) without Nagle delays
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        query = parse_qs(url.query)
+
+        if path in state['static']:
+            response = state['static'][path]
+        elif path == '/timetable':
+            key = (query.get('batch', [''])[0], query.get('section', [''])[0].strip().upper())
+            response = state['timetables'].get(key)
+        elif path == '/custom':
+            response = custom_response(state, query.get('course', []))
+        elif path == '/free-time':
+            response = free_time_response(state, query)
+        elif path == '/free-rooms':
+            key = (query.get('day', [''])[0].strip().capitalize(), query.get('time', [None])[0])
+            response = state['free_rooms'].get(key)
+        else:
+            self._send_error(404, "Unknown endpoint")
+            return
+
+        if response is None:
+            self._send_error(404, "Not found")
+        elif self.not_modified(state):
+            self._send(304, None, state)
+        else:
+            self._send(200, response, state)
+
+    def not_modified(self, state):
+        etag = self.headers.get('If-None-Match')
+        if etag is not None:
+            return etag == '*' or state['etag'] in [tag.strip().removeprefix('W/') for tag in etag.split(',')]
+        since = self.headers.get('If-Modified-Since')
+        if since:
+            try:
+                return parsedate_to_datetime(since).timestamp() >= int(state['last_modified'])
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _send(self, status, response, state):
+        body = b''
+        self.send_response(status)
+        self.send_header('ETag', state['etag'])
+        self.send_header('Last-Modified', formatdate(state['last_modified'], usegmt=True))
+        self.send_header('Cache-Control', 'public, max-age=60')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if response is not None:
+            body, body_gzip = response
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            if body_gzip is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = body_gzip
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        body = json.dumps({'error': {'code': status, 'message': message}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Access logs at thousands of requests per second are not useful
+        pass
+
+
+def update_index(server, index):
+    """Serve a new index; responses are only rebuilt when the revision changed"""
+    if server.state is None or server.state['revision'] != index['revision']:
+        # Swapped in one assignment, so requests see either the old or the new responses
+        server.state = build_responses(index)
+
+
+def serve(index, host="127.0.0.1", port=0, load=None, refresh=300):
+    """Start the API in a background thread and return the server.
+
+    With ``load`` (a function returning the current index) the index is reloaded every
+    ``refresh`` seconds; ``server.endpoint`` is the base URL.
+    """
+    server = ThreadingHTTPServer((host, port), _ApiHandler)
+    server.daemon_threads = True
+    server.state = None
+    update_index(server, index)
+    server.endpoint = f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+    thread = threading.Thread(target=server.serve_forever, name="timetable-api", daemon=True)
+    thread.start()
+
+    if load is not None:
+        def reload_forever():
+            while True:
+                time.sleep(refresh)
+                try:
+                    update_index(server, load())
+                except Exception as e:
+                    # Keep serving the last good responses
+                    print(f"Timetable reload failed: {e}")
+
+        threading.Thread(target=reload_forever, name="timetable-api-reload", daemon=True).start()
+    return server
+
+
+def main():
+    from export_timetables import add_source_arguments, load_spreadsheet
+    from timetable_index import compile_index
+    from sheets_client import probe_spreadsheet_version, service_account_credentials
+    from timetable_sources import load_index, normalize_sources
+
+    parser = argparse.ArgumentParser(description="Serve the timetable as a read-only JSON API")
+    add_source_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--refresh", type=int, default=300, help="seconds between spreadsheet reloads")
+    args = parser.parse_args()
+
+    load = None
+    if args.snapshot:
+        index = compile_index(load_spreadsheet(args.snapshot))
+    else:
+        sources = normalize_sources([], f"https://docs.google.com/spreadsheets/d/{args.spreadsheet_id}/edit")
+        creds = service_account_credentials(path=args.credentials) if args.credentials else None
+
+        def load():
+            # The full spreadsheet is only downloaded when the probe says it was edited
+            return load_index(sources, lambda url: load_spreadsheet(spreadsheet_id=args.spreadsheet_id,
+                                                                   credentials=args.credentials),
+                              ttl=args.refresh,
+                              probe=lambda url: probe_spreadsheet_version(args.spreadsheet_id, creds))
+        index = load()
+
+    server = serve(index, args.host, args.port, load, args.refresh)
+    print(f"Timetable API listening on {server.endpoint} (revision {index['revision']})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
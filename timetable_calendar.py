@@ -0,0 +1,178 @@
+"""iCalendar (.ics) export of batch and custom timetables.
+
+Each timetable row becomes one weekly recurring event (RRULE:FREQ=WEEKLY) starting in
+the first week of term, with times from the sheet's 'HH:MM-HH:MM' slots. Calendars are
+produced as a generator of folded CRLF lines, so bulk exports write each file as it is
+generated instead of building one big string:
+
+    python timetable_calendar.py --snapshot saved.json --out site/calendars --term-start 2025-09-01
+
+Settings (environment):
+TIMETABLE_TERM_START - first day of term (YYYY-MM-DD); defaults to the Monday of the current week
+TIMETABLE_TERM_WEEKS - number of teaching weeks (default 16)
+TIMETABLE_TIMEZONE - IANA zone for event times (e.g. Asia/Karachi); floating local times when unset
+"""
+import argparse
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from extract_timetable import slot_minutes
+from timetable_index import (
+    TIMETABLE_SHEETS, batch_sections, batch_sections_entries, batch_timetable_entries, custom_timetable_entries,
+    fingerprint, timetable_rows
+)
+from timetable_integrity import DEFAULT_DURATION
+
+TERM_START = os.environ.get("TIMETABLE_TERM_START", "")
+TERM_WEEKS = int(os.environ.get("TIMETABLE_TERM_WEEKS", "16"))
+TIMEZONE = os.environ.get("TIMETABLE_TIMEZONE", "")
+
+PRODUCT_ID = "-//FAST-NUCES FCS//Timetable System//EN"
+
+
+def term_start_date(term_start=None):
+    """First day of term as a date (TIMETABLE_TERM_START, or the Monday of this week)"""
+    term_start = term_start or TERM_START
+    if term_start:
+        return date.fromisoformat(str(term_start))
+    today = date.today()
+    return today - timedelta(days=today.weekday())
+
+
+def escape_text(value):
+    """Escape a TEXT property value (RFC 5545 3.3.11)"""
+    return str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def fold_line(line):
+    """Content line folded at 75 octets, CRLF terminated"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74  # continuation lines start with a space
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def local_time(day_date, minutes):
+    return datetime(day_date.year, day_date.month, day_date.day, minutes // 60, minutes % 60)
+
+
+def row_event(row, calendar_name, first_day, weeks, stamp):
+    """Property lines of one weekly event for a timetable row, or None when it has no usable time"""
+    if row['day'] not in TIMETABLE_SHEETS:
+        return None
+    start, end = slot_minutes(row['time'])
+    if start is None:
+        return None
+    if end is None or end <= start:
+        end = start + DEFAULT_DURATION
+
+    # First occurrence: the row's weekday in the first week of term
+    weekday = TIMETABLE_SHEETS.index(row['day'])
+    day_date = first_day + timedelta(days=(weekday - first_day.weekday()) % 7)
+    time_zone = f";TZID={TIMEZONE}" if TIMEZONE else ""
+
+    description = [row['type']]
+    if row.get('section'):
+        description.append(f"Section {row['section']}, {row['batch']}")
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{fingerprint(calendar_name, row['day'], row['time'], row['room'], row['course'])}@fcs-timetable",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART{time_zone}:{local_time(day_date, start):%Y%m%dT%H%M%S}",
+        f"DTEND{time_zone}:{local_time(day_date, end):%Y%m%dT%H%M%S}",
+        f"RRULE:FREQ=WEEKLY;COUNT={weeks}",
+        f"SUMMARY:{escape_text(row['course'])}",
+        f"LOCATION:{escape_text(row['room'])}",
+        f"DESCRIPTION:{escape_text(' - '.join(description))}",
+        f"CATEGORIES:{escape_text(row['type'])}",
+        "END:VEVENT",
+    ]
+
+
+def iter_calendar(rows, calendar_name, term_start=None, weeks=None):
+    """Lines of a VCALENDAR for timetable rows, generated one at a time"""
+    first_day = term_start_date(term_start)
+    weeks = weeks or TERM_WEEKS
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    for line in ("BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODUCT_ID}", "CALSCALE:GREGORIAN",
+                 "METHOD:PUBLISH", f"X-WR-CALNAME:{escape_text(calendar_name)}"):
+        yield fold_line(line)
+    if TIMEZONE:
+        yield fold_line(f"X-WR-TIMEZONE:{TIMEZONE}")
+    for row in rows:
+        event = row_event(row, calendar_name, first_day, weeks, stamp)
+        for line in event or ():
+            yield fold_line(line)
+    yield fold_line("END:VCALENDAR")
+
+
+def batch_calendar(index, batch, section, term_start=None, weeks=None):
+    """Calendar lines for a batch + section, or None for an unknown batch"""
+    timetable = batch_timetable_entries(index, batch, section)
+    if timetable is None:
+        return None
+    return iter_calendar(timetable_rows(timetable), f"{batch} - Section {section}", term_start, weeks)
+
+
+def custom_calendar(index, selected_courses, term_start=None, weeks=None):
+    """Calendar lines for a custom course selection"""
+    rows = timetable_rows(custom_timetable_entries(index, selected_courses))
+    return iter_calendar(rows, "My Timetable", term_start, weeks)
+
+
+def calendar_bytes(lines):
+    """A whole calendar as UTF-8 bytes (for downloads)"""
+    return "".join(lines).encode('utf-8')
+
+
+def write_calendar(path, lines):
+    """Write calendar lines to a file as they are generated"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for line in lines:
+            f.write(line)
+
+
+def iter_section_calendars(index, term_start=None, weeks=None):
+    """(batch, section, calendar lines) for every section of every batch"""
+    for batch, sections in batch_sections(index).items():
+        # All sections of a batch are selected in one pass over the sessions
+        for section, timetable in (batch_sections_entries(index, batch, sections) or {}).items():
+            yield batch, section, iter_calendar(timetable_rows(timetable), f"{batch} - Section {section}",
+                                                term_start, weeks)
+
+
+def main():
+    from export_timetables import add_source_arguments, load_spreadsheet, slugify
+    from timetable_index import compile_index
+
+    parser = argparse.ArgumentParser(description="Write an .ics calendar for every batch/section timetable")
+    add_source_arguments(parser)
+    parser.add_argument("--out", default="calendars", help="output directory")
+    parser.add_argument("--term-start", default=None, help="first day of term (YYYY-MM-DD)")
+    parser.add_argument("--weeks", type=int, default=None, help=f"teaching weeks (default {TERM_WEEKS})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = compile_index(load_spreadsheet(args.snapshot, args.spreadsheet_id, args.credentials))
+    count = 0
+    for batch, section, lines in iter_section_calendars(index, args.term_start, args.weeks):
+        directory = os.path.join(args.out, slugify(batch))
+        os.makedirs(directory, exist_ok=True)
+        write_calendar(os.path.join(directory, f"{slugify(section)}.ics"), lines)
+        count += 1
+    print(f"✅ Wrote {count} calendars to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
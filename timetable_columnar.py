@@ -0,0 +1,158 @@
+"""Columnar (Arrow) copy of a compiled session index.
+
+Sessions are written as an Arrow IPC file with dictionary-encoded string columns, plus
+the rest of the index (batch colours, row hashes...) as JSON in the schema metadata.
+A new worker memory-maps the file and rebuilds the index without fetching or parsing
+the spreadsheet, and the same file loads straight into a pandas DataFrame (dictionary
+columns become categoricals):
+
+    python timetable_columnar.py --snapshot saved.json --out sessions.arrow [--parquet sessions.parquet]
+    pd.read_feather("sessions.arrow")
+"""
+import argparse
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from snapshot_io import load_snapshot
+from timetable_index import build_course_catalogue, build_section_catalogue, compile_index
+
+# Columns with few distinct values are dictionary encoded (categoricals in pandas)
+CATEGORY_COLUMNS = ['source', 'day', 'room', 'listed_room', 'type', 'course', 'department', 'section', 'batch',
+                    'color', 'header_slot', 'time_slot']
+TEXT_COLUMNS = ['text', 'cleaned']
+INT_COLUMNS = ['row', 'col', 'rank', 'start', 'end']
+BOOL_COLUMNS = ['embedded']
+
+SESSION_SCHEMA = pa.schema(
+    [pa.field(name, pa.dictionary(pa.int32(), pa.string())) for name in CATEGORY_COLUMNS] +
+    [pa.field(name, pa.string()) for name in TEXT_COLUMNS] +
+    [pa.field(name, pa.int32()) for name in INT_COLUMNS] +
+    [pa.field(name, pa.bool_()) for name in BOOL_COLUMNS]
+)
+INDEX_METADATA_KEY = b'timetable_index'
+
+
+def sessions_table(index):
+    """Arrow table of an index's sessions; everything else goes into the schema metadata"""
+    sessions = index['sessions']
+    columns = []
+    for field in SESSION_SCHEMA:
+        values = [session[field.name] for session in sessions]
+        if field.name in CATEGORY_COLUMNS:
+            columns.append(pa.array(values, pa.string()).dictionary_encode())
+        else:
+            columns.append(pa.array(values, field.type))
+
+    # Row hashes per sheet, with each row's session count, so incremental compiles keep working
+    sheets = {
+        source: {day: {'layout': sheet['layout'], 'rows': [[row_hash, len(row_sessions)]
+                                                           for row_hash, row_sessions in sheet['rows']]}
+                 for day, sheet in days.items()}
+        for source, days in index.get('sheets', {}).items()
+    }
+    metadata = {key: index[key] for key in ('revision', 'sources', 'batch_colors', 'batches', 'batch_sources', 'days')}
+    metadata['sheets'] = sheets
+    metadata['color_problems'] = index.get('color_problems', [])
+    if 'parts' in index:
+        metadata['parts'] = index['parts']
+
+    schema = SESSION_SCHEMA.with_metadata({INDEX_METADATA_KEY: json.dumps(metadata, separators=(',', ':'))})
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def write_index(index, path):
+    """Write an index as an uncompressed Arrow file (atomically), so readers can memory-map it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    table = sessions_table(index)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_parquet(index, path):
+    """Write the sessions as Parquet (dictionary encoded, compressed) for offline analysis"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    pq.write_table(sessions_table(index), path, use_dictionary=True, compression='zstd')
+    return path
+
+
+def read_table(path):
+    """Memory-map an Arrow file written by write_index (no copy of the column data)"""
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def table_sessions(table):
+    """Session dicts from a sessions table; each distinct string becomes one shared object"""
+    columns = []
+    for name in table.column_names:
+        column = table.column(name).combine_chunks()
+        if pa.types.is_dictionary(column.type):
+            values = column.dictionary.to_pylist()
+            columns.append([values[i] if i is not None else None for i in column.indices.to_pylist()])
+        else:
+            columns.append(column.to_pylist())
+    return [dict(zip(table.column_names, row)) for row in zip(*columns)]
+
+
+def read_index(path):
+    """Rebuild a session index from an Arrow file written by write_index"""
+    table = read_table(path)
+    metadata = json.loads(table.schema.metadata[INDEX_METADATA_KEY])
+    sessions = table_sessions(table)
+
+    # Sessions are stored sheet by sheet and row by row, so the row counts split them back up
+    sheets = {}
+    position = 0
+    for source, days in metadata['sheets'].items():
+        sheets[source] = {}
+        for day, sheet in days.items():
+            rows = []
+            for row_hash, count in sheet['rows']:
+                rows.append((row_hash, sessions[position:position + count]))
+                position += count
+            sheets[source][day] = {'layout': sheet['layout'], 'rows': rows}
+
+    index = {key: metadata[key] for key in ('revision', 'sources', 'batch_colors', 'batches', 'batch_sources', 'days')}
+    index.update({'sheets': sheets, 'sessions': sessions, 'courses': build_course_catalogue(sessions),
+                  'color_problems': metadata.get('color_problems', [])})
+    if 'parts' in metadata:
+        index['parts'] = metadata['parts']
+    index['sections'] = build_section_catalogue(index)
+    return index
+
+
+def read_sessions_frame(path):
+    """Sessions as a pandas DataFrame (Arrow or Parquet file)"""
+    if str(path).endswith('.parquet'):
+        return pq.read_table(path).to_pandas()
+    return read_table(path).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export compiled timetable sessions to Arrow/Parquet")
+    parser.add_argument("--snapshot", required=True, help="saved spreadsheets.get response (.json or .json.gz)")
+    parser.add_argument("--source", default="", help="source name (only when several spreadsheets are served)")
+    parser.add_argument("--out", default="sessions.arrow", help="Arrow file to write")
+    parser.add_argument("--parquet", help="also write a Parquet file")
+    args = parser.parse_args()
+
+    index = compile_index(load_snapshot(args.snapshot), args.source)
+    write_index(index, args.out)
+    print(f"Wrote {len(index['sessions'])} sessions to {args.out}")
+    if args.parquet:
+        write_parquet(index, args.parquet)
+        print(f"Wrote {args.parquet}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Differences between two compiled timetable indexes ("what changed since last time").
+
+Sessions are compared by key instead of rendering timetables: only rows whose hash
+differs between the two indexes are looked at, and within those a session is identified
+by what it is (batch, course text, type) and placed by when and where it happens
+(day, time slot, room). A session that keeps its identity but changes place is a move.
+"""
+from extract_timetable import section_patterns_for, clean_class_entry
+from timetable_index import select_batch_sessions, course_matches_session
+
+NO_CHANGES = {'added': [], 'removed': [], 'moved': []}
+
+
+def session_identity(session):
+    """What a session is; unchanged when it only moves to another room or slot"""
+    return (session['source'], session['batch'], session['cleaned'].strip(), session['type'])
+
+
+def session_place(session):
+    """When and where a session happens"""
+    return (session['day'], session['time_slot'], session['room'])
+
+
+def changed_sessions(old_index, new_index):
+    """Sessions from rows that differ between two indexes, as (old_sessions, new_sessions).
+
+    Rows with the same hash at the same position compile to the same sessions, so they
+    cannot contribute to a diff. A sheet whose layout changed is compared in full.
+    """
+    old_sessions, new_sessions = [], []
+    old_sheets, new_sheets = old_index.get('sheets', {}), new_index.get('sheets', {})
+    for source in list(dict.fromkeys(list(old_sheets) + list(new_sheets))):
+        old_days, new_days = old_sheets.get(source, {}), new_sheets.get(source, {})
+        for day in list(dict.fromkeys(list(old_days) + list(new_days))):
+            old_rows = old_days[day]['rows'] if day in old_days else []
+            new_rows = new_days[day]['rows'] if day in new_days else []
+            same_layout = day in old_days and day in new_days and old_days[day]['layout'] == new_days[day]['layout']
+
+            for position in range(max(len(old_rows), len(new_rows))):
+                old_row = old_rows[position] if position < len(old_rows) else (None, [])
+                new_row = new_rows[position] if position < len(new_rows) else (None, [])
+                if same_layout and old_row[0] == new_row[0]:
+                    continue
+                old_sessions.extend(old_row[1])
+                new_sessions.extend(new_row[1])
+    return old_sessions, new_sessions
+
+
+def diff_sessions(old_sessions, new_sessions):
+    """Keyed comparison: {'added': [...], 'removed': [...], 'moved': [(old, new), ...]}"""
+    old_places = {}
+    for session in old_sessions:
+        old_places.setdefault(session_identity(session), {}).setdefault(session_place(session), []).append(session)
+    new_places = {}
+    for session in new_sessions:
+        new_places.setdefault(session_identity(session), {}).setdefault(session_place(session), []).append(session)
+
+    added, removed, moved = [], [], []
+    for identity in list(dict.fromkeys(list(old_places) + list(new_places))):
+        old_by_place = old_places.get(identity, {})
+        new_by_place = new_places.get(identity, {})
+
+        # Sessions still at the same place are unchanged; the rest were added, removed or moved
+        gone, came = [], []
+        for place in list(dict.fromkeys(list(old_by_place) + list(new_by_place))):
+            before, after = old_by_place.get(place, []), new_by_place.get(place, [])
+            kept = min(len(before), len(after))
+            gone.extend(before[kept:])
+            came.extend(after[kept:])
+
+        # Pair leftovers as moves, preferring moves within the same day
+        came.sort(key=lambda s: (s['day'], s['time_slot'], str(s['room'])))
+        for old in sorted(gone, key=lambda s: (s['day'], s['time_slot'], str(s['room']))):
+            match = next((new for new in came if new['day'] == old['day']), came[0] if came else None)
+            if match is None:
+                removed.append(old)
+            else:
+                came.remove(match)
+                moved.append((old, match))
+        added.extend(came)
+
+    return {'added': added, 'removed': removed, 'moved': moved}
+
+
+def has_changes(changes):
+    return bool(changes['added'] or changes['removed'] or changes['moved'])
+
+
+def diff_batch(old_index, new_index, user_batch, user_section):
+    """Changes to one batch + section between two indexes"""
+    if old_index.get('revision') == new_index.get('revision'):
+        return NO_CHANGES
+    old_sessions, new_sessions = changed_sessions(old_index, new_index)
+    # Each side uses its own batch colour, in case the legend was repainted
+    return diff_sessions(select_batch_sessions(old_index, user_batch, user_section, old_sessions),
+                         select_batch_sessions(new_index, user_batch, user_section, new_sessions))
+
+
+def diff_custom(old_index, new_index, selected_courses):
+    """Changes per selected course between two indexes, as [(course, changes)] for changed courses only"""
+    if old_index.get('revision') == new_index.get('revision') or not selected_courses:
+        return []
+    old_sessions, new_sessions = changed_sessions(old_index, new_index)
+    result = []
+    for course in selected_courses:
+        changes = diff_sessions([s for s in old_sessions if course_matches_session(course, s)],
+                                [s for s in new_sessions if course_matches_session(course, s)])
+        if has_changes(changes):
+            result.append((course, changes))
+    return result
+
+
+def describe_session(session, section_patterns=None):
+    """One-line description: 'Monday 08:30-09:50 · Data Structures (CS-A) · C-101'"""
+    entry = session['cleaned'].strip()
+    if section_patterns:
+        entry = clean_class_entry(entry, section_patterns)
+    room = session['room'] or "Unknown"
+    return f"{session['day']} {session['time_slot']} · {entry} · {room}"
+
+
+def format_changes(changes, user_batch=None, user_section=None):
+    """Markdown bullet list of a diff"""
+    section_patterns = section_patterns_for(user_batch, user_section) if user_batch else None
+    lines = []
+    for session in changes['added']:
+        lines.append(f"- ➕ **Added:** {describe_session(session, section_patterns)}")
+    for session in changes['removed']:
+        lines.append(f"- ➖ **Removed:** {describe_session(session, section_patterns)}")
+    for old, new in changes['moved']:
+        lines.append(f"- 🔀 **Moved:** {describe_session(old, section_patterns)} → "
+                     f"{new['day']} {new['time_slot']} · {new['room'] or 'Unknown'}")
+    return "\n".join(lines)
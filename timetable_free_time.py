@@ -0,0 +1,197 @@
+"""Common free time of several sections and students, for meetings and makeup classes.
+
+Once per snapshot revision every section's week becomes occupancy bitmaps: one int per
+day with bit i set when the section has a class during the i-th BLOCK_MINUTES block of
+the teaching day. Custom course selections get bitmaps per course, built on first use.
+A query ORs the bitmaps of all its groups and reads the free windows off the zero bits,
+so dozens of groups answer in microseconds. Results are cached per revision and set of
+inputs (only the union of sections and courses matters).
+
+    python timetable_free_time.py --snapshot saved.json --section "BS CS (2024)" A --section "BS SE (2023)" B
+
+Settings (environment):
+TIMETABLE_MIN_FREE_MINUTES - shortest free window reported (default 30)
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+
+from timetable_index import batch_sections, course_id, iter_section_sessions, offering_matches
+from timetable_integrity import session_interval
+
+BLOCK_MINUTES = 5
+MIN_FREE_MINUTES = int(os.environ.get("TIMETABLE_MIN_FREE_MINUTES", "30"))
+# Query results kept per revision
+RESULT_CACHE_SIZE = 1024
+# Revisions whose bitmaps are kept (the current one and the one being replaced)
+KEPT_REVISIONS = 2
+
+_occupancy = OrderedDict()  # revision -> occupancy of that revision
+_lock = threading.Lock()
+
+
+def format_minutes(minutes):
+    """Minutes after midnight on the sheet's 12-hour clock without AM/PM (13:00 -> '01:00')"""
+    hour, minute = divmod(minutes, 60)
+    return f"{(hour - 1) % 12 + 1:02d}:{minute:02d}"
+
+
+def day_bounds(index):
+    """(start, end) minutes of the teaching day: earliest start to latest end, on block boundaries"""
+    intervals = [interval for session in index['sessions'] if (interval := session_interval(session))]
+    if not intervals:
+        return 0, 0
+    start = min(start for start, _ in intervals) // BLOCK_MINUTES * BLOCK_MINUTES
+    end = -(-max(end for _, end in intervals) // BLOCK_MINUTES) * BLOCK_MINUTES
+    return start, end
+
+
+def interval_bits(interval, bounds):
+    """Bitmap of the blocks an interval overlaps"""
+    start = max(interval[0], bounds[0]) - bounds[0]
+    end = min(interval[1], bounds[1]) - bounds[0]
+    if end <= start:
+        return 0
+    first, last = start // BLOCK_MINUTES, -(-end // BLOCK_MINUTES)
+    return ((1 << (last - first)) - 1) << first
+
+
+def add_session(bitmaps, session, bounds):
+    interval = session_interval(session)
+    if interval is not None:
+        bitmaps[session['day']] = bitmaps.get(session['day'], 0) | interval_bits(interval, bounds)
+
+
+def build_occupancy(index):
+    """Section bitmaps of an index: {'bounds', 'days', 'sections': {(batch, section): {day: bits}}, ...}"""
+    bounds = day_bounds(index)
+    sections = {(batch, section): {} for batch, batch_section_list in batch_sections(index).items()
+                for section in batch_section_list}
+    for batch, section, session in iter_section_sessions(index, batch_sections(index)):
+        add_session(sections[(batch, section)], session, bounds)
+    return {'revision': index['revision'], 'index': index, 'bounds': bounds, 'days': list(index['days']),
+            'sections': sections, 'courses': {}, 'results': OrderedDict()}
+
+
+def get_occupancy(index):
+    """Occupancy of an index, built once per revision"""
+    with _lock:
+        occupancy = _occupancy.get(index['revision'])
+        if occupancy is not None:
+            _occupancy.move_to_end(index['revision'])
+            return occupancy
+    occupancy = build_occupancy(index)
+    with _lock:
+        occupancy = _occupancy.setdefault(index['revision'], occupancy)
+        while len(_occupancy) > KEPT_REVISIONS:
+            _occupancy.popitem(last=False)
+    return occupancy
+
+
+def course_bitmaps(occupancy, courses):
+    """{course id: {day: bits}} for catalogue courses; courses not seen before are matched in one pass"""
+    ids = {course_id(course): course for course in courses}
+    with _lock:
+        missing = {key: course for key, course in ids.items() if key not in occupancy['courses']}
+    if missing:
+        sessions = occupancy['index']['sessions']
+        built = {}
+        for key, matches in offering_matches(occupancy['index'], missing).items():
+            bitmaps = built[key] = {}
+            for position, _, _ in matches:
+                add_session(bitmaps, sessions[position], occupancy['bounds'])
+        with _lock:
+            occupancy['courses'].update(built)
+    return {key: occupancy['courses'][key] for key in ids}
+
+
+def free_windows(busy, bounds, min_minutes):
+    """[(start, end)] minutes of the runs of free blocks at least min_minutes long"""
+    windows = []
+    blocks = (bounds[1] - bounds[0]) // BLOCK_MINUTES
+    block = 0
+    while block < blocks:
+        if busy >> block & 1:
+            block += 1
+            continue
+        first = block
+        while block < blocks and not busy >> block & 1:
+            block += 1
+        start, end = bounds[0] + first * BLOCK_MINUTES, bounds[0] + block * BLOCK_MINUTES
+        if end - start >= min_minutes:
+            windows.append((start, end))
+    return windows
+
+
+def common_free_time(index, sections=(), selections=(), min_minutes=None):
+    """{day: [(start, end)]} when every group is free.
+
+    Groups are (batch, section) pairs and custom selections (lists of catalogue courses).
+    Raises ValueError for a section that is not in the section catalogue.
+    """
+    min_minutes = MIN_FREE_MINUTES if min_minutes is None else min_minutes
+    occupancy = get_occupancy(index)
+    sections = frozenset(tuple(pair) for pair in sections)
+    unknown = [pair for pair in sections if pair not in occupancy['sections']]
+    if unknown:
+        raise ValueError(f"Unknown section(s): {', '.join(f'{batch} {section}' for batch, section in unknown)}")
+    courses = [course for selected_courses in selections for course in selected_courses]
+
+    key = (sections, frozenset(course_id(course) for course in courses), min_minutes)
+    with _lock:
+        if key in occupancy['results']:
+            occupancy['results'].move_to_end(key)
+            return occupancy['results'][key]
+
+    groups = [occupancy['sections'][pair] for pair in sections]
+    groups.extend(course_bitmaps(occupancy, courses).values())
+    result = {}
+    for day in occupancy['days']:
+        busy = 0
+        for bitmaps in groups:
+            busy |= bitmaps.get(day, 0)
+        result[day] = free_windows(busy, occupancy['bounds'], min_minutes)
+
+    with _lock:
+        occupancy['results'][key] = result
+        while len(occupancy['results']) > RESULT_CACHE_SIZE:
+            occupancy['results'].popitem(last=False)
+    return result
+
+
+def format_free_time(free_time):
+    """Markdown list of the free windows per day"""
+    lines = []
+    for day, windows in free_time.items():
+        if windows:
+            times = ", ".join(f"{format_minutes(start)}-{format_minutes(end)}" for start, end in windows)
+            lines.append(f"- **{day}:** {times}")
+        else:
+            lines.append(f"- **{day}:** no common free time")
+    return "\n".join(lines) if lines else "⚠️ No teaching days found"
+
+
+def main():
+    from export_timetables import add_source_arguments, load_spreadsheet
+    from timetable_index import compile_index
+
+    parser = argparse.ArgumentParser(description="Find when several sections are all free")
+    add_source_arguments(parser)
+    parser.add_argument("--section", nargs=2, action="append", required=True, metavar=("BATCH", "SECTION"),
+                        help="a batch and section, e.g. --section 'BS CS (2024)' A (repeatable)")
+    parser.add_argument("--min-minutes", type=int, default=None,
+                        help=f"shortest window to report (default {MIN_FREE_MINUTES})")
+    args = parser.parse_args()
+
+    index = compile_index(load_spreadsheet(args.snapshot, args.spreadsheet_id, args.credentials))
+    try:
+        free_time = common_free_time(index, [(batch, section.upper()) for batch, section in args.section],
+                                     min_minutes=args.min_minutes)
+    except ValueError as e:
+        parser.error(str(e))
+    print(format_free_time(free_time))
+
+
+if __name__ == "__main__":
+    main()
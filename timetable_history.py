@@ -0,0 +1,385 @@
+"""Local history of every timetable revision served, for time-travel queries.
+
+Each source keeps an append-only pool of distinct rows (cell texts and colours, keyed by
+the row hash from timetable_index) and a manifest line per revision. Every BASE_EVERY-th
+manifest lists all row hashes; the ones in between only list the rows that changed, so a
+semester of hourly refreshes costs a few kilobytes per edit. A past revision is rebuilt
+from its rows and compiled like a fresh fetch, then kept in a small in-memory cache.
+
+    python timetable_history.py list
+    python timetable_history.py show --at "2025-03-04 10:00" --batch "BS CS (2024)" --section A
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+from sheet_grid import EMPTY_CELL, as_grid
+from sheets_client import CACHE_DIR, file_lock
+from timetable_index import (
+    row_fingerprint, compile_index, merge_indexes, get_index_timetable,
+    get_index_custom_timetable
+)
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = os.environ.get("TIMETABLE_HISTORY_DIR", os.path.join(CACHE_DIR, "history"))
+# Set TIMETABLE_HISTORY=off to stop recording (queries still read what exists)
+HISTORY_ENABLED = os.environ.get("TIMETABLE_HISTORY", "on").lower() not in ("off", "0", "false")
+
+# A full manifest every this many revisions bounds how many deltas a read replays
+BASE_EVERY = 24
+# Compiled past indexes kept in memory
+LOADED_REVISIONS = 8
+
+# history dir -> {'stores': {key: store}, 'served': [...], 'served_offset': int}
+_histories = {}
+_history_lock = threading.RLock()
+_loaded = OrderedDict()
+
+
+def source_key(source):
+    """Directory name for a source: spreadsheet id plus its name"""
+    url = source['url']
+    spreadsheet_id = url.split('/d/')[1].split('/')[0] if '/d/' in url else url
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", source['name']).strip('-')
+    return f"{spreadsheet_id}-{slug}" if slug else spreadsheet_id
+
+
+def compact_row(row):
+    """A grid row as JSON: [text, colour key or None] per cell"""
+    return [list(cell) for cell in row]
+
+
+def expand_row(cells):
+    """Rebuild a grid row from compact_row output"""
+    # Older stores wrote null for cells that were not objects
+    return tuple(EMPTY_CELL if cell is None else (cell[0], cell[1]) for cell in cells)
+
+
+def _history(history_dir):
+    with _history_lock:
+        return _histories.setdefault(history_dir, {'stores': {}, 'served': [], 'served_offset': 0})
+
+
+GZIP_MAGIC = b"\x1f\x8b\x08"
+
+
+def _complete_members(data, path):
+    """(decompressed text, bytes used) of the whole gzip members at the start of data.
+
+    A member a crashed writer left half-written (with the next append glued to it) is
+    skipped up to the next member header, so it is not read again on every call.
+    """
+    text = []
+    used = 0
+    while used < len(data):
+        member = zlib.decompressobj(wbits=31)
+        try:
+            chunk = member.decompress(data[used:])
+        except zlib.error as e:
+            skip_to = data.find(GZIP_MAGIC, used + 1)
+            if skip_to == -1:
+                break  # the next member is still being written
+            logger.warning("Skipping %d corrupt bytes in %s: %s", skip_to - used, path, e)
+            used = skip_to
+            continue
+        if not member.eof:
+            break  # still being written
+        text.append(chunk)
+        used = len(data) - len(member.unused_data)
+    return b"".join(text), used
+
+
+def _read_new_lines(path, offset, compressed=False):
+    """JSON lines appended to path since offset, and the new offset.
+
+    Readers take no lock, so only whole records are read: complete gzip members, or lines
+    up to the last newline. A record another process is still writing is picked up on a
+    later read; a torn record is logged and skipped.
+    """
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    # Every append is its own gzip member, so the data after any previous offset decompresses on its own
+    if compressed:
+        data, used = _complete_members(data, path)
+    else:
+        used = data.rfind(b"\n") + 1
+        data = data[:used]
+    lines = []
+    for line in data.splitlines():
+        if not line:
+            continue
+        try:
+            lines.append(json.loads(line))
+        except ValueError as e:  # also UnicodeDecodeError
+            logger.warning("Skipping unreadable line in %s after offset %d: %s", path, offset, e)
+    return lines, offset + used
+
+
+def _drop_torn_tail(path, offset):
+    """Cut off what a crashed writer left after the last whole record (needs the writer lock)"""
+    if os.path.exists(path) and os.path.getsize(path) > offset:
+        logger.warning("Dropping %d bytes of an unfinished write at the end of %s",
+                       os.path.getsize(path) - offset, path)
+        with open(path, 'r+b') as f:
+            f.truncate(offset)
+
+
+def _append_lines(path, lines, compressed=False):
+    data = "".join(json.dumps(line, separators=(',', ':')) + "\n" for line in lines).encode('utf-8')
+    with open(path, 'ab') as f:
+        f.write(gzip.compress(data) if compressed else data)
+
+
+def _store(history_dir, key):
+    """Per-source store, brought up to date with what other processes appended"""
+    history = _history(history_dir)
+    with _history_lock:
+        store = history['stores'].setdefault(key, {
+            'dir': os.path.join(history_dir, key), 'rows': {}, 'revisions': [], 'by_revision': {},
+            'state': None, 'since_base': 0, 'rows_offset': 0, 'revisions_offset': 0,
+        })
+        # Manifests before rows: writers append rows first, so every manifest read has its rows on disk
+        manifests, store['revisions_offset'] = _read_new_lines(os.path.join(store['dir'], "revisions.jsonl"),
+                                                               store['revisions_offset'])
+        rows, store['rows_offset'] = _read_new_lines(os.path.join(store['dir'], "rows.jsonl.gz"),
+                                                     store['rows_offset'], compressed=True)
+        for line in rows:
+            store['rows'][line['h']] = line['c']
+        for manifest in manifests:
+            _apply_manifest(store, manifest)
+        return store
+
+
+def _apply_days(state, days):
+    """Row hashes per day after a manifest: its full lists, or the previous state plus deltas"""
+    if state is None:
+        return {day: list(hashes) for day, hashes in days.items()}
+    next_state = {}
+    for day, delta in days.items():
+        hashes = state[day][:delta['n']]
+        hashes.extend([None] * (delta['n'] - len(hashes)))
+        for position, row_hash in delta['set'].items():
+            hashes[int(position)] = row_hash
+        next_state[day] = hashes
+    return next_state
+
+
+def _apply_manifest(store, manifest):
+    """Advance the store's latest full state by one manifest"""
+    if manifest.get('base'):
+        store['state'] = _apply_days(None, manifest['days'])
+        store['since_base'] = 0
+    else:
+        store['state'] = _apply_days(store['state'], manifest['days'])
+        store['since_base'] += 1
+    store['by_revision'][manifest['revision']] = len(store['revisions'])
+    store['revisions'].append(manifest)
+
+
+def _state_at(store, position):
+    """Full {day: [row hashes]} of the manifest at position, replaying deltas from its base"""
+    start = position
+    while not store['revisions'][start].get('base'):
+        start -= 1
+    state = None
+    for manifest in store['revisions'][start:position + 1]:
+        state = _apply_days(None if manifest.get('base') else state, manifest['days'])
+    return state
+
+
+def record_source_snapshot(source, spreadsheet, revision, history_dir=None, at=None):
+    """Store a source's compiled revision (no-op if it is already stored)"""
+    history_dir = history_dir or HISTORY_DIR
+    key = source_key(source)
+    directory = os.path.join(history_dir, key)
+    os.makedirs(directory, exist_ok=True)
+
+    with file_lock(os.path.join(directory, ".lock")), _history_lock:
+        store = _store(history_dir, key)
+        if revision in store['by_revision']:
+            return False
+
+        days = {}
+        new_rows = {}
+        for day, grid_data in as_grid(spreadsheet)['sheets'].items():
+            hashes = []
+            for row in grid_data:
+                row_hash = row_fingerprint(row)
+                hashes.append(row_hash)
+                if row_hash not in store['rows'] and row_hash not in new_rows:
+                    new_rows[row_hash] = compact_row(row)
+            days[day] = hashes
+
+        previous = store['state']
+        manifest = {'revision': revision, 'at': at or time.time(), 'name': source['name']}
+        if previous is None or store['since_base'] + 1 >= BASE_EVERY or list(previous) != list(days):
+            manifest.update({'base': True, 'days': days})
+        else:
+            manifest['days'] = {
+                day: {'n': len(hashes), 'set': {
+                    str(position): row_hash for position, row_hash in enumerate(hashes)
+                    if position >= len(previous[day]) or previous[day][position] != row_hash
+                }}
+                for day, hashes in days.items()
+            }
+
+        # With the lock held nobody else is writing, so anything after the whole records
+        # read above was left by a writer that crashed and would corrupt this append
+        rows_path = os.path.join(directory, "rows.jsonl.gz")
+        revisions_path = os.path.join(directory, "revisions.jsonl")
+        _drop_torn_tail(rows_path, store['rows_offset'])
+        _drop_torn_tail(revisions_path, store['revisions_offset'])
+        # Rows first, so a manifest never refers to rows that are not on disk yet
+        if new_rows:
+            _append_lines(rows_path, [{'h': h, 'c': cells} for h, cells in new_rows.items()], compressed=True)
+        _append_lines(revisions_path, [manifest])
+        _store(history_dir, key)
+        return True
+
+
+def record_served_index(index, sources, history_dir=None, at=None):
+    """Remember which source revisions made up a served (possibly merged) revision"""
+    history_dir = history_dir or HISTORY_DIR
+    os.makedirs(history_dir, exist_ok=True)
+    path = os.path.join(history_dir, "served.jsonl")
+
+    with file_lock(path + ".lock"), _history_lock:
+        served = served_revisions(history_dir)
+        if served and served[-1]['revision'] == index['revision']:
+            return False
+        parts = index.get('parts') or [index['revision']]
+        _drop_torn_tail(path, _history(history_dir)['served_offset'])
+        _append_lines(path, [{
+            'revision': index['revision'],
+            'at': at or time.time(),
+            'parts': [{'key': source_key(source), 'name': source['name'], 'revision': part}
+                      for source, part in zip(sources, parts)],
+        }])
+        return True
+
+
+def served_revisions(history_dir=None):
+    """Every served revision in order, as [{'revision', 'at', 'parts'}]"""
+    history = _history(history_dir or HISTORY_DIR)
+    with _history_lock:
+        lines, history['served_offset'] = _read_new_lines(os.path.join(history_dir or HISTORY_DIR, "served.jsonl"),
+                                                          history['served_offset'])
+        history['served'].extend(lines)
+        return history['served']
+
+
+def revision_at(when, history_dir=None):
+    """Revision that was being served at a given time (epoch seconds), or None"""
+    current = None
+    for served in served_revisions(history_dir):
+        if served['at'] > when:
+            break
+        current = served['revision']
+    return current
+
+
+def load_source_revision(key, name, revision, history_dir=None):
+    """Compiled index of one source at a stored revision, or None"""
+    history_dir = history_dir or HISTORY_DIR
+    with _history_lock:
+        store = _store(history_dir, key)
+        position = store['by_revision'].get(revision)
+        if position is None:
+            return None
+        state = _state_at(store, position)
+        sheets = {day: [expand_row(store['rows'][h]) for h in hashes] for day, hashes in state.items()}
+
+        # Neighbouring revisions share most rows, so compile against the last one loaded
+        previous = store.get('compiled')
+
+    index = compile_index({'sheets': sheets}, name, previous)
+    store['compiled'] = index
+    if index['revision'] != revision:
+        logger.warning("History for '%s' rebuilt revision %s as %s", key, revision, index['revision'])
+    return index
+
+
+def load_index_at(revision, history_dir=None):
+    """Served index at a past revision (merged like it was served), or None if unknown"""
+    history_dir = history_dir or HISTORY_DIR
+    cache_key = (history_dir, revision)
+    with _history_lock:
+        if cache_key in _loaded:
+            _loaded.move_to_end(cache_key)
+            return _loaded[cache_key]
+
+    served = next((s for s in reversed(served_revisions(history_dir)) if s['revision'] == revision), None)
+    if served is None:
+        return None
+    parts = [load_source_revision(part['key'], part['name'], part['revision'], history_dir)
+             for part in served['parts']]
+    if any(part is None for part in parts):
+        return None
+    index = parts[0] if len(parts) == 1 else merge_indexes(parts)
+
+    with _history_lock:
+        _loaded[cache_key] = index
+        while len(_loaded) > LOADED_REVISIONS:
+            _loaded.popitem(last=False)
+    return index
+
+
+def parse_when(value):
+    """Epoch seconds from 'YYYY-MM-DD[ HH:MM[:SS]]' (local time) or a plain number"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the local timetable history")
+    parser.add_argument("--dir", default=HISTORY_DIR, help="history directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list served revisions")
+    show = commands.add_parser("show", help="print a past timetable")
+    when = show.add_mutually_exclusive_group(required=True)
+    when.add_argument("--at", help="time, e.g. '2025-03-04 10:00'")
+    when.add_argument("--revision")
+    show.add_argument("--batch", help="batch name as shown in the app, e.g. 'BS CS (2024)'")
+    show.add_argument("--section", default="")
+    show.add_argument("--course", action="append", default=[],
+                      help="course name for a custom timetable (repeatable); matched like the app's search")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for served in served_revisions(args.dir):
+            stamp = datetime.fromtimestamp(served['at']).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{stamp}  {served['revision']}  ({len(served['parts'])} source(s))")
+        return
+
+    revision = args.revision or revision_at(parse_when(args.at), args.dir)
+    index = load_index_at(revision, args.dir) if revision else None
+    if index is None:
+        raise SystemExit("⚠️ No stored timetable for that time/revision.")
+
+    print(f"# Revision {revision}\n")
+    if args.course:
+        wanted = [name.lower() for name in args.course]
+        courses = [c for c in index['courses'] if any(name in c['name'].lower() for name in wanted)]
+        print(get_index_custom_timetable(index, courses))
+    elif args.batch:
+        print(get_index_timetable(index, args.batch, args.section.upper()))
+    else:
+        print("\n".join(index['batches']))
+
+
+if __name__ == "__main__":
+    main()
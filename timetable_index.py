@@ -0,0 +1,563 @@
+"""Compiled session index built once per spreadsheet snapshot.
+
+Every non-empty cell below the header rows is parsed once into a session record
+(day, room, time slot, batch, parsed course...). Batch and custom timetables and the
+course catalogue are then answered from these records instead of walking the raw grid
+again, and indexes compiled from several spreadsheets can be merged into one.
+
+Every row is fingerprinted (cell texts and background colours, the only things the index
+reads), so recompiling against the previous index only reparses rows that changed. Cell
+colours are matched to batches through a palette built once per snapshot (batch_palette),
+so near-identical shades of a batch colour still count as that batch.
+"""
+import hashlib
+import re
+
+from batch_palette import build_palette, palette_problems
+from course_extractor import parse_course_entry
+from sheet_grid import TIMETABLE_SHEETS, as_grid
+from extract_timetable import (
+    extract_batch_colors, find_room_column, build_time_col_rank, find_lab_time_row, find_row_room,
+    header_time_slot, parse_embedded_time_info, parse_time_slot, slot_minutes, section_patterns_for, clean_class_entry,
+    section_pattern, compile_section_matcher, selected_course_matcher, build_custom_entry, add_custom_entry,
+    format_timetable, format_custom_timetable, format_timetable_day, format_custom_timetable_day, GROUP_PATTERN
+)
+
+
+def source_label(name):
+    """Normalise a source name so it can be appended to batch names safely.
+
+    Dashes and brackets are replaced because batch parsing splits on '-' (e.g. 'BS-CS-1').
+    """
+    return re.sub(r"\s+", " ", re.sub(r"[-\[\]]", " ", str(name or ""))).strip()
+
+
+def qualify(name, source):
+    """Namespace a batch name with its source; unchanged when only one source is served"""
+    if not source or not name:
+        return name
+    return f"{name} [{source}]"
+
+
+def fingerprint(*parts):
+    """Short stable hash of some strings"""
+    return hashlib.blake2b("\x1f".join(parts).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def row_fingerprint(row):
+    """Hash of a grid row's cell texts and background colours"""
+    # Unformatted cells are skipped by the index, so they must not hash like formatted ones
+    return fingerprint(*(f"{text}\x1e{'-' if color is None else color}" for text, color in row or ()))
+
+
+def sheet_layout(grid_data):
+    """Room column, time header rows and column ranks shared by every row of a sheet"""
+    class_time_row, col_rank = build_time_col_rank(grid_data)
+    lab_time_row_index, lab_time_row = find_lab_time_row(grid_data)
+    return {
+        'room_column': find_room_column(grid_data),
+        'class_time_row': class_time_row,
+        'col_rank': col_rank,
+        'lab_time_row_index': lab_time_row_index,
+        'lab_time_row': lab_time_row,
+    }
+
+
+def layout_fingerprint(layout, batch_labels, near_colors=None):
+    """Hash of everything outside a row that its sessions depend on"""
+    parts = [
+        str(layout['room_column']),
+        row_fingerprint(layout['class_time_row']),
+        repr(sorted(layout['col_rank'].items())),
+        str(layout['lab_time_row_index']),
+        row_fingerprint(layout['lab_time_row']),
+        repr(sorted(batch_labels.items())),
+    ]
+    # Only sheets with near-match colours hash them, so exact-colour sheets keep their revision
+    if near_colors:
+        parts.append(repr(sorted(near_colors.items())))
+    return fingerprint(*parts)
+
+
+def compile_row_sessions(sheet_name, row_idx, row, layout, batch_colors, batch_labels, source="", palette=None):
+    """Parse one timetable row (row_idx is the sheet's 1-based row number) into session records.
+
+    ``palette`` maps cell colours to batch colours (build_palette's lookup); without it
+    only exact batch colours match.
+    """
+    sessions = []
+    lab_time_row_index = layout['lab_time_row_index']
+    is_lab = lab_time_row_index is not None and row_idx >= lab_time_row_index + 1
+    time_row = layout['lab_time_row'] if (is_lab and layout['lab_time_row'] is not None) else layout['class_time_row']
+
+    room = None
+    listed_room = None
+
+    for col_idx, (class_entry, cell_color) in enumerate(row):
+        # Cells without a format are never classes
+        if cell_color is None or not class_entry:
+            continue
+        # A near shade of a batch colour is recorded as the batch colour itself
+        if palette is not None:
+            cell_color = palette.get(cell_color, cell_color)
+
+        if room is None:
+            # Batch timetables search the row for a room; custom timetables use the room column only
+            room = find_row_room(row, layout['room_column'])
+            listed_room = find_row_room(row, layout['room_column'], search_other_columns=False)
+
+        cleaned_entry, embedded_time, has_embedded_time = parse_embedded_time_info(class_entry)
+        header_slot = header_time_slot(time_row, col_idx)
+        time_slot = embedded_time if has_embedded_time else header_slot
+        start, end = slot_minutes(time_slot)
+
+        # Course details for cells painted in a batch colour (same parsing as the course catalogue)
+        course_info = None
+        if cell_color in batch_colors and class_entry.strip():
+            course_info = parse_course_entry(class_entry.strip(), batch_colors[cell_color])
+
+        sessions.append({
+            'source': source,
+            'day': sheet_name,
+            'row': row_idx,
+            'col': col_idx,
+            'rank': layout['col_rank'].get(col_idx, 999),
+            'text': class_entry,
+            'color': cell_color,
+            'batch': batch_labels.get(cell_color, ""),
+            'room': room,
+            'listed_room': listed_room,
+            'type': "Lab" if is_lab else "Class",
+            'header_slot': header_slot,
+            'time_slot': time_slot,
+            'start': start,
+            'end': end,
+            'embedded': has_embedded_time,
+            'cleaned': cleaned_entry if has_embedded_time else class_entry,
+            'course': course_info['name'] if course_info else "",
+            'department': course_info['department'] if course_info else "",
+            'section': course_info['section'] if course_info else "",
+        })
+
+    return sessions
+
+
+def compile_sheet_rows(sheet_name, grid_data, batch_colors, batch_labels, source="", previous=None, palette=None):
+    """Compile a weekday sheet into {'layout', 'rows': [(row hash, sessions)]}.
+
+    With the previous compilation of the same sheet, rows whose hash is unchanged reuse
+    their sessions; a changed layout (headers, lab row, batch colours) reparses everything.
+    """
+    if len(grid_data) < 6:
+        return {'layout': fingerprint(), 'rows': []}
+
+    layout = sheet_layout(grid_data)
+    layout_hash = layout_fingerprint(layout, batch_labels, palette and palette['near'])
+    reusable = previous['rows'] if previous and previous['layout'] == layout_hash else []
+
+    rows = []
+    # Row numbers start at 6 for grid index 5, i.e. they are the sheet's own 1-based row numbers
+    for position, row in enumerate(grid_data[5:]):
+        row_hash = row_fingerprint(row)
+        if position < len(reusable) and reusable[position][0] == row_hash:
+            rows.append(reusable[position])
+        else:
+            rows.append((row_hash, compile_row_sessions(sheet_name, position + 6, row, layout,
+                                                        batch_colors, batch_labels, source,
+                                                        palette and palette['lookup'])))
+    return {'layout': layout_hash, 'rows': rows}
+
+
+def compile_sheet_sessions(sheet_name, grid_data, batch_colors, batch_labels, source="", palette=None):
+    """Parse the timetable rows of one weekday sheet into session records"""
+    compiled = compile_sheet_rows(sheet_name, grid_data, batch_colors, batch_labels, source, palette=palette)
+    return [session for _, row_sessions in compiled['rows'] for session in row_sessions]
+
+
+def build_course_catalogue(sessions):
+    """Unique courses (name, department, section, batch) in order of first appearance"""
+    courses = []
+    seen = set()
+    for session in sessions:
+        if not session['batch'] or not session['text'].strip():
+            continue
+        key = (session['source'], session['course'], session['department'], session['section'], session['batch'])
+        if key in seen:
+            continue
+        seen.add(key)
+        courses.append({
+            'name': session['course'],
+            'department': session['department'],
+            'section': session['section'],
+            'batch': session['batch'],
+            'full_entry': session['text'].strip(),
+            'day': session['day'],
+            'color_code': session['color'],
+            'source': session['source'],
+        })
+    return courses
+
+
+def compile_index(spreadsheet, source="", previous=None):
+    """Compile a spreadsheet (API response or projected grid) into a session index.
+
+    With a source name, batch names are namespaced as 'BS CS (2024) [Source]' so
+    they stay unique when indexes from several spreadsheets are merged. Passing the
+    previous index of the same source only reparses changed rows, and returns the
+    previous index itself when nothing changed.
+    """
+    source = source_label(source)
+    grid = as_grid(spreadsheet)
+    batch_colors = extract_batch_colors(grid)
+    batch_labels = {color: qualify(batch, source) for color, batch in batch_colors.items()}
+    palette = build_palette(grid, batch_colors)
+    previous_sheets = previous.get('sheets', {}).get(source, {}) if previous else {}
+
+    sheets = {}
+    days = []
+    for sheet_name, grid_data in grid['sheets'].items():
+        days.append(sheet_name)
+        sheets[sheet_name] = compile_sheet_rows(sheet_name, grid_data, batch_colors, batch_labels, source,
+                                                previous_sheets.get(sheet_name), palette)
+
+    # The revision changes whenever any row, layout or batch colour the index depends on changes
+    revision = fingerprint(source, repr(sorted(batch_labels.items())), *(
+        part for day in days for part in [day, sheets[day]['layout']] + [h for h, _ in sheets[day]['rows']]
+    ))
+    if previous and previous.get('revision') == revision:
+        return previous
+
+    sessions = [session for day in days for _, row_sessions in sheets[day]['rows'] for session in row_sessions]
+    batches = list(dict.fromkeys(batch_labels.values()))
+    index = {
+        'revision': revision,
+        'sources': [source],
+        'batch_colors': {source: batch_labels},
+        'batches': batches,
+        'batch_sources': {batch: source for batch in batches},
+        'days': days,
+        'sheets': {source: sheets},
+        'sessions': sessions,
+        'courses': build_course_catalogue(sessions),
+        'color_problems': palette_problems(palette, batch_labels, source),
+    }
+    index['sections'] = build_section_catalogue(index)
+    return index
+
+
+def merge_indexes(indexes):
+    """Combine per-source indexes into one queryable index"""
+    merged = {'revision': fingerprint(*(index['revision'] for index in indexes)),
+              'parts': [index['revision'] for index in indexes],
+              'sources': [], 'batch_colors': {}, 'batches': [], 'batch_sources': {},
+              'days': [], 'sheets': {}, 'sessions': [], 'courses': [], 'sections': {}, 'conflicts': []}
+    for index in indexes:
+        for source in index['sources']:
+            if source in merged['batch_colors']:
+                raise ValueError(f"Duplicate timetable source name: '{source}'")
+            merged['sources'].append(source)
+        merged['batch_colors'].update(index['batch_colors'])
+        merged['batches'].extend(index['batches'])
+        merged['batch_sources'].update(index['batch_sources'])
+        merged['sheets'].update(index['sheets'])
+        merged['days'].extend(day for day in index['days'] if day not in merged['days'])
+        merged['sessions'].extend(index['sessions'])
+        merged['courses'].extend(index['courses'])
+        merged['sections'].update(index['sections'])
+        merged['conflicts'].extend(index.get('conflicts', []))
+    return merged
+
+
+def find_batch_color(index, batch):
+    """(source, colour) used for a batch in its own spreadsheet, or (None, None)"""
+    source = index['batch_sources'].get(batch)
+    if source is None:
+        return None, None
+    colors = index['batch_colors'][source]
+    return source, next((color for color, label in colors.items() if label == batch), None)
+
+
+def select_batch_sessions(index, user_batch, user_section, sessions=None):
+    """Sessions of a batch + section (from sessions, default all of the index's sessions)"""
+    source, target_color = find_batch_color(index, user_batch)
+    if not target_color:
+        return []
+
+    # The section's tokens are one compiled regex: a single search per session
+    section_regex = section_pattern([user_section])
+    return [
+        session for session in (index['sessions'] if sessions is None else sessions)
+        if session['color'] == target_color and session['source'] == source
+        and section_regex.search(session['text'])
+    ]
+
+
+def batch_timetable_entry(session, section_patterns):
+    """Entry tuple of a batch timetable session (rank, parsed time, time slot, room, type, course)"""
+    time_slot = session['time_slot']
+    return (session['rank'], parse_time_slot(time_slot), time_slot, session['room'], session['type'],
+            clean_class_entry(session['cleaned'], section_patterns))
+
+
+def batch_timetable_entries(index, user_batch, user_section, sessions=None):
+    """{day: [entry tuples]} for a batch + section (the input of format_timetable), or None for an unknown batch"""
+    if not find_batch_color(index, user_batch)[1]:
+        return None
+
+    section_patterns = section_patterns_for(user_batch, user_section)
+    timetable = {}
+    for session in select_batch_sessions(index, user_batch, user_section, sessions):
+        timetable.setdefault(session['day'], []).append(batch_timetable_entry(session, section_patterns))
+    return timetable
+
+
+def batch_sections_entries(index, user_batch, sections, sessions=None):
+    """{section: {day: [entry tuples]}} for several sections of a batch in one pass, or None for an unknown batch.
+
+    Each session of the batch is scanned once for all the sections' tokens, so exporting
+    every section costs about as much as one.
+    """
+    source, target_color = find_batch_color(index, user_batch)
+    if not target_color:
+        return None
+
+    match = compile_section_matcher(sections)
+    section_patterns = {section: section_patterns_for(user_batch, section) for section in sections}
+    timetables = {section: {} for section in sections}
+    for session in index['sessions'] if sessions is None else sessions:
+        if session['color'] != target_color or session['source'] != source:
+            continue
+        for section in match(session['text']):
+            timetables[section].setdefault(session['day'], []).append(
+                batch_timetable_entry(session, section_patterns[section]))
+    return timetables
+
+
+def get_index_timetable(index, user_batch, user_section):
+    """Batch + section timetable from the index; same output as extract_timetable.get_timetable"""
+    timetable = batch_timetable_entries(index, user_batch, user_section)
+    if timetable is None:
+        return f"⚠️ Batch '{user_batch}' not found!"
+    return format_timetable(timetable)
+
+
+def course_matches_session(selected_course, session):
+    """True if a session belongs to a selected course (courses only match their own spreadsheet)"""
+    return selected_course.get('source', '') == session['source'] and \
+        selected_course_matcher(selected_course)(session['text'], session['batch'], session['cleaned'])
+
+
+def course_id(course):
+    """Stable id of a catalogue course (same course, same id across revisions)"""
+    return fingerprint(course.get('source', ''), course['name'], course.get('department', ''),
+                       course.get('section', ''), course.get('batch', ''))
+
+
+def offering_matches(index, offerings, sessions=None):
+    """{course id: [(session position, entry tuple)]} for distinct courses, in one pass over the sessions.
+
+    Sessions are bucketed once by the text entry_matches_course compares against (group
+    courses by base name, others by a substring test shared by every section of a course
+    name), so each course only runs the full match on a handful of candidates.
+    """
+    plain = {}  # source -> [(lowered entry, position, session)]
+    grouped = {}  # (source, lowered base name) -> [(position, session)]
+    for position, session in enumerate(index['sessions'] if sessions is None else sessions):
+        entry = session['cleaned']
+        if GROUP_PATTERN.search(entry):
+            base = entry.split('(')[0].strip().lower()
+            grouped.setdefault((session['source'], base), []).append((position, session))
+        else:
+            plain.setdefault(session['source'], []).append((entry.lower(), position, session))
+
+    candidates = {}  # (source, group?, lowered name) -> [(position, session)]
+    matches = {}
+    for key, course in offerings.items():
+        source = course.get('source', '')
+        # Name, section and group tokens of the course compiled once for all its candidates
+        matcher = selected_course_matcher(course)
+        name = course['name']
+        if GROUP_PATTERN.search(name):
+            bucket = (source, True, name.split('(')[0].strip().lower())
+            if bucket not in candidates:
+                candidates[bucket] = grouped.get((source, bucket[2]), [])
+        else:
+            bucket = (source, False, name.lower())
+            if bucket not in candidates:
+                candidates[bucket] = [(position, session) for entry, position, session in plain.get(source, ())
+                                      if bucket[2] in entry]
+
+        matches[key] = [
+            (position, build_custom_entry(session['text'], course, session['rank'], session['header_slot'],
+                                          session['listed_room'], session['type']), session['day'])
+            for position, session in candidates[bucket]
+            if matcher(session['text'], session['batch'], session['cleaned'])
+        ]
+    return matches
+
+
+def custom_timetables_entries(index, selections, sessions=None):
+    """{key: {day: [entry tuples]}} for many selections ({key: selected courses}) at once.
+
+    Selections are inverted into distinct courses, which are matched against the index once;
+    each timetable is then assembled from its courses' matches, in the same order (and with
+    the same de-duplication) as custom_timetable_entries.
+    """
+    offerings = {}
+    selection_ids = {}
+    for key, selected_courses in selections.items():
+        ids = []
+        for selected_course in selected_courses:
+            offering = course_id(selected_course)
+            offerings.setdefault(offering, selected_course)
+            ids.append(offering)
+        selection_ids[key] = ids
+
+    matches = offering_matches(index, offerings, sessions)
+    # Days in the order they first appear (weekday order, also across merged spreadsheets)
+    day_order = {day: n for n, day in enumerate(dict.fromkeys(
+        session['day'] for session in (index['sessions'] if sessions is None else sessions)))}
+
+    timetables = {}
+    for key, ids in selection_ids.items():
+        # Then session order and selection order, like a scan of the sessions would give
+        merged = sorted((day_order[day], position, n, entry, day) for n, offering in enumerate(ids)
+                        for position, entry, day in matches[offering])
+        timetable = {}
+        for _, _, _, entry, day in merged:
+            add_custom_entry(timetable, day, entry)
+        timetables[key] = timetable
+    return timetables
+
+
+def custom_timetable_entries(index, selected_courses, sessions=None):
+    """{day: [entry tuples]} for selected courses (the input of format_custom_timetable)"""
+    return custom_timetables_entries(index, {None: selected_courses}, sessions)[None]
+
+
+def get_index_custom_timetables(index, selections):
+    """Formatted custom timetables for many selections ({key: selected courses}) at once"""
+    timetables = custom_timetables_entries(index, {key: courses for key, courses in selections.items() if courses})
+    return {key: format_custom_timetable(timetables[key]) if key in timetables
+            else "⚠️ No courses selected. Please select courses first." for key in selections}
+
+
+def get_index_custom_timetable(index, selected_courses):
+    """Custom timetable from the index; same output as extract_timetable.get_custom_timetable"""
+    if not selected_courses:
+        return "⚠️ No courses selected. Please select courses first."
+    return format_custom_timetable(custom_timetable_entries(index, selected_courses))
+
+
+def sessions_by_day(index):
+    """{day: sessions} in the order days first appear in the index"""
+    days = {}
+    for session in index['sessions']:
+        days.setdefault(session['day'], []).append(session)
+    return days
+
+
+def iter_index_timetable(index, user_batch, user_section):
+    """Batch + section timetable one day at a time, each day's table yielded as soon as it is built.
+
+    Joined with newlines the chunks are exactly get_index_timetable's output.
+    """
+    if not find_batch_color(index, user_batch)[1]:
+        yield f"⚠️ Batch '{user_batch}' not found!"
+        return
+
+    found = False
+    for sessions in sessions_by_day(index).values():
+        for day, entries in batch_timetable_entries(index, user_batch, user_section, sessions).items():
+            found = True
+            yield format_timetable_day(day, entries)
+    if not found:
+        yield "⚠️ No classes found for selected criteria"
+
+
+def iter_index_custom_timetable(index, selected_courses):
+    """Custom timetable one day at a time; joined with newlines, get_index_custom_timetable's output"""
+    if not selected_courses:
+        yield "⚠️ No courses selected. Please select courses first."
+        return
+
+    found = False
+    for sessions in sessions_by_day(index).values():
+        # Entries are de-duplicated within a day, so days can be matched independently
+        for day, entries in custom_timetable_entries(index, selected_courses, sessions).items():
+            found = True
+            yield format_custom_timetable_day(day, entries)
+    if not found:
+        yield "⚠️ No classes found for selected courses"
+
+
+def timetable_rows(timetable):
+    """Rows of a {day: [entry tuples]} timetable in display order, as dicts.
+
+    Keys are day, time, room, type and course, plus section and batch for custom timetables.
+    """
+    rows = []
+    for day, entries in timetable.items():
+        # Same order as the Markdown tables: column rank, then start time
+        for entry in sorted(entries, key=lambda x: (x[0], x[1])):
+            row = {'day': day, 'time': entry[2], 'room': entry[3], 'type': entry[4], 'course': entry[5]}
+            if len(entry) > 6:
+                row.update({'section': entry[6], 'batch': entry[7]})
+            rows.append(row)
+    return rows
+
+
+def catalogue_sections(index):
+    """{batch: sorted sections} from the course catalogue"""
+    sections = {batch: set() for batch in index['batches']}
+    for course in index['courses']:
+        if course['section'] and course['batch'] in sections:
+            sections[course['batch']].add(course['section'])
+    return {batch: sorted(found) for batch, found in sections.items()}
+
+
+def iter_section_sessions(index, sections):
+    """(batch, section, session) for each of ``sections`` ({batch: sections}) a session belongs to.
+
+    Sessions are selected as the batch timetable selects them (painted in the batch colour,
+    with the section's tokens in the text), in one scan per session for all sections.
+    """
+    targets = {}  # (source, colour) -> (batch, section matcher)
+    for batch, batch_section_list in sections.items():
+        target = find_batch_color(index, batch)
+        if target[1] and batch_section_list:
+            targets[target] = (batch, compile_section_matcher(batch_section_list))
+
+    for session in index['sessions']:
+        target = targets.get((session['source'], session['color']))
+        if target is not None:
+            batch, match = target
+            for section in match(session['text']):
+                yield batch, section, session
+
+
+def build_section_catalogue(index):
+    """{batch: {section: sessions}} for every section the course catalogue lists, built at compile time.
+
+    Sessions are counted as the batch timetable selects them, so a section with 0 sessions
+    shows as empty.
+    """
+    sections = catalogue_sections(index)
+    counts = {batch: dict.fromkeys(batch_section_list, 0) for batch, batch_section_list in sections.items()}
+    for batch, section, _ in iter_section_sessions(index, sections):
+        counts[batch][section] += 1
+    return counts
+
+
+def batch_sections(index):
+    """{batch: sorted sections} from the section catalogue"""
+    if 'sections' not in index:
+        return catalogue_sections(index)
+    return {batch: list(sections) for batch, sections in index['sections'].items()}
+
+
+def is_known_section(index, batch, section):
+    """True if the section is in the batch's section catalogue"""
+    if 'sections' not in index:
+        return section in catalogue_sections(index).get(batch, ())
+    return section in index['sections'].get(batch, {})
@@ -0,0 +1,184 @@
+"""Timetable integrity checks: double-booked rooms, section clashes and batch colours.
+
+Sessions are grouped by (day, room) and by (day, batch, section), sorted by start time
+and swept once, so a check is O(n log n) plus the number of conflicts found. Every
+conflict names the cells involved (e.g. 'Monday!C12') so they can be fixed in the sheet.
+
+    python timetable_integrity.py --snapshot draft.json
+    python timetable_integrity.py --spreadsheet-id <id> --credentials service-account.json
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+
+from extract_timetable import GROUP_PATTERN
+from snapshot_io import load_snapshot
+from timetable_index import compile_index
+
+# Sessions without an end time (e.g. a single embedded time) are treated as this long
+DEFAULT_DURATION = 80
+# Cells listed per colour problem
+COLOR_PROBLEM_CELLS = 5
+
+
+def a1_column(col):
+    """0-based column index to sheet letters (0 -> A, 26 -> AA)"""
+    letters = ""
+    col += 1
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cell_reference(session):
+    """Sheet and A1 cell of a session, e.g. 'Monday!C12'"""
+    return f"{session['day']}!{a1_column(session['col'])}{session['row']}"
+
+
+def session_interval(session):
+    """(start, end) minutes, or None when the session has no usable time"""
+    start = session.get('start')
+    if start is None:
+        return None
+    end = session.get('end')
+    return start, end if end is not None and end > start else start + DEFAULT_DURATION
+
+
+def overlapping_pairs(sessions):
+    """Pairs of sessions whose intervals overlap, by a sort-and-sweep over start times"""
+    timed = sorted(((interval, n, session) for n, session in enumerate(sessions)
+                    if (interval := session_interval(session)) is not None), key=lambda item: item[0])
+    pairs = []
+    active = []  # heap of (end, n, session) still running at the current start
+    for (start, end), n, session in timed:
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for _, _, other in active:
+            pairs.append((other, session))
+        heapq.heappush(active, (end, n, session))
+    return pairs
+
+
+def group_sessions(sessions, key):
+    groups = {}
+    for session in sessions:
+        group = key(session)
+        if group is not None:
+            groups.setdefault(group, []).append(session)
+    return groups
+
+
+def describe(session):
+    return {'cell': cell_reference(session), 'text': session['text'].strip(), 'room': session['room'],
+            'time': session['time_slot']}
+
+
+def room_conflicts(sessions):
+    """The same room booked for two overlapping sessions"""
+    conflicts = []
+    groups = group_sessions(sessions, lambda s: (s['source'], s['day'], s['room'])
+                            if s['room'] and s['room'] != "Unknown" else None)
+    for (source, day, room), group in groups.items():
+        for first, second in overlapping_pairs(group):
+            conflicts.append({
+                'kind': "room", 'source': source, 'day': day, 'room': room,
+                'message': f"Room {room} is double-booked on {day}",
+                'sessions': [describe(first), describe(second)],
+            })
+    return conflicts
+
+
+def base_course(session):
+    """Course name without its lab group: 'Gen AI (CS,G-1)' -> 'Gen AI'"""
+    return GROUP_PATTERN.sub("", session['course']).strip()
+
+
+def section_clashes(sessions):
+    """One batch section booked into two different overlapping courses.
+
+    The same course running in two rooms at once is usually a section split into groups,
+    so only overlaps between different courses are reported.
+    """
+    conflicts = []
+    groups = group_sessions(sessions, lambda s: (s['source'], s['day'], s['batch'], s['section'])
+                            if s['batch'] and s['section'] else None)
+    for (source, day, batch, section), group in groups.items():
+        for first, second in overlapping_pairs(group):
+            # Groups of one course (G-1 and G-2 in two labs) split the section, they do not clash
+            if base_course(first) == base_course(second):
+                continue
+            conflicts.append({
+                'kind': "section", 'source': source, 'day': day, 'batch': batch, 'section': section,
+                'message': f"{batch} section {section} has two classes at once on {day}",
+                'sessions': [describe(first), describe(second)],
+            })
+    return conflicts
+
+
+def color_problems(index):
+    """Batches sharing a header colour and cell colours close to several batches (see batch_palette)"""
+    problems = index.get('color_problems', [])
+    if not problems:
+        return []
+    cells = {}
+    for session in index['sessions']:
+        found = cells.setdefault((session['source'], session['color']), [])
+        if len(found) < COLOR_PROBLEM_CELLS:
+            found.append(session)
+    return [dict(problem, sessions=[describe(session)
+                                    for session in cells.get((problem['source'], problem['color']), [])])
+            for problem in problems]
+
+
+def check_index(index):
+    """All integrity problems in a compiled index, room conflicts first"""
+    return room_conflicts(index['sessions']) + section_clashes(index['sessions']) + color_problems(index)
+
+
+def format_conflicts(conflicts):
+    """Plain text report, one conflict per paragraph"""
+    if not conflicts:
+        return "✅ No double-booked rooms or section clashes found."
+    lines = [f"⚠️ {len(conflicts)} problem(s) found:"]
+    for conflict in conflicts:
+        lines.append("")
+        lines.append(f"- {conflict['message']}")
+        for session in conflict['sessions']:
+            lines.append(f"    {session['cell']:<14} {session['time']:<12} {session['room'] or 'Unknown':<10} "
+                         f"{session['text']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a timetable for double-booked rooms and section clashes")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--snapshot", help="saved spreadsheets.get response (.json or .json.gz)")
+    source.add_argument("--spreadsheet-id", help="fetch this (draft) spreadsheet from the Sheets API")
+    parser.add_argument("--credentials", help="service account JSON file for --spreadsheet-id")
+    parser.add_argument("--json", action="store_true", help="print the conflicts as JSON")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        spreadsheet = load_snapshot(args.snapshot)
+    else:
+        from sheets_client import fetch_spreadsheet, fetch_status, service_account_credentials
+
+        creds = service_account_credentials(path=args.credentials) if args.credentials else None
+        spreadsheet = fetch_spreadsheet(args.spreadsheet_id, credentials=creds)
+        # A failed fetch serves the last good copy; checking an old draft must not pass
+        status = fetch_status[args.spreadsheet_id]
+        if status['stale']:
+            raise SystemExit(f"⚠️ Could not fetch the spreadsheet ({status['error']}); "
+                             f"only a copy from {time.strftime('%Y-%m-%d %H:%M', time.localtime(status['fetched_at']))} "
+                             f"is available, so it was not checked.")
+
+    conflicts = check_index(compile_index(spreadsheet))
+    print(json.dumps(conflicts, indent=2) if args.json else format_conflicts(conflicts))
+    sys.exit(1 if conflicts else 0)
+
+
+if __name__ == "__main__":
+    main()
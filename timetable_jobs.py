@@ -0,0 +1,104 @@
+"""Shared background pool for building timetables.
+
+Every Streamlit session submits its timetable requests to one bounded thread pool, so a
+slow request no longer holds up the script run that asked for it. Identical requests in
+flight at the same time are merged into one job, and the job's Markdown chunks (one per
+day) are appended as they are built so the UI can show partial results while polling.
+
+Settings (environment):
+TIMETABLE_WORKERS - worker threads (default 4)
+TIMETABLE_MAX_PENDING - jobs queued or running before new ones are refused (default 64)
+TIMETABLE_REQUEST_TIMEOUT - seconds a request waits before it is given up (default 30)
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = int(os.environ.get("TIMETABLE_WORKERS", "4"))
+MAX_PENDING = int(os.environ.get("TIMETABLE_MAX_PENDING", "64"))
+REQUEST_TIMEOUT = float(os.environ.get("TIMETABLE_REQUEST_TIMEOUT", "30"))
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="timetable-job")
+_jobs = {}  # key -> job still queued or running
+_jobs_lock = threading.Lock()
+
+
+class JobQueueFull(Exception):
+    """Raised when MAX_PENDING jobs are already queued or running"""
+
+
+def _run_job(job, make_chunks):
+    try:
+        for chunk in make_chunks():
+            # Abandoned jobs stop between days and give their worker back
+            if job['cancelled']:
+                return
+            job['chunks'].append(chunk)
+    except Exception as e:
+        job['error'] = str(e)
+    finally:
+        job['done'] = True
+        with _jobs_lock:
+            if _jobs.get(job['key']) is job:
+                del _jobs[job['key']]
+
+
+def submit_job(key, make_chunks):
+    """Job building make_chunks() in the background; an identical job in flight is shared.
+
+    A job is a dict with 'chunks' (appended as they are built), 'done', 'error', 'cancelled'
+    and 'holders', the number of requests waiting for it.
+    """
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is not None:
+            job['holders'] += 1
+            return job
+        if len(_jobs) >= MAX_PENDING:
+            raise JobQueueFull(f"{len(_jobs)} timetable jobs are already pending")
+        job = {'key': key, 'chunks': [], 'done': False, 'error': None, 'cancelled': False, 'holders': 1,
+               'submitted': time.monotonic()}
+        _jobs[key] = job
+        job['future'] = _pool.submit(_run_job, job, make_chunks)
+    return job
+
+
+def new_request(job, **details):
+    """A session's view of a job: its own start time (for the timeout) plus display details"""
+    return dict(details, job=job, started=time.monotonic())
+
+
+def request_timed_out(request, timeout=None):
+    """True when a request's job has not finished within the timeout"""
+    timeout = REQUEST_TIMEOUT if timeout is None else timeout
+    return not request['job']['done'] and time.monotonic() - request['started'] > timeout
+
+
+def abandon_request(request):
+    """Give up on a request; its job is cancelled once every request holding it gave up.
+
+    Timeouts are per request, so a session that joined a shared job late keeps it running.
+    A cancelled job that is queued never starts and a running one stops after the day it
+    is building. It leaves the dedup map at once, so the next identical request starts afresh.
+    """
+    job = request['job']
+    with _jobs_lock:
+        if request.get('abandoned') or job['done']:
+            return
+        request['abandoned'] = True
+        job['holders'] -= 1
+        if job['holders'] > 0:
+            return
+        job['cancelled'] = True
+        job['future'].cancel()
+        job['error'] = "timed out"
+        job['done'] = True
+        if _jobs.get(job['key']) is job:
+            del _jobs[job['key']]
+
+
+def pending_jobs():
+    """Number of jobs queued or running"""
+    with _jobs_lock:
+        return len(_jobs)
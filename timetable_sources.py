@@ -0,0 +1,393 @@
+"""Timetable spreadsheets served by this deployment and their per-source cache.
+
+Each configured source (a school or campus spreadsheet) is fetched and compiled on its
+own and cached for ``ttl`` seconds. Stale sources are refreshed concurrently, so adding a
+source adds fetch time in parallel rather than in series, and the per-source indexes are
+merged into one queryable index. Refreshes recompile incrementally against the cached
+index, so an unchanged sheet costs little more than hashing its rows.
+
+Every compiled source is also written as a memory-mappable Arrow file, with a small
+state file next to it (a generation counter bumped for every new file, and when the
+sheet was last checked). Worker processes on a host share that copy: only the process
+holding the source's leader lock fetches and compiles, and the others attach the Arrow
+file when its generation changes, so API calls do not grow with the number of workers.
+A new worker starts from the file instead of fetching and parsing the spreadsheet.
+
+With a ``probe`` (a cheap function returning a marker that changes on every edit), a
+stale source is only downloaded when its marker changed, and the time between probes
+adapts: MIN_POLL after an edit and around the start of term, doubling on every
+unchanged probe up to MAX_POLL.
+
+Settings (environment):
+TIMETABLE_MIN_POLL - seconds between probes after an edit or near term start (default 60)
+TIMETABLE_MAX_POLL - longest time between probes of a stable sheet (default 1800)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from sheet_grid import as_grid
+from sheets_client import CACHE_DIR, file_lock, try_file_lock
+from timetable_calendar import TERM_START
+from timetable_index import compile_index, merge_indexes, source_label
+from timetable_integrity import check_index
+import timetable_history
+
+try:
+    import timetable_columnar
+except ImportError:  # pyarrow not installed: workers start by fetching
+    timetable_columnar = None
+
+logger = logging.getLogger(__name__)
+
+MIN_POLL = float(os.environ.get("TIMETABLE_MIN_POLL", "60"))
+MAX_POLL = float(os.environ.get("TIMETABLE_MAX_POLL", "1800"))
+# Days either side of TIMETABLE_TERM_START when timetables change most
+TERM_START_WINDOW = 14
+
+# (url, name) -> {'index': ..., 'loaded_at': monotonic seconds, 'version': probe marker, 'interval': seconds}
+_source_cache = {}
+_source_locks = {}
+_locks_guard = threading.Lock()
+
+# Last merged index and the per-source indexes it was built from
+_merged = {'parts': None, 'index': None}
+_merge_lock = threading.Lock()
+
+# Recently served indexes by revision, so changes since a user's last visit can be diffed.
+# Consecutive revisions share the sessions of unchanged rows, so keeping them is cheap.
+REVISION_HISTORY = 48
+_revisions = OrderedDict()
+_served = {'revision': None}
+_revisions_lock = threading.Lock()
+
+# Arrow copies of compiled sources used for cold starts
+COLUMNAR_DIR = os.path.join(CACHE_DIR, "sessions")
+
+
+def normalize_sources(configured, default_url):
+    """Turn configured sources into [{'name', 'url'}]; falls back to the single default sheet.
+
+    Entries may be URLs or {'name': ..., 'url': ...} mappings. With several sources every
+    one needs a distinct name, which becomes the namespace for its batches.
+    """
+    if not configured:
+        return [{'name': "", 'url': default_url}]
+
+    sources = []
+    for entry in configured:
+        if isinstance(entry, str):
+            entry = {'url': entry}
+        sources.append({'name': source_label(entry.get('name', "")), 'url': entry['url']})
+
+    if len(sources) == 1:
+        # A single spreadsheet keeps plain batch names
+        sources[0]['name'] = ""
+        return sources
+
+    names = [source['name'] for source in sources]
+    if not all(names):
+        raise ValueError("Every timetable source needs a name when more than one is configured")
+    if len(set(names)) != len(names):
+        raise ValueError(f"Timetable source names must be unique: {names}")
+    return sources
+
+
+def _source_lock(key):
+    with _locks_guard:
+        return _source_locks.setdefault(key, threading.Lock())
+
+
+def _is_fresh(entry, ttl):
+    return entry is not None and time.monotonic() - entry['loaded_at'] < entry.get('interval', ttl)
+
+
+def near_term_start(today=None):
+    """True within TERM_START_WINDOW days of TIMETABLE_TERM_START (False when it is not set)"""
+    if not TERM_START:
+        return False
+    try:
+        term_start = date.fromisoformat(TERM_START)
+    except ValueError:
+        return False
+    return abs(((today or date.today()) - term_start).days) <= TERM_START_WINDOW
+
+
+def poll_interval(entry, changed, ttl):
+    """Seconds until a probed source is checked again"""
+    if changed or near_term_start():
+        return min(ttl, MIN_POLL)
+    previous = entry.get('interval', ttl) if entry else ttl
+    return min(MAX_POLL, max(previous * 2, MIN_POLL))
+
+
+def columnar_path(source):
+    return os.path.join(COLUMNAR_DIR, f"{timetable_history.source_key(source)}.arrow")
+
+
+def state_path(source):
+    return os.path.join(COLUMNAR_DIR, f"{timetable_history.source_key(source)}.state.json")
+
+
+def leader_lock_path(source):
+    return os.path.join(COLUMNAR_DIR, f"{timetable_history.source_key(source)}.leader")
+
+
+def read_shared_state(source):
+    """What the last leader published for a source, or None.
+
+    {'generation': bumped with every new Arrow file, 'revision', 'version': probe marker,
+     'checked_at': wall time the sheet was last checked, 'interval': seconds until the next check}
+    """
+    try:
+        with open(state_path(source), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish_state(source, state):
+    """Write a source's shared state atomically, so readers never see a partial file"""
+    path = state_path(source)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not publish timetable state: %s", e)
+
+
+def _entry_from_state(index, state):
+    """Cache entry for a published index, aged by when the leader last checked the sheet"""
+    entry = {'index': index, 'loaded_at': time.monotonic() - max(0.0, time.time() - state['checked_at']),
+             'version': state.get('version'), 'generation': state['generation']}
+    if state.get('interval') is not None:
+        entry['interval'] = state['interval']
+    return entry
+
+
+def load_columnar_entry(source, state=None):
+    """Cache entry from the source's Arrow file, or None.
+
+    Aged by the leader's last check when the file matches the published state, else by
+    the file's mtime.
+    """
+    if timetable_columnar is None:
+        return None
+    path = columnar_path(source)
+    try:
+        age = time.time() - os.path.getmtime(path)
+        index = timetable_columnar.read_index(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Ignoring unreadable session file %s: %s", path, e)
+        return None
+    index['conflicts'] = check_index(index)
+    if state is not None and state.get('revision') == index['revision']:
+        return _entry_from_state(index, state)
+    return {'index': index, 'loaded_at': time.monotonic() - max(0.0, age)}
+
+
+def save_columnar(source, index):
+    if timetable_columnar is None:
+        return
+    try:
+        timetable_columnar.write_index(index, columnar_path(source))
+    except (OSError, ValueError) as e:
+        logger.warning("Could not write session file: %s", e)
+
+
+def sync_with_leader(source, entry):
+    """A source's cache entry updated with whatever another process published since"""
+    if timetable_columnar is None:
+        return entry
+    state = read_shared_state(source)
+    if state is None:
+        # Cold start from a file written before states were published
+        return entry if entry is not None else load_columnar_entry(source)
+    if entry is None or entry.get('generation') != state['generation']:
+        # New snapshot: attach the leader's Arrow file instead of fetching
+        return load_columnar_entry(source, state) or entry
+    # Same snapshot, but the leader may have checked the sheet since
+    checked = _entry_from_state(entry['index'], state)
+    return checked if checked['loaded_at'] > entry['loaded_at'] else entry
+
+
+def refresh_source(source, entry, fetch, ttl=300, probe=None):
+    """Probe, fetch and compile a source, publish the result for other processes; returns the new entry"""
+    label = source['name'] or source['url']
+    state = read_shared_state(source) or {}
+    generation = state.get('generation', 0)
+
+    version = None
+    if probe is not None:
+        try:
+            version = probe(source['url'])
+        except Exception as e:
+            logger.info("Probing timetable source '%s' failed: %s", label, e)
+        if entry is not None and version is not None and version == entry.get('version'):
+            entry = dict(entry, loaded_at=time.monotonic(), interval=poll_interval(entry, False, ttl),
+                         generation=generation)
+            publish_state(source, {'generation': generation, 'revision': entry['index']['revision'],
+                                   'version': version, 'checked_at': time.time(), 'interval': entry['interval']})
+            return entry
+
+    try:
+        # Only texts and colours are kept; the full API response is dropped here
+        spreadsheet = as_grid(fetch(source['url']))
+    except Exception as e:
+        if entry is None:
+            raise
+        logger.warning("Refreshing timetable source '%s' failed (%s); keeping cached copy", label, e)
+        return dict(entry, loaded_at=time.monotonic())
+
+    # Only rows that changed since the cached index get reparsed
+    previous = entry['index'] if entry else None
+    index = compile_index(spreadsheet, source['name'], previous)
+    if index is previous:
+        logger.info("Timetable source '%s' unchanged (revision %s)", label, index['revision'])
+    else:
+        # Double-booked rooms and section clashes are checked on every new snapshot
+        index['conflicts'] = check_index(index)
+        if index['conflicts']:
+            logger.warning("Timetable source '%s' has %d integrity problem(s)", label, len(index['conflicts']))
+        save_columnar(source, index)
+        generation += 1
+        if timetable_history.HISTORY_ENABLED:
+            try:
+                timetable_history.record_source_snapshot(source, spreadsheet, index['revision'])
+            except OSError as e:
+                logger.warning("Could not record timetable history: %s", e)
+
+    # The probe marker was taken before the download, so an edit made meanwhile is picked up next time
+    new_entry = {'index': index, 'loaded_at': time.monotonic(), 'version': version, 'generation': generation}
+    if probe is not None and version is not None:
+        new_entry['interval'] = poll_interval(entry, index is not previous, ttl)
+    if timetable_columnar is not None:
+        publish_state(source, {'generation': generation, 'revision': index['revision'], 'version': version,
+                               'checked_at': time.time(), 'interval': new_entry.get('interval')})
+    return new_entry
+
+
+def get_source_index(source, fetch, ttl=300, probe=None):
+    """Compiled index for one source, refreshed at most once per ttl.
+
+    Concurrent callers for the same stale source wait for a single refresh instead of
+    all fetching, and across processes only the one holding the source's leader lock
+    refreshes it; the others keep serving their copy and attach the leader's Arrow file
+    once its generation changes. If a refresh fails the previous index keeps being
+    served. With a probe, the spreadsheet is only downloaded when its marker changed,
+    and the time between refreshes adapts (see poll_interval).
+    """
+    key = (source['url'], source['name'])
+    entry = _source_cache.get(key)
+    if _is_fresh(entry, ttl):
+        return entry['index']
+
+    with _source_lock(key):
+        entry = _source_cache.get(key)
+        if _is_fresh(entry, ttl):
+            return entry['index']
+
+        entry = sync_with_leader(source, entry)
+        if entry is not None:
+            _source_cache[key] = entry
+            if _is_fresh(entry, ttl):
+                return entry['index']
+
+        if timetable_columnar is None:
+            # Nothing to share between processes, so each one refreshes for itself
+            entry = _source_cache[key] = refresh_source(source, entry, fetch, ttl, probe)
+            return entry['index']
+
+        with try_file_lock(leader_lock_path(source)) as leader:
+            if leader:
+                # The previous leader may have published just before we took over
+                entry = sync_with_leader(source, entry)
+                if not _is_fresh(entry, ttl):
+                    entry = refresh_source(source, entry, fetch, ttl, probe)
+                _source_cache[key] = entry
+                return entry['index']
+
+        if entry is not None:
+            # Another process is refreshing; serve this copy until it publishes
+            return entry['index']
+
+        # Nothing to serve yet: wait for the leader, and refresh ourselves if it failed
+        with file_lock(leader_lock_path(source)):
+            entry = sync_with_leader(source, None)
+            if not _is_fresh(entry, ttl):
+                entry = refresh_source(source, entry, fetch, ttl, probe)
+            _source_cache[key] = entry
+            return entry['index']
+
+
+def remember_index(index, sources):
+    """Keep an index reachable by its revision (bounded, oldest dropped first) and in the history"""
+    with _revisions_lock:
+        # Called on every load, so only do work when the served revision changes
+        if index['revision'] == _served['revision']:
+            return
+        _served['revision'] = index['revision']
+        _revisions[index['revision']] = index
+        _revisions.move_to_end(index['revision'])
+        while len(_revisions) > REVISION_HISTORY:
+            _revisions.popitem(last=False)
+
+    if timetable_history.HISTORY_ENABLED:
+        try:
+            timetable_history.record_served_index(index, sources)
+        except OSError as e:
+            logger.warning("Could not record timetable history: %s", e)
+
+
+def get_index_at(revision):
+    """A previously served index by revision (recent ones from memory, older ones from history)"""
+    with _revisions_lock:
+        index = _revisions.get(revision)
+    if index is not None:
+        return index
+    return timetable_history.load_index_at(revision)
+
+
+def load_index(sources, fetch, ttl=300, probe=None):
+    """Merged index over all sources; stale sources are probed and fetched concurrently"""
+    if len(sources) == 1:
+        index = get_source_index(sources[0], fetch, ttl, probe)
+        remember_index(index, sources)
+        return index
+
+    stale = [s for s in sources if not _is_fresh(_source_cache.get((s['url'], s['name'])), ttl)]
+    if stale:
+        with ThreadPoolExecutor(max_workers=len(stale), thread_name_prefix="timetable-fetch") as pool:
+            list(pool.map(lambda s: get_source_index(s, fetch, ttl, probe), stale))
+
+    parts = [get_source_index(s, fetch, ttl, probe) for s in sources]
+    with _merge_lock:
+        # Only re-merge when at least one source was recompiled
+        cached_parts = _merged['parts']
+        if cached_parts is not None and len(cached_parts) == len(parts) and \
+                all(a is b for a, b in zip(cached_parts, parts)):
+            return _merged['index']
+        index = merge_indexes(parts)
+        _merged.update({'parts': parts, 'index': index})
+    remember_index(index, sources)
+    return index
+
+
+def clear_cache():
+    """Forget every cached source (forces a refetch on the next load)"""
+    _source_cache.clear()
+    with _revisions_lock:
+        _revisions.clear()
+        _served['revision'] = None
+    with _merge_lock:
+        _merged.update({'parts': None, 'index': None})
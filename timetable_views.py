@@ -0,0 +1,83 @@
+"""Course-centric and room-centric weekly timetables, materialised once per snapshot.
+
+Besides batch + section and custom selections, instructors ask where a course meets
+across all of its sections and lab staff what happens in a room all week. build_views
+groups every class of the session index by course name and by room in one pass and
+renders each view to Markdown right away, so showing a view is a dictionary lookup.
+
+    python timetable_views.py --snapshot saved.json --room C-107
+    python timetable_views.py --snapshot saved.json --course "Data Structures"
+"""
+import argparse
+import sys
+
+from extract_timetable import format_custom_timetable, parse_time_slot
+from timetable_index import qualify
+
+
+def view_entry(session):
+    """Custom timetable entry tuple of a session, with its own section and batch"""
+    time_slot = session['time_slot']
+    return (session['rank'], parse_time_slot(time_slot), time_slot, session['room'] or "Unknown", session['type'],
+            session['cleaned'].strip(), session['section'], session['batch'])
+
+
+def course_view_name(session):
+    """Course a class is listed under ('Data Structures', namespaced by source like batches)"""
+    return qualify(session['course'], session['source']) if session['course'] else None
+
+
+def room_view_name(session):
+    room = session['room']
+    return qualify(room, session['source']) if room and room != "Unknown" else None
+
+
+def build_views(index):
+    """{'revision', 'courses': {name: view}, 'rooms': {name: view}} with names sorted.
+
+    A view is {'timetable': {day: [entry tuples]}, 'markdown': rendered tables, 'sessions': count}.
+    Only classes (sessions painted in a batch colour) are listed, so room labels and notes
+    in the sheet do not show up as bookings.
+    """
+    courses = {}
+    rooms = {}
+    for session in index['sessions']:
+        if not session['batch']:
+            continue
+        entry = view_entry(session)
+        course = course_view_name(session)
+        if course:
+            courses.setdefault(course, {}).setdefault(session['day'], []).append(entry)
+        room = room_view_name(session)
+        if room:
+            rooms.setdefault(room, {}).setdefault(session['day'], []).append(entry)
+
+    def render(timetables):
+        return {name: {'timetable': timetable, 'markdown': format_custom_timetable(timetable),
+                       'sessions': sum(len(entries) for entries in timetable.values())}
+                for name, timetable in sorted(timetables.items())}
+
+    return {'revision': index['revision'], 'courses': render(courses), 'rooms': render(rooms)}
+
+
+def main():
+    from export_timetables import add_source_arguments, load_spreadsheet
+    from timetable_index import compile_index
+
+    parser = argparse.ArgumentParser(description="Print the weekly timetable of a course or a room")
+    add_source_arguments(parser)
+    view = parser.add_mutually_exclusive_group(required=True)
+    view.add_argument("--course", help="course name, e.g. 'Data Structures'")
+    view.add_argument("--room", help="room, e.g. 'C-107'")
+    args = parser.parse_args()
+
+    views = build_views(compile_index(load_spreadsheet(args.snapshot, args.spreadsheet_id, args.credentials)))
+    kind, name = ('courses', args.course) if args.course else ('rooms', args.room)
+    if name not in views[kind]:
+        print(f"⚠️ '{name}' not found. Known {kind}: {', '.join(views[kind])}", file=sys.stderr)
+        sys.exit(1)
+    print(views[kind][name]['markdown'])
+
+
+if __name__ == "__main__":
+    main()
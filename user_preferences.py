@@ -10,10 +10,14 @@ def format_course_display(course: dict) -> str:
     dept = course.get('department', '').strip()
     section = course.get('section', '').strip()
     batch = str(course.get('batch', '')).strip()
+    # Campus/school name, only set when several spreadsheets are served
+    source = course.get('source', '').strip()
     # Prefer year (e.g., 2024) when available inside the batch string
     m = re.search(r"(20\d{2})", batch)
     year = m.group(1) if m else batch
     parts = [p for p in [name, dept, section, year] if p]
+    if source:
+        parts.append(f"[{source}]")
     return " ".join(parts)
 
 def initialize_session_state():
@@ -30,9 +34,22 @@ def initialize_session_state():
     if 'selected_batch' not in st.session_state:
         st.session_state.selected_batch = ""
     
+    # Timetable revision the user saw on their previous visit (carried in the ?seen= URL parameter)
+    if 'last_visit_revision' not in st.session_state:
+        st.session_state.last_visit_revision = st.query_params.get("seen", "")
+    
     # Clear old search results to avoid display issues with old format
     st.session_state.last_search_results = []
 
+def get_last_visit_revision() -> str:
+    """Get the timetable revision from the user's previous visit ('' on a first visit)"""
+    return st.session_state.get('last_visit_revision', "")
+
+def mark_revision_seen(revision: str):
+    """Remember the revision being shown so the next visit can list what changed since"""
+    if st.query_params.get("seen") != revision:
+        st.query_params["seen"] = revision
+
 def add_course_to_selection(course: Dict):
     """Add a course to the user's selection"""
     # Check if course is already selected